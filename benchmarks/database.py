@@ -0,0 +1,55 @@
+'''
+Measures the database cost of one authorize + access token cycle, as
+done by the default handlers: ``find_client()`` and
+``save_new_authorization_code()`` on ``/authorize``, then
+``redeem_authorization_code()`` on ``/access-token``.
+
+Usage:
+
+    $ PYTHONPATH=. python benchmarks/database.py [cycles]
+
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import uuid
+
+from oauth2u.server.database import MemoryDataBase, SQLiteDataBase
+
+
+def run_cycles(database, cycles):
+    codes = [uuid.uuid4().hex for i in range(cycles)]
+
+    def cycle():
+        for code in codes:
+            database.find_client('client-id')
+            database.save_new_authorization_code(code, 'client-id', None, 'http://example.com')
+            database.redeem_authorization_code('client-id', code, 'http://example.com',
+                                               authenticating_code=code)
+    return timeit.timeit(cycle, number=1)
+
+
+def report(name, database, cycles):
+    database.save_new_client('client-id', 'http://example.com')
+    seconds = run_cycles(database, cycles)
+    print('{0:<10} {1:>10.2f} us/cycle'.format(name, seconds / cycles * 1e6))
+
+
+def main(cycles):
+    report('memory', MemoryDataBase(), cycles)
+
+    directory = tempfile.mkdtemp()
+    try:
+        database = SQLiteDataBase(os.path.join(directory, 'benchmark.db'))
+        report('sqlite', database, cycles)
+        database.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
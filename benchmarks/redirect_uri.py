@@ -0,0 +1,46 @@
+'''
+Compares building redirect URLs by parsing the redirect URI on each call
+(how ``add_query_to_url`` used to work) against the parsed templates it
+keeps now.
+
+Usage:
+
+    $ PYTHONPATH=. python benchmarks/redirect_uri.py [urls]
+
+'''
+from __future__ import print_function
+
+import sys
+import timeit
+import urllib
+import urlparse
+
+from oauth2u.server.handlers import add_query_to_url
+
+REDIRECT_URI = 'https://client.example.com/oauth/callback?source=oauth2u&lang=en'
+PARAMS = {'code': 'authorization-code-0123456789abcdef', 'state': 'xyz'}
+
+
+def add_query_to_url_parsing_each_time(url, params):
+    parts = urlparse.urlparse(url)
+    query = dict(urlparse.parse_qsl(parts.query))
+    query.update(params)
+
+    return urlparse.urlunparse((parts.scheme, parts.netloc,
+                                parts.path, parts.params,
+                                urllib.urlencode(query),
+                                parts.fragment))
+
+
+def report(name, build, count):
+    seconds = timeit.timeit(lambda: build(REDIRECT_URI, PARAMS), number=count)
+    print('{0:<16} {1:>8.3f} us/url'.format(name, seconds / count * 1e6))
+
+
+def main(count):
+    report('parse each time', add_query_to_url_parsing_each_time, count)
+    report('template', add_query_to_url, count)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,30 @@
+'''
+Compares the cost of generating tokens with ``uuid.uuid4()`` (one
+``os.urandom()`` call per token) against ``oauth2u.tokens.TokenPool``.
+
+Usage:
+
+    $ PYTHONPATH=. python benchmarks/tokens.py [tokens]
+
+'''
+from __future__ import print_function
+
+import sys
+import timeit
+
+from oauth2u.tokens import TokenPool, generate_uuid_without_dashes
+
+
+def report(name, generate, count):
+    seconds = timeit.timeit(generate, number=count)
+    print('{0:<16} {1:>8.3f} us/token'.format(name, seconds / count * 1e6))
+
+
+def main(count):
+    report('uuid', generate_uuid_without_dashes, count)
+    report('pool hex', TokenPool(length=32).take, count)
+    report('pool base64', TokenPool(length=22, encoding='base64').take, count)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
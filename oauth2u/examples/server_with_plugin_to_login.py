@@ -25,8 +25,7 @@ def ask_user_credentials(handler):
 
     '''
     if handler.client_id == 'unauthorized-client':
-        handler.redirect_unauthorized_client(handler.client_id, handler.code)
-        return
+        return handler.redirect_unauthorized_client(handler.client_id, handler.code)
 
     # Stores the client_id in a session to be able to access from the
     # authorization-POST plugin. That is because in POST nothing is executed
@@ -70,9 +69,9 @@ def validate_user_credentials(handler):
         handler.write('<p>No authorization code created to this client_id</p>')
     elif credentials == ('admin', 'admin'):
         if allow:
-            handler.redirect_access_granted(client_id, code)
+            return handler.redirect_access_granted(client_id, code)
         else:
-            handler.redirect_access_denied(client_id, code)
+            return handler.redirect_access_denied(client_id, code)
     else:
         handler.write('<p>Invalid username and/or password</p>'
                       '<p><em>hint: try "admin" and "admin"</em></p>'
@@ -90,5 +89,6 @@ if __name__ == '__main__':
     db.save_new_client('authorized-client', None)
     db.save_new_client('client-with-redirect-uri', 'http://example.com/return')
 
-    s = Server(port=PORT, database=db)
+    # a fixed secret keeps the login cookies valid across restarts
+    s = Server(port=PORT, database=db, cookie_secret='change-this-secret')
     s.start()
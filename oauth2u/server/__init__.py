@@ -1,23 +1,78 @@
-import uuid
+import binascii
+import os
+import signal
+import time
 import urllib
 
+import tornado.httpserver
 import tornado.web
 import tornado.ioloop
 
-from oauth2u.server import handlers, log, plugins
-from oauth2u.server.database import MemoryDataBase
+from oauth2u.server import accesslog, bloom, cache, clients, handlers, log, plugins, process
+from oauth2u.server.database import MemoryDataBase, make_asynchronous
+from oauth2u.tokens import AccessTokenSigner
+import oauth2u.tokens
+
+SHUTDOWN_TIMEOUT = 5        # seconds
+CLIENT_CREDENTIALS_CACHE_SIZE = 1000
 
 class Server(object):
 
     def __init__(self, port=8000, plugins_directories=(), handlers_directories=(),
-                 log_config=None, database=None, application_settings=None):
+                 log_config=None, database=None, application_settings=None,
+                 authorization_code_lifetime=None, processes=1, reuse_port=False,
+                 shutdown_timeout=SHUTDOWN_TIMEOUT, debug=False, cookie_secret=None,
+                 access_token_secret=None, introspection_cache_size=cache.DEFAULT_MAX_SIZE,
+                 introspection_cache_ttl=cache.DEFAULT_TTL,
+                 revocation_filter_capacity=bloom.DEFAULT_CAPACITY,
+                 revocation_filter_error_rate=bloom.DEFAULT_ERROR_RATE,
+                 refresh_token_lifetime=None,
+                 client_credentials_cache_size=CLIENT_CREDENTIALS_CACHE_SIZE,
+                 client_credentials_cache_ttl=cache.DEFAULT_TTL,
+                 access_log=False, access_log_sample_rates=None,
+                 client_registry_reload_interval=clients.RELOAD_INTERVAL,
+                 open_introspection=False, open_metrics=False):
         self.port = port
+        self.debug = debug
+        self.cookie_secret = cookie_secret
+        self.processes = processes
+        self.reuse_port = reuse_port
+        self.shutdown_timeout = shutdown_timeout
+        self.sockets = None
         self.application = None
+        self.http_server = None
+        self.periodic_callbacks = []
+        self.introspection_cache_size = introspection_cache_size
+        self.introspection_cache_ttl = introspection_cache_ttl
+        self.revocation_filter_capacity = revocation_filter_capacity
+        self.revocation_filter_error_rate = revocation_filter_error_rate
+        self.revocation_filter = None
+        self.client_credentials_cache = None
+        self.client_registry = None
+        self.client_registry_reload_interval = client_registry_reload_interval
+        self.open_introspection = open_introspection
+        self.open_metrics = open_metrics
+        self.access_log = None
+        if access_log:
+            self.access_log = accesslog.AccessLog(access_log_sample_rates)
+        self.refresh_token_lifetime = refresh_token_lifetime
+        self.client_credentials_cache_size = client_credentials_cache_size
+        self.client_credentials_cache_ttl = client_credentials_cache_ttl
+        self.access_token_signer = None
+        if access_token_secret:
+            self.access_token_signer = AccessTokenSigner(access_token_secret)
         self.database = database or MemoryDataBase()
+        if authorization_code_lifetime is not None:
+            self.database.authorization_code_lifetime = authorization_code_lifetime
         self.load_plugins(plugins_directories)
         self.load_handlers(handlers_directories)
         self.custom_application_settings = application_settings or {}
         log.configure(**log_config or {})
+        if not self.cookie_secret and 'cookie_secret' not in self.custom_application_settings:
+            # generated once, before forking, so all processes share it
+            self.cookie_secret = binascii.hexlify(os.urandom(32))
+            log.warn('No cookie_secret given, using a random one. Secure cookies '
+                     'will be invalid after the server restarts')
 
     @property
     def urls(self):
@@ -30,22 +85,227 @@ class Server(object):
         handlers.load_from_directories(*directories)
 
     def start(self):
+        if self.processes > 1:
+            self.start_processes()
+        else:
+            self.start_process()
+
+    def start_process(self):
+        signal.signal(signal.SIGTERM, self.handle_sigterm)
         self.create_application()
         self.start_ioloop()
+        self.close_database()
+        self.close_log()
+
+    def start_processes(self):
+        '''
+        Forks ``processes`` workers sharing the listening sockets (or each
+        one binding its own, with ``reuse_port``), restarts the ones that die
+        and stops them all on SIGTERM
+        '''
+        if not getattr(self.database, 'multiprocess_safe', False):
+            raise UnsafeDataBase('{0} can\'t be shared by multiple processes, use a database '
+                                 'with multiprocess_safe = True'.format(type(self.database).__name__))
+        if not self.reuse_port:
+            self.sockets = process.bind_sockets(self.port)
+        log.info('Starting %s processes on port %s', self.processes, self.port)
+        process.Supervisor(self.processes, self.run_worker).start()
+
+    def run_worker(self, worker_id):
+        oauth2u.tokens.after_fork()
+        if self.reuse_port:
+            self.sockets = process.bind_sockets(self.port, reuse_port=True)
+        self.start_process()
 
     def create_application(self):
-        self.application = tornado.web.Application(self.urls,
-                                                   **self.application_settings)
+        plugins.close_registration()
+        settings = self.application_settings
+        log.info('Application settings: %s', public_settings(settings))
+        self.application = Application(self.urls, **settings)
         self.application.database = self.database
-        self.application.listen(self.port)
-    
+        self.application.asynchronous_database = make_asynchronous(self.database)
+        self.application.access_token_signer = self.access_token_signer
+        self.application.client_registry = self.create_client_registry()
+        self.application.refresh_token_lifetime = self.refresh_token_lifetime
+        self.application.open_introspection = self.open_introspection
+        self.application.open_metrics = self.open_metrics
+        self.application.introspection_cache = cache.LRUCache(self.introspection_cache_size,
+                                                              self.introspection_cache_ttl)
+        self.application.revocation_filter = self.create_revocation_filter()
+        self.application.client_credentials_cache = self.create_client_credentials_cache()
+        self.http_server = tornado.httpserver.HTTPServer(self.application)
+        if self.sockets:
+            self.http_server.add_sockets(self.sockets)
+        else:
+            self.http_server.listen(self.port)
+        self.start_periodic_tasks()
+
+    def create_revocation_filter(self):
+        self.revocation_filter = bloom.RevocationFilter(self.database,
+                                                        self.revocation_filter_capacity,
+                                                        self.revocation_filter_error_rate)
+        self.revocation_filter.rebuild()
+        log.info('Revocation filter: %s tokens, %s bytes, estimated false positive rate %.6f',
+                 *self.revocation_filter.stats())
+        return self.revocation_filter
+
+    def create_client_registry(self):
+        '''
+        Loads every client on a ``ClientRegistry``, kept up to date by
+        the database client listeners and reloaded periodically. Databases
+        that can't list their clients or notify changes have no registry,
+        clients are found on the database
+        '''
+        if not (hasattr(self.database, 'all_clients') and
+                hasattr(self.database, 'add_client_listener')):
+            return None
+        self.client_registry = clients.ClientRegistry(self.database,
+                                                      self.client_registry_reload_interval)
+        wait(self.client_registry.load())
+        self.database.add_client_listener(self.client_registry.client_changed)
+        log.info('Client registry: %s clients', len(self.client_registry))
+        return self.client_registry
+
+    def create_client_credentials_cache(self):
+        '''
+        Cache of authenticated Authorization headers, cleared of a client's
+        headers when the database says the client changed
+        '''
+        self.client_credentials_cache = cache.LRUCache(self.client_credentials_cache_size,
+                                                       self.client_credentials_cache_ttl)
+        if hasattr(self.database, 'add_client_listener'):
+            self.database.add_client_listener(self.invalidate_client_credentials)
+        return self.client_credentials_cache
+
+    def invalidate_client_credentials(self, client_id):
+        '''
+        Drops the cached Authorization headers of ``client_id``, called
+        by the database when the client changes
+        '''
+        self.client_credentials_cache.invalidate_values(
+            lambda cached: cached[0] == client_id)
+
+    def start_periodic_tasks(self):
+        '''
+        Schedules on the IOLoop the maintenance tasks the database
+        declares on ``periodic_tasks()``, if any, the revocation filter
+        rebuild and the client registry reload
+        '''
+        tasks = list(getattr(self.database, 'periodic_tasks', list)())
+        if self.revocation_filter:
+            tasks.extend(self.revocation_filter.periodic_tasks())
+        if self.client_registry:
+            tasks.extend(self.client_registry.periodic_tasks())
+        for callback, interval in tasks:
+            periodic_callback = tornado.ioloop.PeriodicCallback(callback, interval)
+            periodic_callback.start()
+            self.periodic_callbacks.append(periodic_callback)
+
     @property
     def application_settings(self):
-        default_settings = {'debug': True,
-                            'cookie_secret': str(uuid.uuid4())}
+        default_settings = {'debug': self.debug,
+                            'cookie_secret': self.cookie_secret}
+        if self.access_log:
+            default_settings['log_function'] = self.access_log
+        if not self.debug:
+            default_settings.update({'autoreload': False,
+                                     'compiled_template_cache': True,
+                                     'static_hash_cache': True})
+        if self.processes > 1:
+            # autoreload restarts the process it runs on, a worker would
+            # be replaced by a whole new server
+            default_settings['autoreload'] = False
         default_settings.update(self.custom_application_settings)
         return default_settings
 
     def start_ioloop(self):
         log.info('Server listening on port %s', self.port)
         tornado.ioloop.IOLoop.instance().start()
+
+    def handle_sigterm(self, signum, frame):
+        tornado.ioloop.IOLoop.instance().add_callback_from_signal(self.stop)
+
+    def stop(self):
+        '''
+        Stops accepting new connections and stops the IOLoop once the
+        running requests finish, or after ``shutdown_timeout`` seconds
+        '''
+        log.info('Shutting down, waiting at most %s seconds for %s running requests',
+                 self.shutdown_timeout, self.application.requests_in_flight)
+        self.http_server.stop()
+        for periodic_callback in self.periodic_callbacks:
+            periodic_callback.stop()
+        ioloop = tornado.ioloop.IOLoop.instance()
+        timeout = ioloop.add_timeout(time.time() + self.shutdown_timeout, ioloop.stop)
+
+        def stop_ioloop():
+            ioloop.remove_timeout(timeout)
+            ioloop.stop()
+
+        if self.application.requests_in_flight:
+            self.application.on_idle = lambda: ioloop.add_callback(stop_ioloop)
+        else:
+            stop_ioloop()
+
+
+    def close_database(self):
+        '''
+        Gives the database a chance to write pending changes
+        '''
+        if hasattr(self.database, 'close'):
+            self.database.close()
+
+    def close_log(self):
+        '''
+        Writes the log records still queued, if logging through a queue
+        '''
+        log.stop()
+
+
+class Application(tornado.web.Application):
+    '''
+    ``tornado.web.Application`` counting the requests it's handling on
+    ``requests_in_flight``, and calling ``on_idle`` (if set) each time the
+    last one finishes
+    '''
+
+    requests_in_flight = 0
+    on_idle = None
+
+    def __call__(self, request):
+        self.requests_in_flight += 1
+        return super(Application, self).__call__(request)
+
+    def log_request(self, handler):
+        # called once by every handler, when it finishes
+        try:
+            super(Application, self).log_request(handler)
+        finally:
+            self.requests_in_flight -= 1
+            if not self.requests_in_flight and self.on_idle:
+                self.on_idle()
+
+
+def wait(future):
+    '''
+    Result of ``future``, running the IOLoop until it's done if it's not
+    yet (used before the server starts, with asynchronous databases)
+    '''
+    if not future.done():
+        tornado.ioloop.IOLoop.instance().run_sync(lambda: future)
+    return future.result()
+
+
+def public_settings(settings):
+    '''
+    Copy of application ``settings`` safe to be logged
+    '''
+    settings = dict(settings)
+    for name in ('cookie_secret',):
+        if settings.get(name):
+            settings[name] = '<hidden>'
+    return settings
+
+
+class UnsafeDataBase(Exception):
+    pass
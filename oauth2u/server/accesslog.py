@@ -0,0 +1,85 @@
+'''
+Structured access log: one JSON line per request, logged on the
+``oauth2u.access`` logger through ``oauth2u.server.log``.
+
+Used as tornado's ``log_function`` application setting, see
+``Server(access_log=True)``.
+
+'''
+import json
+import random
+
+from oauth2u.server import log
+
+__all__ = 'AccessLog', 'outcome'
+
+SUCCESS, CLIENT_ERROR, SERVER_ERROR = 'success', 'client_error', 'server_error'
+
+
+def outcome(handler):
+    '''
+    ``success``, ``client_error`` (including redirects with an OAuth
+    error) or ``server_error``
+    '''
+    status = handler.get_status()
+    if status >= 500:
+        return SERVER_ERROR
+    if status >= 400 or getattr(handler, 'error_code', None):
+        return CLIENT_ERROR
+    return SUCCESS
+
+
+class AccessLog(object):
+    '''
+    Logs requests sampled by outcome: ``sample_rates`` maps an outcome
+    to the fraction of its requests logged (outcomes not given are all
+    logged). ``logged`` and ``skipped`` count the requests.
+
+    Each line has the request ``endpoint``, ``method``, ``status``,
+    ``outcome``, ``error`` (the OAuth error code), ``client_id``,
+    ``grant_type``, the request ``latency`` and the time spent on each
+    phase of the handler (``phases``), in seconds.
+
+    '''
+
+    def __init__(self, sample_rates=None, random=random.random):
+        self.sample_rates = dict(sample_rates or {})
+        self.random = random
+        self.logged = 0
+        self.skipped = 0
+
+    def __call__(self, handler):
+        request_outcome = outcome(handler)
+        rate = self.sample_rates.get(request_outcome, 1.0)
+        if rate < 1.0 and self.random() >= rate:
+            self.skipped += 1
+            return
+        self.logged += 1
+        log.access('%s', JSONLine(self.entry(handler, request_outcome)))
+
+    def entry(self, handler, request_outcome):
+        return {
+            'endpoint': handler.request.path,
+            'method': handler.request.method,
+            'status': handler.get_status(),
+            'outcome': request_outcome,
+            'error': getattr(handler, 'error_code', None),
+            'client_id': getattr(handler, 'client_id', None),
+            'grant_type': getattr(handler, 'grant_type', None),
+            'latency': handler.request.request_time(),
+            'phases': dict(getattr(handler, 'phase_times', None) or {}),
+        }
+
+
+class JSONLine(object):
+    '''
+    Serializes ``entry`` only when the record is formatted, which is on
+    the log thread when logging through a queue
+    '''
+    __slots__ = 'entry',
+
+    def __init__(self, entry):
+        self.entry = entry
+
+    def __str__(self):
+        return json.dumps(self.entry, sort_keys=True)
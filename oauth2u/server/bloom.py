@@ -0,0 +1,157 @@
+'''
+Bloom filter of revoked access tokens, so checking a token that was not
+revoked (almost all of them) doesn't need to reach the database.
+
+'''
+import hashlib
+import math
+import struct
+
+import tornado.ioloop
+
+from oauth2u.server import log
+from oauth2u.server.database import make_asynchronous
+
+__all__ = 'BloomFilter', 'RevocationFilter'
+
+DEFAULT_CAPACITY = 100000
+DEFAULT_ERROR_RATE = 0.001
+REBUILD_INTERVAL = 1000     # milliseconds
+REBUILD_BATCH_SIZE = 1000
+
+
+class BloomFilter(object):
+    '''
+    Set of strings answering ``might_contain()`` with no false negatives
+    and a false positive rate of about ``error_rate`` while it holds up to
+    ``capacity`` values. Values can't be removed.
+
+    '''
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, value):
+        bits = self.bits
+        for position in self.positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    __contains__ = might_contain
+
+    def positions(self, value):
+        # double hashing: k positions from the two halves of one digest
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        first, second = struct.unpack('<QQ', hashlib.md5(value).digest())
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    @property
+    def false_positive_rate(self):
+        '''
+        Estimated false positive rate for the values added so far
+        '''
+        return (1 - math.exp(-self.hashes * self.count / float(self.size))) ** self.hashes
+
+    @property
+    def size_in_bytes(self):
+        return len(self.bits)
+
+
+class RevocationFilter(object):
+    '''
+    Keeps a ``BloomFilter`` with the tokens revoked on ``database``.
+
+    Tokens revoked by this process are added right away with ``add()``.
+    The filter is also rebuilt from ``database.revoked_access_tokens()``,
+    ``rebuild_batch_size`` tokens every ``rebuild_interval`` milliseconds
+    (see ``periodic_tasks()``), and replaces the current one when it's
+    complete. That drops the expired revocations and brings the ones made
+    by other processes. Each new filter has room for twice as many tokens
+    as the last one had, and no less than ``capacity``. With asynchronous
+    databases the steps wait for ``revoked_access_tokens()`` to answer.
+
+    '''
+
+    def __init__(self, database, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE,
+                 rebuild_interval=REBUILD_INTERVAL, rebuild_batch_size=REBUILD_BATCH_SIZE):
+        self.database = database
+        self.asynchronous_database = make_asynchronous(database)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.rebuild_batch_size = rebuild_batch_size
+        self.filter = BloomFilter(capacity, error_rate)
+        self.next_filter = None
+        self.revoked_tokens = None
+        self.pending_tokens = None
+
+    def add(self, access_token):
+        self.filter.add(access_token)
+        if self.next_filter is not None:
+            self.next_filter.add(access_token)
+
+    def might_be_revoked(self, access_token):
+        return self.filter.might_contain(access_token)
+
+    def rebuild(self):
+        '''
+        Rebuilds the whole filter at once
+        '''
+        while not self.rebuild_step(limit=0):
+            if not self.revoked_tokens.done():
+                tornado.ioloop.IOLoop.instance().run_sync(lambda: self.revoked_tokens)
+
+    def rebuild_step(self, limit=None):
+        '''
+        Adds the next ``limit`` (default: ``rebuild_batch_size``, 0 for all)
+        revoked tokens to the filter being built. Returns True when it's
+        complete and replaced the current one
+
+        '''
+        limit = self.rebuild_batch_size if limit is None else limit
+        if self.next_filter is None:
+            capacity = max(self.capacity, 2 * self.filter.count)
+            self.next_filter = BloomFilter(capacity, self.error_rate)
+            self.revoked_tokens = self.asynchronous_database.revoked_access_tokens()
+        if self.pending_tokens is None:
+            if not self.revoked_tokens.done():
+                return False
+            try:
+                self.pending_tokens = iter(self.revoked_tokens.result())
+            except Exception:
+                # start over on the next step
+                self.next_filter = self.revoked_tokens = None
+                raise
+        added = 0
+        for access_token in self.pending_tokens:
+            self.next_filter.add(access_token)
+            added += 1
+            if added == limit:
+                return False
+        self.filter, self.next_filter = self.next_filter, None
+        self.revoked_tokens = self.pending_tokens = None
+        log.debug('Revocation filter rebuilt: %s tokens, %s bytes, '
+                  'estimated false positive rate %.6f', *self.stats())
+        return True
+
+    def stats(self):
+        '''
+        Tuple with how many tokens the filter has, its size in bytes and
+        estimated false positive rate
+        '''
+        return self.filter.count, self.filter.size_in_bytes, self.filter.false_positive_rate
+
+    def periodic_tasks(self):
+        return [(self.rebuild_step, self.rebuild_interval)]
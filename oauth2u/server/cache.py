@@ -0,0 +1,63 @@
+import collections
+import time
+
+__all__ = 'LRUCache',
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = 30            # seconds
+
+
+class LRUCache(object):
+    '''
+    Bounded cache keeping the ``max_size`` most recently used values.
+
+    Values expire ``ttl`` seconds after they're set (or the ``ttl`` given
+    to ``set()``), expired values are dropped when they're looked up.
+    ``hits`` and ``misses`` count the lookups.
+
+    '''
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None, now=None):
+        entry = self.entries.pop(key, None)
+        if entry is None or entry[1] <= (time.time() if now is None else now):
+            self.misses += 1
+            return default
+        # moves the entry to the end, as the most recently used
+        self.entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl=None, now=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = (value, (time.time() if now is None else now) + ttl)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def invalidate_values(self, predicate):
+        '''
+        Drops every value for which ``predicate(value)`` is true
+        '''
+        for key in [key for key, entry in self.entries.iteritems() if predicate(entry[0])]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
@@ -0,0 +1,90 @@
+'''
+Registry of all clients, loaded from the database when the server
+starts, so finding a client on ``/authorize`` and ``/access-token`` is a
+dict lookup instead of a database query.
+
+'''
+import tornado.gen
+import tornado.ioloop
+
+from oauth2u.server import log
+from oauth2u.server.database import make_asynchronous
+
+__all__ = 'ClientRegistry',
+
+RELOAD_INTERVAL = 60000     # milliseconds
+
+
+class ClientRegistry(object):
+    '''
+    Keeps ``snapshot``, a dict with every client of ``database`` by
+    client_id. The snapshot is never changed once published: each change
+    builds a new dict and replaces it, so readers never see it half
+    updated and don't need a lock.
+
+    The snapshot is loaded with ``database.all_clients()`` and updated by
+    ``client_changed()``, registered as a client listener on the database
+    (see ``ClientListeners``). Clients changed without going through the
+    database (or by other processes) are seen when it's loaded again,
+    every ``reload_interval`` milliseconds (see ``periodic_tasks()``).
+    Asynchronous databases are supported: ``load()`` and
+    ``client_changed()`` return Futures.
+
+    ``hits`` and ``misses`` count the lookups of existing and unknown
+    clients, and ``version`` is incremented on each new snapshot.
+
+    '''
+
+    def __init__(self, database, reload_interval=RELOAD_INTERVAL):
+        self.database = database
+        self.asynchronous_database = make_asynchronous(database)
+        self.reload_interval = reload_interval
+        self.snapshot = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @tornado.gen.coroutine
+    def load(self):
+        clients = yield self.asynchronous_database.all_clients()
+        self.publish(dict(clients))
+        log.debug('Client registry loaded: %s clients', len(self.snapshot))
+
+    def reload(self):
+        # errors are logged by the IOLoop
+        tornado.ioloop.IOLoop.current().add_future(self.load(), lambda future: future.result())
+
+    def find(self, client_id):
+        client = self.snapshot.get(client_id)
+        if client is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return client
+
+    @tornado.gen.coroutine
+    def client_changed(self, client_id):
+        client = yield self.asynchronous_database.find_client(client_id)
+        snapshot = dict(self.snapshot)
+        if client is None:
+            snapshot.pop(client_id, None)
+        else:
+            snapshot[client_id] = client
+        self.publish(snapshot)
+
+    def publish(self, snapshot):
+        self.snapshot = snapshot
+        self.version += 1
+
+    def stats(self):
+        '''
+        Tuple with how many clients are registered, and the hits and
+        misses of ``find()``
+        '''
+        return len(self.snapshot), self.hits, self.misses
+
+    def periodic_tasks(self):
+        return [(self.reload, self.reload_interval)]
+
+    def __len__(self):
+        return len(self.snapshot)
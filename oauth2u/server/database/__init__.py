@@ -0,0 +1,8 @@
+from __future__ import absolute_import
+
+from .base import *
+from .memory import *
+from .sqlite import *
+from .shared import *
+from .writebehind import *
+from .asynchronous import *
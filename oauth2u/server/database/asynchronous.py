@@ -0,0 +1,49 @@
+import functools
+import sys
+
+from tornado.concurrent import TracebackFuture
+
+__all__ = 'AsyncDataBase', 'make_asynchronous'
+
+
+class AsyncDataBase(object):
+    '''
+    Exposes a synchronous database (like ``MemoryDataBase``) through the
+    asynchronous interface used by the default handlers: every method
+    returns a ``tornado.concurrent.Future`` instead of the value itself.
+
+    Databases doing network I/O should implement the asynchronous
+    interface natively, returning futures that resolve when the backend
+    answers, and set ``is_asynchronous = True`` so they are used as is.
+
+    '''
+    is_asynchronous = True
+
+    def __init__(self, database):
+        self.database = database
+
+    def __getattr__(self, name):
+        attribute = getattr(self.database, name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def method(*args, **kwargs):
+            future = TracebackFuture()
+            try:
+                future.set_result(attribute(*args, **kwargs))
+            except Exception:
+                future.set_exc_info(sys.exc_info())
+            return future
+        return method
+
+
+def make_asynchronous(database):
+    '''
+    Returns ``database`` if it already implements the asynchronous
+    interface, wraps it in ``AsyncDataBase`` otherwise
+
+    '''
+    if getattr(database, 'is_asynchronous', False):
+        return database
+    return AsyncDataBase(database)
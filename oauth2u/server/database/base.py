@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import hmac
+import os
+
+import tornado.web
+
+from oauth2u.server import errors
+from oauth2u.tokens import hash_token
+
+__all__ = ('RedeemResult', 'ClientListeners', 'DatabaseFull', 'client_record',
+           'hash_client_secret', 'verify_client_secret')
+
+
+class RedeemResult(object):
+    '''
+    Possible outcomes of ``redeem_authorization_code()``. Only
+    ``REDEEMED`` means the code was valid and has been consumed
+
+    '''
+    REDEEMED = 'redeemed'
+    INVALID_CLIENT = 'invalid_client'
+    INVALID_CODE = 'invalid_code'
+    REDIRECT_URI_MISMATCH = 'redirect_uri_mismatch'
+    ALREADY_USED = 'already_used'
+
+
+class ClientListeners(object):
+    '''
+    Lets callers know when a client changes: ``listener(client_id)`` is
+    called after a client is saved through the database. Databases set
+    ``client_listeners`` to an empty list when created
+    '''
+
+    def add_client_listener(self, listener):
+        self.client_listeners.append(listener)
+
+    def notify_client_changed(self, client_id):
+        for listener in self.client_listeners:
+            listener(client_id)
+
+
+# PBKDF2 rounds of client secret hashes, see hash_client_secret()
+CLIENT_SECRET_ITERATIONS = 10000
+CLIENT_SECRET_SALT_SIZE = 16
+CLIENT_SECRET_SCHEME = 'pbkdf2_sha256'
+
+
+def hash_client_secret(client_secret, salt=None, iterations=CLIENT_SECRET_ITERATIONS):
+    '''
+    Hash databases keep instead of the client secret, ``None`` if there is
+    no secret. Computed once when the client is saved.
+
+    Client secrets are chosen by operators, unlike tokens, so they are
+    hashed with PBKDF2 and a random salt of their own, as
+    ``pbkdf2_sha256$iterations$salt$hash``. Handlers keep the headers
+    they verified on ``client_credentials_cache``, so the slow hash is not
+    computed on every request
+    '''
+    if client_secret is None:
+        return None
+    if isinstance(client_secret, unicode):
+        client_secret = client_secret.encode('utf-8')
+    if salt is None:
+        salt = base64.urlsafe_b64encode(os.urandom(CLIENT_SECRET_SALT_SIZE))
+    digest = hashlib.pbkdf2_hmac('sha256', client_secret, salt, iterations)
+    return '$'.join((CLIENT_SECRET_SCHEME, str(iterations), salt,
+                     base64.urlsafe_b64encode(digest)))
+
+
+def client_record(default_redirect_uri, secret_hash=None):
+    '''
+    Client as returned by ``find_client()``, ``secret_hash`` is only there
+    if the client has a secret
+    '''
+    client = {'default_redirect_uri': default_redirect_uri}
+    if secret_hash is not None:
+        client['secret_hash'] = secret_hash
+    return client
+
+
+def verify_client_secret(client, client_secret):
+    '''
+    Tells if ``client_secret`` matches the hash saved with ``client`` (as
+    returned by ``find_client()``), comparing in constant time
+    '''
+    secret_hash = client.get('secret_hash') if client else None
+    if not secret_hash or client_secret is None:
+        return False
+    secret_hash = str(secret_hash)
+    if '$' not in secret_hash:
+        # unsalted SHA-256, saved by older versions
+        return hmac.compare_digest(hash_token(client_secret), secret_hash)
+    scheme, iterations, salt, _ = secret_hash.split('$')
+    if scheme != CLIENT_SECRET_SCHEME:
+        return False
+    return hmac.compare_digest(hash_client_secret(client_secret, salt, int(iterations)), secret_hash)
+
+
+class DatabaseFull(tornado.web.HTTPError):
+    '''
+    Raised when the database has no room for a new record. It's an
+    ``HTTPError``, so handlers answer 503 ``temporarily_unavailable``
+    '''
+
+    def __init__(self, message):
+        super(DatabaseFull, self).__init__(503, '%s', message)
+        self.response_body = errors.TEMPORARILY_UNAVAILABLE
+        self.headers = {}
@@ -0,0 +1,325 @@
+from __future__ import absolute_import
+
+import heapq
+import time
+
+from .base import RedeemResult, ClientListeners, hash_client_secret
+
+__all__ = 'AuthorizationCode', 'AccessToken', 'RefreshToken', 'MemoryDataBase'
+
+# RFC recommends a maximum authorization code lifetime of 10 minutes
+DEFAULT_AUTHORIZATION_CODE_LIFETIME = 600
+
+REAP_INTERVAL = 1000        # milliseconds
+REAP_BATCH_SIZE = 1000
+
+
+class AuthorizationCode(object):
+    '''
+    Compact record for an issued authorization code.
+
+    Uses ``__slots__`` because a busy server keeps one of these for every
+    code issued and not yet redeemed.
+
+    '''
+    __slots__ = ('code', 'client_id', 'redirect_uri', 'state', 'used',
+                 'created_at', 'expires_at')
+
+    def __init__(self, code, client_id, redirect_uri, state, created_at=None,
+                 lifetime=DEFAULT_AUTHORIZATION_CODE_LIFETIME):
+        self.code = code
+        self.client_id = client_id
+        self.redirect_uri = redirect_uri
+        self.state = state
+        self.used = False
+        self.created_at = time.time() if created_at is None else created_at
+        self.expires_at = self.created_at + lifetime
+
+    def is_expired(self, now=None):
+        return (time.time() if now is None else now) >= self.expires_at
+
+
+class AccessToken(object):
+    '''
+    Compact record for an issued access token
+    '''
+    __slots__ = ('token', 'client_id', 'scope', 'expires_at')
+
+    def __init__(self, token, client_id, expires_at, scope=None):
+        self.token = token
+        self.client_id = client_id
+        self.scope = scope
+        self.expires_at = expires_at
+
+    def is_expired(self, now=None):
+        return (time.time() if now is None else now) >= self.expires_at
+
+
+class RefreshToken(AccessToken):
+    '''
+    Record for an issued refresh token, ``token`` is its hash
+    '''
+    __slots__ = ()
+
+
+class MemoryDataBase(ClientListeners):
+    '''
+    In-memory storage for clients and authorization codes.
+
+    Authorization codes live in a flat index (code -> ``AuthorizationCode``)
+    so a request needs a single dict lookup, and a per-client index
+    (client_id -> set of codes) is kept to count them.
+
+    The ``client_*`` methods are kept with their original signatures, new
+    code should prefer ``find_authorization_code()``.
+
+    Codes expire ``authorization_code_lifetime`` seconds after being saved.
+    Expired codes are invisible to lookups right away, and are removed
+    from memory by ``reap_expired_authorization_codes()``, which pops at most
+    ``reap_batch_size`` codes from an expiry heap on each call. The server
+    runs it every ``reap_interval`` milliseconds (see ``periodic_tasks()``),
+    so memory is released a little at a time instead of in a full scan.
+
+    Issued access tokens, and revocations, are kept the same way until the
+    token expires, see ``save_access_token()`` and ``revoke_access_token()``,
+    and so are refresh tokens, see ``save_refresh_token()``.
+
+    '''
+    # authorization_codes_count() is cheap, see metrics.collect()
+    counts_authorization_codes = True
+
+    def __init__(self, authorization_code_lifetime=DEFAULT_AUTHORIZATION_CODE_LIFETIME,
+                 reap_interval=REAP_INTERVAL, reap_batch_size=REAP_BATCH_SIZE):
+        self.client_listeners = []
+        self.authorization_code_lifetime = authorization_code_lifetime
+        self.reap_interval = reap_interval
+        self.reap_batch_size = reap_batch_size
+        self.clients = {}
+        self.authorization_codes = {}
+        self.client_codes = {}
+        self.expiry_heap = []
+        self.access_tokens = {}
+        self.revocations = {}
+        self.access_tokens_expiry_heap = []
+        self.refresh_tokens = {}
+        self.refresh_tokens_expiry_heap = []
+
+    def find_client(self, client_id):
+        return self.clients.get(client_id)
+
+    def all_clients(self):
+        '''
+        List of ``(client_id, client)`` with every client
+        '''
+        return self.clients.items()
+
+    def save_new_client(self, client_id, default_redirect_uri, client_secret=None):
+        '''
+        Saves a client. Only the hash of ``client_secret`` is kept, on the
+        ``secret_hash`` key of the client (absent if there is no secret)
+        '''
+        client = self.clients.setdefault(client_id, {})
+        client['default_redirect_uri'] = default_redirect_uri
+        client.pop('secret_hash', None)
+        if client_secret is not None:
+            client['secret_hash'] = hash_client_secret(client_secret)
+        self.client_codes.setdefault(client_id, set())
+        self.notify_client_changed(client_id)
+
+    def save_new_authorization_code(self, auth_code, client_id, state, redirect_uri):
+        record = AuthorizationCode(auth_code, client_id, redirect_uri, state,
+                                   lifetime=self.authorization_code_lifetime)
+        self.authorization_codes[auth_code] = record
+        self.client_codes.setdefault(client_id, set()).add(auth_code)
+        heapq.heappush(self.expiry_heap, (record.expires_at, auth_code))
+
+    def find_authorization_code(self, client_id, auth_code):
+        '''
+        Returns the ``AuthorizationCode`` for ``auth_code`` if it was
+        issued to ``client_id``, ``None`` otherwise
+
+        '''
+        record = self.authorization_codes.get(auth_code)
+        if record is None or record.client_id != client_id or record.is_expired():
+            return None
+        return record
+
+    def redeem_authorization_code(self, client_id, auth_code, redirect_uri,
+                                  authenticating_code=None):
+        '''
+        Validates ``auth_code`` and marks it as used in a single step, so
+        a code can never be redeemed twice.
+
+        If ``authenticating_code`` is given (the code sent on the
+        Authorization header) it must also be a code issued to ``client_id``.
+
+        Returns one of the ``RedeemResult`` constants
+
+        '''
+        if client_id not in self.clients:
+            return RedeemResult.INVALID_CLIENT
+        if (authenticating_code is not None and
+                self.find_authorization_code(client_id, authenticating_code) is None):
+            return RedeemResult.INVALID_CLIENT
+        record = self.find_authorization_code(client_id, auth_code)
+        if record is None:
+            return RedeemResult.INVALID_CODE
+        if record.redirect_uri != redirect_uri:
+            return RedeemResult.REDIRECT_URI_MISMATCH
+        if record.used:
+            return RedeemResult.ALREADY_USED
+        record.used = True
+        return RedeemResult.REDEEMED
+
+    def client_has_authorization_code(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code) is not None
+
+    def authorization_codes_count(self):
+        '''
+        Codes stored, including the expired ones the reaper didn't remove
+        yet, which keeps it close to the live codes without a scan
+        '''
+        return len(self.authorization_codes)
+
+    def client_authorization_codes_count(self, client_id):
+        now = time.time()
+        codes = self.authorization_codes
+        return sum(1 for code in self.client_codes[client_id]
+                   if not codes[code].is_expired(now))
+
+    def mark_client_authorization_code_as_used(self, client_id, auth_code):
+        self.find_authorization_code(client_id, auth_code).used = True
+
+    def is_client_authorization_code_used(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).used
+
+    def client_has_redirect_uri_for_code(self, client_id, auth_code, redirect_uri):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri == redirect_uri
+
+    def get_state(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).state
+
+    def get_redirect_uri(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri
+
+    def reap_expired_authorization_codes(self, now=None, limit=None):
+        '''
+        Removes up to ``limit`` (default: ``reap_batch_size``) expired
+        codes from memory. Returns how many were removed
+
+        '''
+        now = time.time() if now is None else now
+        limit = self.reap_batch_size if limit is None else limit
+        heap = self.expiry_heap
+        removed = 0
+        while heap and removed < limit and heap[0][0] <= now:
+            expires_at, code = heapq.heappop(heap)
+            record = self.authorization_codes.get(code)
+            if record is None or record.expires_at != expires_at:
+                continue
+            del self.authorization_codes[code]
+            self.client_codes[record.client_id].discard(code)
+            removed += 1
+        return removed
+
+    def save_access_token(self, access_token, client_id, expires_at, scope=None):
+        self.access_tokens[access_token] = AccessToken(access_token, client_id,
+                                                       expires_at, scope)
+        heapq.heappush(self.access_tokens_expiry_heap, (expires_at, access_token))
+
+    def find_access_token(self, access_token):
+        '''
+        Returns the ``AccessToken`` for ``access_token`` if it was issued
+        and has not expired, ``None`` otherwise
+
+        '''
+        record = self.access_tokens.get(access_token)
+        if record is None or record.is_expired():
+            return None
+        return record
+
+    def revoke_access_token(self, access_token, expires_at):
+        '''
+        Forgets ``access_token`` and remembers it was revoked until
+        ``expires_at``, when it would be invalid anyway. Signed tokens,
+        which are not stored, can be revoked too
+
+        '''
+        self.access_tokens.pop(access_token, None)
+        self.revocations[access_token] = expires_at
+        heapq.heappush(self.access_tokens_expiry_heap, (expires_at, access_token))
+
+    def is_access_token_revoked(self, access_token):
+        expires_at = self.revocations.get(access_token)
+        return expires_at is not None and expires_at > time.time()
+
+    def revoked_access_tokens(self):
+        now = time.time()
+        return [access_token for access_token, expires_at in self.revocations.items()
+                if expires_at > now]
+
+    def reap_expired_access_tokens(self, now=None, limit=None):
+        '''
+        Removes up to ``limit`` (default: ``reap_batch_size``) expired
+        access tokens and revocations. Returns how many were removed
+
+        '''
+        now = time.time() if now is None else now
+        limit = self.reap_batch_size if limit is None else limit
+        heap = self.access_tokens_expiry_heap
+        removed = 0
+        while heap and removed < limit and heap[0][0] <= now:
+            expires_at, access_token = heapq.heappop(heap)
+            record = self.access_tokens.get(access_token)
+            if record is not None and record.expires_at == expires_at:
+                del self.access_tokens[access_token]
+                removed += 1
+            if self.revocations.get(access_token) == expires_at:
+                del self.revocations[access_token]
+                removed += 1
+        return removed
+
+    def save_refresh_token(self, token_hash, client_id, expires_at, scope=None):
+        '''
+        Stores a refresh token by its hash (see ``oauth2u.tokens.hash_token()``),
+        the token itself is never stored
+        '''
+        self.refresh_tokens[token_hash] = RefreshToken(token_hash, client_id, expires_at, scope)
+        heapq.heappush(self.refresh_tokens_expiry_heap, (expires_at, token_hash))
+
+    def consume_refresh_token(self, token_hash, client_id):
+        '''
+        Removes and returns the ``RefreshToken`` for ``token_hash`` if it was
+        issued to ``client_id`` and has not expired, ``None`` otherwise. A
+        refresh token can only be consumed once
+
+        '''
+        record = self.refresh_tokens.get(token_hash)
+        if record is None or record.client_id != client_id or record.is_expired():
+            return None
+        del self.refresh_tokens[token_hash]
+        return record
+
+    def reap_expired_refresh_tokens(self, now=None, limit=None):
+        now = time.time() if now is None else now
+        limit = self.reap_batch_size if limit is None else limit
+        heap = self.refresh_tokens_expiry_heap
+        removed = 0
+        while heap and removed < limit and heap[0][0] <= now:
+            expires_at, token_hash = heapq.heappop(heap)
+            record = self.refresh_tokens.get(token_hash)
+            if record is None or record.expires_at != expires_at:
+                continue
+            del self.refresh_tokens[token_hash]
+            removed += 1
+        return removed
+
+    def periodic_tasks(self):
+        '''
+        List of ``(callback, interval_in_milliseconds)`` the server should
+        run periodically on its IOLoop
+
+        '''
+        return [(self.reap_expired_authorization_codes, self.reap_interval),
+                (self.reap_expired_access_tokens, self.reap_interval),
+                (self.reap_expired_refresh_tokens, self.reap_interval)]
@@ -0,0 +1,455 @@
+from __future__ import absolute_import
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from .base import RedeemResult, ClientListeners, DatabaseFull, client_record, hash_client_secret
+from .memory import (AuthorizationCode, AccessToken, RefreshToken,
+                     DEFAULT_AUTHORIZATION_CODE_LIFETIME, REAP_INTERVAL, REAP_BATCH_SIZE)
+
+__all__ = 'SharedMemoryDataBase',
+
+DEFAULT_CAPACITY = 65536
+DEFAULT_TOKEN_CAPACITY = 65536
+DEFAULT_REVOCATION_CAPACITY = 8192
+DEFAULT_MAX_PROBES = 64
+# fraction of the token slots in use above which codes and refresh
+# tokens are not redeemed, as there might be no room for the new tokens
+MAX_TOKEN_LOAD = 0.9
+
+EMPTY, OCCUPIED, DELETED = 0, 1, 2
+NONE_LENGTH = 0xFFFF
+
+# status, used, created_at, expires_at, then length and bytes
+# of: code, client_id, redirect_uri and state. Access tokens use
+# the same slots, keyed by TOKEN_PREFIX + token and with the scope
+# in the redirect_uri field, and so do revocations, keyed by
+# REVOKED_PREFIX + sha1 of the token (signed tokens are too long
+# for the key) and with the token in the redirect_uri field, and
+# refresh tokens, keyed by REFRESH_PREFIX + token hash
+SLOT = struct.Struct('<BBddHHHH64s128s512s256s')
+# occupied slots of each region, after the slots
+COUNTER = struct.Struct('<q')
+FIELD_SIZES = (64, 128, 512, 256)
+TOKEN_PREFIX = 'token:'
+REVOKED_PREFIX = 'revoked:'
+REFRESH_PREFIX = 'refresh:'
+
+
+class SharedMemoryDataBase(ClientListeners):
+    '''
+    Stores authorization codes on a fixed size hash table in a memory
+    mapped file, shared by all processes forked after it's created. A
+    code issued by one worker can be redeemed on any other.
+
+    The table uses open addressing with linear probing and has room for
+    ``capacity`` codes. Each slot is locked with a ``fcntl`` byte range lock
+    while it's written, so workers only wait for each other when they touch
+    the same slot. Expired codes are skipped by lookups and their slots are
+    reused by new codes, ``reap_expired_authorization_codes()`` marks them
+    as deleted ``reap_batch_size`` slots at a time.
+
+    Deleted slots are never emptied again, so after a while lookups of
+    unknown codes find no empty slot to stop at. Records are kept within
+    ``max_probes`` slots of where their key hashes to, and lookups look
+    no further, so a miss costs at most ``max_probes`` slot reads however
+    full of deleted slots the table is. ``DatabaseFull`` is raised when
+    those slots are all in use.
+
+    Access and refresh tokens are stored on slots of their own,
+    ``token_capacity`` of them, so codes and tokens don't take each
+    other's room. Tokens stay there until they expire: the table
+    needs ``token_capacity * MAX_TOKEN_LOAD`` to be more than the tokens
+    issued per second times their lifetime (``expires_in``, an hour by
+    default), plus the refresh tokens times ``refresh_token_lifetime``.
+    The default 65536 slots take about 16 access tokens per second. When
+    more than ``MAX_TOKEN_LOAD`` of them are in use, codes and refresh
+    tokens are not redeemed, ``DatabaseFull`` is raised before they are
+    consumed so the client can try again later.
+
+    Revocations have ``revocation_capacity`` slots, so listing them on
+    ``revoked_access_tokens()`` (every time a ``RevocationFilter`` is
+    rebuilt) only reads those.
+
+    Each slot takes ``SLOT.size`` (986) bytes, so the default capacities
+    make a file of about 137MB. Values are stored on fixed size fields,
+    ``max_lengths`` has the longest ``client_id``, ``redirect_uri`` and
+    ``state`` (in UTF-8 bytes) the authorization handler accepts.
+
+    Clients are kept in a dict in each process, so they must be saved
+    before the workers are forked.
+
+    If ``filename`` is not given an anonymous temporary file is used.
+
+    '''
+    multiprocess_safe = True
+    max_lengths = {'client_id': FIELD_SIZES[1], 'redirect_uri': FIELD_SIZES[2],
+                   'state': FIELD_SIZES[3]}
+
+    def __init__(self, filename=None, capacity=DEFAULT_CAPACITY,
+                 authorization_code_lifetime=DEFAULT_AUTHORIZATION_CODE_LIFETIME,
+                 reap_interval=REAP_INTERVAL, reap_batch_size=REAP_BATCH_SIZE,
+                 max_probes=DEFAULT_MAX_PROBES, token_capacity=DEFAULT_TOKEN_CAPACITY,
+                 revocation_capacity=DEFAULT_REVOCATION_CAPACITY):
+        self.client_listeners = []
+        self.capacity = capacity
+        self.token_capacity = token_capacity
+        self.revocation_capacity = revocation_capacity
+        self.max_probes = max_probes
+        self.slots = slots = capacity + token_capacity + revocation_capacity
+        self.codes = Region(0, capacity, slots * SLOT.size)
+        self.tokens = Region(capacity, token_capacity, slots * SLOT.size + COUNTER.size)
+        self.revocations = Region(capacity + token_capacity, revocation_capacity,
+                                  slots * SLOT.size + 2 * COUNTER.size)
+        self.regions = self.codes, self.tokens, self.revocations
+        self.authorization_code_lifetime = authorization_code_lifetime
+        self.reap_interval = reap_interval
+        self.reap_batch_size = reap_batch_size
+        self.reap_position = 0
+        self.clients = {}
+        if filename is None:
+            self.file = tempfile.TemporaryFile()
+        else:
+            self.file = open(filename, 'a+b')
+        self.fd = self.file.fileno()
+        size = slots * SLOT.size + len(self.regions) * COUNTER.size
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.table = mmap.mmap(self.fd, size, mmap.MAP_SHARED)
+
+    def find_client(self, client_id):
+        return self.clients.get(client_id)
+
+    def all_clients(self):
+        return self.clients.items()
+
+    def save_new_client(self, client_id, default_redirect_uri, client_secret=None):
+        self.clients[client_id] = client_record(default_redirect_uri,
+                                                hash_client_secret(client_secret))
+        self.notify_client_changed(client_id)
+
+    def save_new_authorization_code(self, auth_code, client_id, state, redirect_uri):
+        created_at = time.time()
+        self.insert(self.codes, (auth_code, client_id, redirect_uri, state), created_at,
+                    created_at + self.authorization_code_lifetime)
+
+    def find_authorization_code(self, client_id, auth_code):
+        index = self.find_slot(self.codes, auth_code)
+        if index is None:
+            return None
+        self.lock(index)
+        try:
+            record = self.read_record(index)
+        finally:
+            self.unlock(index)
+        if record.code != auth_code or record.client_id != client_id or record.is_expired():
+            return None
+        return record
+
+    def redeem_authorization_code(self, client_id, auth_code, redirect_uri,
+                                  authenticating_code=None):
+        if client_id not in self.clients:
+            return RedeemResult.INVALID_CLIENT
+        if (authenticating_code is not None and
+                self.find_authorization_code(client_id, authenticating_code) is None):
+            return RedeemResult.INVALID_CLIENT
+        index = self.find_slot(self.codes, auth_code)
+        if index is None:
+            return RedeemResult.INVALID_CODE
+        self.lock(index)
+        try:
+            record = self.read_record(index)
+            if record.code != auth_code or record.client_id != client_id or record.is_expired():
+                return RedeemResult.INVALID_CODE
+            if record.redirect_uri != redirect_uri:
+                return RedeemResult.REDIRECT_URI_MISMATCH
+            if record.used:
+                return RedeemResult.ALREADY_USED
+            self.check_token_room()
+            self.write_used(index)
+            return RedeemResult.REDEEMED
+        finally:
+            self.unlock(index)
+
+    def client_has_authorization_code(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code) is not None
+
+    def client_authorization_codes_count(self, client_id):
+        '''
+        Counts live codes scanning the whole table, use only for reporting
+        '''
+        now = time.time()
+        count = 0
+        for index in self.codes.indexes():
+            status, used, created_at, expires_at = self.read_header(index)
+            if status == OCCUPIED and expires_at > now:
+                count += self.read_record(index).client_id == client_id
+        return count
+
+    def mark_client_authorization_code_as_used(self, client_id, auth_code):
+        index = self.find_slot(self.codes, auth_code)
+        self.lock(index)
+        try:
+            if self.read_record(index).client_id == client_id:
+                self.write_used(index)
+        finally:
+            self.unlock(index)
+
+    def is_client_authorization_code_used(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).used
+
+    def client_has_redirect_uri_for_code(self, client_id, auth_code, redirect_uri):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri == redirect_uri
+
+    def get_state(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).state
+
+    def get_redirect_uri(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri
+
+    def save_access_token(self, access_token, client_id, expires_at, scope=None):
+        self.insert(self.tokens, (TOKEN_PREFIX + access_token, client_id, scope, None),
+                    time.time(), expires_at)
+
+    def find_access_token(self, access_token):
+        key = TOKEN_PREFIX + access_token
+        index = self.find_slot(self.tokens, key)
+        if index is None:
+            return None
+        self.lock(index)
+        try:
+            record = self.read_record(index)
+        finally:
+            self.unlock(index)
+        if record.code != key or record.is_expired():
+            return None
+        return AccessToken(access_token, record.client_id, record.expires_at,
+                           scope=record.redirect_uri)
+
+    def revoke_access_token(self, access_token, expires_at):
+        index = self.find_slot(self.tokens, TOKEN_PREFIX + access_token)
+        if index is not None:
+            self.lock(index)
+            try:
+                if self.read_code(index) == (TOKEN_PREFIX + access_token).encode('utf-8'):
+                    self.delete(self.tokens, index)
+            finally:
+                self.unlock(index)
+        self.insert(self.revocations, (revocation_key(access_token), u'', access_token, None),
+                    time.time(), expires_at)
+
+    def is_access_token_revoked(self, access_token):
+        index = self.find_slot(self.revocations, revocation_key(access_token))
+        return index is not None and self.read_header(index)[3] > time.time()
+
+    def revoked_access_tokens(self):
+        '''
+        Yields the revoked tokens, scanning the revocation slots as it goes
+        '''
+        for index in self.revocations.indexes():
+            status, used, created_at, expires_at = self.read_header(index)
+            if status == OCCUPIED and expires_at > time.time():
+                yield self.read_record(index).redirect_uri
+
+    def save_refresh_token(self, token_hash, client_id, expires_at, scope=None):
+        self.insert(self.tokens, (REFRESH_PREFIX + token_hash, client_id, scope, None),
+                    time.time(), expires_at)
+
+    def consume_refresh_token(self, token_hash, client_id):
+        key = REFRESH_PREFIX + token_hash
+        index = self.find_slot(self.tokens, key)
+        if index is None:
+            return None
+        self.lock(index)
+        try:
+            record = self.read_record(index)
+            if record.code != key or record.client_id != client_id or record.is_expired():
+                return None
+            self.check_token_room()
+            self.delete(self.tokens, index)
+        finally:
+            self.unlock(index)
+        return RefreshToken(token_hash, client_id, record.expires_at, scope=record.redirect_uri)
+
+    def reap_expired_authorization_codes(self, now=None, limit=None):
+        '''
+        Looks at the next ``limit`` slots (default: ``reap_batch_size``) and
+        marks the expired ones as deleted, codes, tokens and revocations
+        alike.
+        Returns how many were deleted
+
+        '''
+        now = time.time() if now is None else now
+        limit = self.reap_batch_size if limit is None else limit
+        removed = 0
+        for i in range(min(limit, self.slots)):
+            index = self.reap_position
+            self.reap_position = (self.reap_position + 1) % self.slots
+            status, used, created_at, expires_at = self.read_header(index)
+            if status != OCCUPIED or expires_at > now:
+                continue
+            self.lock(index)
+            try:
+                status, used, created_at, expires_at = self.read_header(index)
+                if status == OCCUPIED and expires_at <= now:
+                    self.delete(self.region(index), index)
+                    removed += 1
+            finally:
+                self.unlock(index)
+        return removed
+
+    def periodic_tasks(self):
+        return [(self.reap_expired_authorization_codes, self.reap_interval)]
+
+    def close(self):
+        self.table.close()
+        self.file.close()
+
+    def check_token_room(self):
+        if self.occupied(self.tokens) >= self.token_capacity * MAX_TOKEN_LOAD:
+            raise DatabaseFull('{0} of the {1} token slots are in use, no room for new '
+                               'tokens'.format(self.occupied(self.tokens), self.token_capacity))
+
+    def insert(self, region, fields, created_at, expires_at):
+        key = fields[0]
+        fields = [encode(value, size) for value, size in zip(fields, FIELD_SIZES)]
+        lengths = [length for length, data in fields]
+        values = [data for length, data in fields]
+        for index in self.probe(region, key):
+            if self.is_in_use(index, created_at):
+                # only free slots are locked, and checked again
+                continue
+            self.lock(index)
+            try:
+                status, used, _, slot_expires_at = self.read_header(index)
+                if status == OCCUPIED and slot_expires_at > created_at:
+                    continue
+                SLOT.pack_into(self.table, index * SLOT.size, OCCUPIED, 0, created_at,
+                               expires_at, *(lengths + values))
+                if status != OCCUPIED:
+                    self.count(region, 1)
+                return
+            finally:
+                self.unlock(index)
+        raise DatabaseFull('No free slot for a new record, the {0} slots it may '
+                           'use are in use'.format(min(self.max_probes, region.size)))
+
+    def delete(self, region, index):
+        '''
+        Marks the slot ``index``, locked by the caller, as deleted
+        '''
+        self.write_status(index, DELETED)
+        self.count(region, -1)
+
+    def region(self, index):
+        for region in self.regions:
+            if index < region.start + region.size:
+                return region
+
+    def occupied(self, region):
+        '''
+        Slots of ``region`` with a record, expired or not
+        '''
+        return COUNTER.unpack_from(self.table, region.counter_offset)[0]
+
+    def count(self, region, amount):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, region.counter_offset)
+        try:
+            COUNTER.pack_into(self.table, region.counter_offset,
+                              self.occupied(region) + amount)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, region.counter_offset)
+
+    def is_in_use(self, index, now):
+        status, used, created_at, expires_at = self.read_header(index)
+        return status == OCCUPIED and expires_at > now
+
+    def probe(self, region, key):
+        start = (zlib.crc32(key.encode('utf-8')) & 0xffffffff) % region.size
+        for offset in range(min(self.max_probes, region.size)):
+            yield region.start + (start + offset) % region.size
+
+    def find_slot(self, region, key):
+        encoded = key.encode('utf-8')
+        for index in self.probe(region, key):
+            status = struct.unpack_from('<B', self.table, index * SLOT.size)[0]
+            if status == EMPTY:
+                return None
+            if status == OCCUPIED and self.read_code(index) == encoded:
+                return index
+        return None
+
+    def write_status(self, index, status):
+        struct.pack_into('<B', self.table, index * SLOT.size, status)
+
+    def write_used(self, index):
+        struct.pack_into('<B', self.table, index * SLOT.size + 1, 1)
+
+    def read_header(self, index):
+        return struct.unpack_from('<BBdd', self.table, index * SLOT.size)
+
+    def read_code(self, index):
+        offset = index * SLOT.size
+        length = struct.unpack_from('<H', self.table, offset + 18)[0]
+        start = offset + SLOT.size - sum(FIELD_SIZES)
+        return self.table[start:start + length]
+
+    def read_record(self, index):
+        values = SLOT.unpack_from(self.table, index * SLOT.size)
+        status, used, created_at, expires_at = values[:4]
+        code, client_id, redirect_uri, state = [decode(length, data) for length, data
+                                                in zip(values[4:8], values[8:])]
+        record = AuthorizationCode(code, client_id, redirect_uri, state,
+                                   created_at=created_at, lifetime=expires_at - created_at)
+        record.used = bool(used)
+        return record
+
+    def lock(self, index):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, index * SLOT.size)
+
+    def unlock(self, index):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, index * SLOT.size)
+
+
+class Region(object):
+    '''
+    The ``size`` slots from ``start`` on, and where the count of its
+    occupied slots is
+    '''
+    __slots__ = 'start', 'size', 'counter_offset'
+
+    def __init__(self, start, size, counter_offset):
+        self.start = start
+        self.size = size
+        self.counter_offset = counter_offset
+
+    def indexes(self):
+        return xrange(self.start, self.start + self.size)
+
+
+def revocation_key(access_token):
+    if isinstance(access_token, unicode):
+        access_token = access_token.encode('utf-8')
+    return REVOKED_PREFIX + hashlib.sha1(access_token).hexdigest()
+
+
+def encode(value, size):
+    if value is None:
+        return NONE_LENGTH, b''
+    data = value.encode('utf-8')
+    if len(data) > size:
+        raise ValueError('Value {0!r} is longer than {1} bytes'.format(value, size))
+    return len(data), data
+
+
+def decode(length, data):
+    if length == NONE_LENGTH:
+        return None
+    return data[:length].decode('utf-8')
+
@@ -0,0 +1,303 @@
+from __future__ import absolute_import
+
+import sqlite3
+import time
+
+from .base import RedeemResult, ClientListeners, client_record, hash_client_secret
+from .memory import (AuthorizationCode, AccessToken, RefreshToken,
+                     DEFAULT_AUTHORIZATION_CODE_LIFETIME, REAP_INTERVAL, REAP_BATCH_SIZE)
+
+__all__ = 'SQLiteDataBase',
+
+COMMIT_INTERVAL = 50        # milliseconds
+COMMIT_BATCH_SIZE = 100
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS clients ('
+    '  client_id TEXT PRIMARY KEY,'
+    '  default_redirect_uri TEXT,'
+    '  client_secret_hash TEXT)',
+
+    'CREATE TABLE IF NOT EXISTS authorization_codes ('
+    '  code TEXT PRIMARY KEY,'
+    '  client_id TEXT NOT NULL,'
+    '  redirect_uri TEXT,'
+    '  state TEXT,'
+    '  used INTEGER NOT NULL DEFAULT 0,'
+    '  created_at REAL NOT NULL,'
+    '  expires_at REAL NOT NULL)',
+
+    'CREATE INDEX IF NOT EXISTS authorization_codes_client_id '
+    '  ON authorization_codes (client_id)',
+
+    'CREATE INDEX IF NOT EXISTS authorization_codes_expires_at '
+    '  ON authorization_codes (expires_at)',
+
+    'CREATE TABLE IF NOT EXISTS access_tokens ('
+    '  token TEXT PRIMARY KEY,'
+    '  client_id TEXT NOT NULL,'
+    '  scope TEXT,'
+    '  expires_at REAL NOT NULL)',
+
+    'CREATE INDEX IF NOT EXISTS access_tokens_expires_at '
+    '  ON access_tokens (expires_at)',
+
+    'CREATE TABLE IF NOT EXISTS revoked_access_tokens ('
+    '  token TEXT PRIMARY KEY,'
+    '  expires_at REAL NOT NULL)',
+
+    'CREATE INDEX IF NOT EXISTS revoked_access_tokens_expires_at '
+    '  ON revoked_access_tokens (expires_at)',
+
+    'CREATE TABLE IF NOT EXISTS refresh_tokens ('
+    '  token_hash TEXT PRIMARY KEY,'
+    '  client_id TEXT NOT NULL,'
+    '  scope TEXT,'
+    '  expires_at REAL NOT NULL)',
+
+    'CREATE INDEX IF NOT EXISTS refresh_tokens_expires_at '
+    '  ON refresh_tokens (expires_at)',
+)
+
+# statements are kept as constants so sqlite3's statement cache always
+# gets the same string and never prepares them twice
+FIND_CLIENT = 'SELECT default_redirect_uri, client_secret_hash FROM clients WHERE client_id = ?'
+ALL_CLIENTS = 'SELECT client_id, default_redirect_uri, client_secret_hash FROM clients'
+SAVE_CLIENT = ('INSERT OR REPLACE INTO clients (client_id, default_redirect_uri, client_secret_hash) '
+               'VALUES (?, ?, ?)')
+SAVE_CODE = ('INSERT OR REPLACE INTO authorization_codes '
+             '(code, client_id, redirect_uri, state, used, created_at, expires_at) '
+             'VALUES (?, ?, ?, ?, 0, ?, ?)')
+FIND_CODE = ('SELECT redirect_uri, state, used, created_at, expires_at '
+             'FROM authorization_codes '
+             'WHERE code = ? AND client_id = ? AND expires_at > ?')
+COUNT_ALL_CODES = 'SELECT COUNT(*) FROM authorization_codes WHERE expires_at > ?'
+COUNT_CODES = ('SELECT COUNT(*) FROM authorization_codes '
+               'WHERE client_id = ? AND expires_at > ?')
+MARK_CODE_AS_USED = ('UPDATE authorization_codes SET used = 1 '
+                     'WHERE code = ? AND client_id = ?')
+REDEEM_CODE = ('UPDATE authorization_codes SET used = 1 '
+               'WHERE code = ? AND client_id = ? AND redirect_uri IS ? '
+               'AND used = 0 AND expires_at > ?')
+REAP_CODES = ('DELETE FROM authorization_codes WHERE code IN '
+              '(SELECT code FROM authorization_codes WHERE expires_at <= ? LIMIT ?)')
+SAVE_TOKEN = ('INSERT OR REPLACE INTO access_tokens (token, client_id, scope, expires_at) '
+              'VALUES (?, ?, ?, ?)')
+FIND_TOKEN = ('SELECT client_id, scope, expires_at FROM access_tokens '
+              'WHERE token = ? AND expires_at > ?')
+REAP_TOKENS = ('DELETE FROM access_tokens WHERE token IN '
+               '(SELECT token FROM access_tokens WHERE expires_at <= ? LIMIT ?)')
+DELETE_TOKEN = 'DELETE FROM access_tokens WHERE token = ?'
+REVOKE_TOKEN = 'INSERT OR REPLACE INTO revoked_access_tokens (token, expires_at) VALUES (?, ?)'
+FIND_REVOKED_TOKEN = 'SELECT 1 FROM revoked_access_tokens WHERE token = ? AND expires_at > ?'
+LIST_REVOKED_TOKENS = 'SELECT token FROM revoked_access_tokens WHERE expires_at > ?'
+REAP_REVOKED_TOKENS = ('DELETE FROM revoked_access_tokens WHERE token IN '
+                       '(SELECT token FROM revoked_access_tokens WHERE expires_at <= ? LIMIT ?)')
+SAVE_REFRESH_TOKEN = ('INSERT OR REPLACE INTO refresh_tokens '
+                      '(token_hash, client_id, scope, expires_at) VALUES (?, ?, ?, ?)')
+FIND_REFRESH_TOKEN = ('SELECT scope, expires_at FROM refresh_tokens '
+                      'WHERE token_hash = ? AND client_id = ? AND expires_at > ?')
+DELETE_REFRESH_TOKEN = 'DELETE FROM refresh_tokens WHERE token_hash = ? AND client_id = ?'
+REAP_REFRESH_TOKENS = ('DELETE FROM refresh_tokens WHERE token_hash IN '
+                       '(SELECT token_hash FROM refresh_tokens WHERE expires_at <= ? LIMIT ?)')
+
+
+class SQLiteDataBase(ClientListeners):
+    '''
+    Stores clients, authorization codes, access and refresh tokens on a
+    SQLite file, so they survive server restarts. Implements the same interface
+    as ``MemoryDataBase``.
+
+    The database is opened in WAL mode. Writes are not committed one by
+    one: a commit happens every ``commit_batch_size`` writes, and every
+    ``commit_interval`` milliseconds by a periodic task (see
+    ``periodic_tasks()``). Reads use the same connection, so they always
+    see the pending writes. Call ``flush()`` to commit right away.
+
+    Uncommitted writes hold SQLite's write lock, so a file should be used
+    by one server process only.
+
+    '''
+    # authorization_codes_count() is cheap, see metrics.collect()
+    counts_authorization_codes = True
+
+    def __init__(self, filename, authorization_code_lifetime=DEFAULT_AUTHORIZATION_CODE_LIFETIME,
+                 reap_interval=REAP_INTERVAL, reap_batch_size=REAP_BATCH_SIZE,
+                 commit_interval=COMMIT_INTERVAL, commit_batch_size=COMMIT_BATCH_SIZE):
+        self.client_listeners = []
+        self.filename = filename
+        self.authorization_code_lifetime = authorization_code_lifetime
+        self.reap_interval = reap_interval
+        self.reap_batch_size = reap_batch_size
+        self.commit_interval = commit_interval
+        self.commit_batch_size = commit_batch_size
+        self.pending_writes = 0
+        self.connection = sqlite3.connect(filename, cached_statements=32)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.migrate()
+        self.connection.commit()
+
+    def migrate(self):
+        '''
+        Adds the columns files created by older versions don't have
+        '''
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(clients)')]
+        if 'client_secret_hash' not in columns:
+            self.connection.execute('ALTER TABLE clients ADD COLUMN client_secret_hash TEXT')
+
+    def find_client(self, client_id):
+        row = self.connection.execute(FIND_CLIENT, (client_id,)).fetchone()
+        if row is None:
+            return None
+        return client_record(*row)
+
+    def all_clients(self):
+        return [(client_id, client_record(default_redirect_uri, secret_hash))
+                for client_id, default_redirect_uri, secret_hash
+                in self.connection.execute(ALL_CLIENTS)]
+
+    def save_new_client(self, client_id, default_redirect_uri, client_secret=None):
+        self.write(SAVE_CLIENT, (client_id, default_redirect_uri,
+                                 hash_client_secret(client_secret)))
+        self.notify_client_changed(client_id)
+
+    def save_new_authorization_code(self, auth_code, client_id, state, redirect_uri):
+        created_at = time.time()
+        self.write(SAVE_CODE, (auth_code, client_id, redirect_uri, state, created_at,
+                               created_at + self.authorization_code_lifetime))
+
+    def find_authorization_code(self, client_id, auth_code):
+        row = self.connection.execute(FIND_CODE, (auth_code, client_id, time.time())).fetchone()
+        if row is None:
+            return None
+        redirect_uri, state, used, created_at, expires_at = row
+        record = AuthorizationCode(auth_code, client_id, redirect_uri, state,
+                                   created_at=created_at, lifetime=expires_at - created_at)
+        record.used = bool(used)
+        return record
+
+    def redeem_authorization_code(self, client_id, auth_code, redirect_uri,
+                                  authenticating_code=None):
+        '''
+        Same as ``MemoryDataBase.redeem_authorization_code()``. The code is
+        consumed by a single conditional ``UPDATE``, the other queries only
+        run to tell why it failed
+
+        '''
+        if self.find_client(client_id) is None:
+            return RedeemResult.INVALID_CLIENT
+        if (authenticating_code is not None and
+                self.find_authorization_code(client_id, authenticating_code) is None):
+            return RedeemResult.INVALID_CLIENT
+        if self.write(REDEEM_CODE, (auth_code, client_id, redirect_uri, time.time())):
+            return RedeemResult.REDEEMED
+
+        record = self.find_authorization_code(client_id, auth_code)
+        if record is None:
+            return RedeemResult.INVALID_CODE
+        if record.redirect_uri != redirect_uri:
+            return RedeemResult.REDIRECT_URI_MISMATCH
+        return RedeemResult.ALREADY_USED
+
+    def client_has_authorization_code(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code) is not None
+
+    def authorization_codes_count(self):
+        return self.connection.execute(COUNT_ALL_CODES, (time.time(),)).fetchone()[0]
+
+    def client_authorization_codes_count(self, client_id):
+        return self.connection.execute(COUNT_CODES, (client_id, time.time())).fetchone()[0]
+
+    def mark_client_authorization_code_as_used(self, client_id, auth_code):
+        self.write(MARK_CODE_AS_USED, (auth_code, client_id))
+
+    def is_client_authorization_code_used(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).used
+
+    def client_has_redirect_uri_for_code(self, client_id, auth_code, redirect_uri):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri == redirect_uri
+
+    def get_state(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).state
+
+    def get_redirect_uri(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri
+
+    def reap_expired_authorization_codes(self, now=None, limit=None):
+        now = time.time() if now is None else now
+        limit = self.reap_batch_size if limit is None else limit
+        return self.write(REAP_CODES, (now, limit))
+
+    def save_access_token(self, access_token, client_id, expires_at, scope=None):
+        self.write(SAVE_TOKEN, (access_token, client_id, scope, expires_at))
+
+    def find_access_token(self, access_token):
+        row = self.connection.execute(FIND_TOKEN, (access_token, time.time())).fetchone()
+        if row is None:
+            return None
+        client_id, scope, expires_at = row
+        return AccessToken(access_token, client_id, expires_at, scope)
+
+    def revoke_access_token(self, access_token, expires_at):
+        self.write(DELETE_TOKEN, (access_token,))
+        self.write(REVOKE_TOKEN, (access_token, expires_at))
+
+    def is_access_token_revoked(self, access_token):
+        return self.connection.execute(FIND_REVOKED_TOKEN,
+                                       (access_token, time.time())).fetchone() is not None
+
+    def revoked_access_tokens(self):
+        # fetched at once, a cursor would be reset by the next commit
+        return [row[0] for row in self.connection.execute(LIST_REVOKED_TOKENS, (time.time(),))]
+
+    def reap_expired_access_tokens(self, now=None, limit=None):
+        now = time.time() if now is None else now
+        limit = self.reap_batch_size if limit is None else limit
+        return (self.write(REAP_TOKENS, (now, limit)) +
+                self.write(REAP_REVOKED_TOKENS, (now, limit)))
+
+    def save_refresh_token(self, token_hash, client_id, expires_at, scope=None):
+        self.write(SAVE_REFRESH_TOKEN, (token_hash, client_id, scope, expires_at))
+
+    def consume_refresh_token(self, token_hash, client_id):
+        row = self.connection.execute(FIND_REFRESH_TOKEN,
+                                      (token_hash, client_id, time.time())).fetchone()
+        if row is None or not self.write(DELETE_REFRESH_TOKEN, (token_hash, client_id)):
+            return None
+        scope, expires_at = row
+        return RefreshToken(token_hash, client_id, expires_at, scope)
+
+    def reap_expired_refresh_tokens(self, now=None, limit=None):
+        now = time.time() if now is None else now
+        limit = self.reap_batch_size if limit is None else limit
+        return self.write(REAP_REFRESH_TOKENS, (now, limit))
+
+    def write(self, statement, parameters):
+        '''
+        Executes a write statement, committing if ``commit_batch_size``
+        writes are pending. Returns the number of rows changed
+
+        '''
+        rowcount = self.connection.execute(statement, parameters).rowcount
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_batch_size:
+            self.flush()
+        return rowcount
+
+    def flush(self):
+        if self.pending_writes:
+            self.connection.commit()
+            self.pending_writes = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def periodic_tasks(self):
+        return [(self.reap_expired_authorization_codes, self.reap_interval),
+                (self.reap_expired_access_tokens, self.reap_interval),
+                (self.reap_expired_refresh_tokens, self.reap_interval),
+                (self.flush, self.commit_interval)]
@@ -0,0 +1,319 @@
+from __future__ import absolute_import
+
+import collections
+
+import tornado.ioloop
+
+from oauth2u.server import log
+
+from .base import RedeemResult, ClientListeners, DatabaseFull, client_record, hash_client_secret
+from .memory import AuthorizationCode, AccessToken, RefreshToken
+
+__all__ = 'WriteBehindDataBase',
+
+FLUSH_INTERVAL = 50         # milliseconds
+FLUSH_BATCH_SIZE = 100
+MAX_PENDING_WRITES = 10000
+MAX_WRITE_FAILURES = 5
+MAX_DEAD_LETTERS = 1000
+
+
+class WriteBehindDataBase(ClientListeners):
+    '''
+    Wraps a synchronous database delaying its writes (new clients,
+    authorization codes, access and refresh tokens, codes marked as used,
+    revoked tokens and consumed refresh tokens),
+    which are sent to the wrapped database in batches.
+
+    Writes are kept in a queue and in an overlay consulted by the reads,
+    so a value written is always read back, even before it's flushed.
+
+    The queue is flushed every ``flush_interval`` milliseconds by a
+    periodic task (see ``periodic_tasks()``), and as soon as possible on
+    the IOLoop when it reaches ``flush_batch_size`` writes. Each flush
+    sends at most ``flush_batch_size`` writes, and calls ``flush()`` on the
+    wrapped database if it has one (``SQLiteDataBase`` commits there).
+    A write the wrapped database fails to apply is logged and stays first
+    on the queue (and on the overlay), it's retried on the next flush.
+    After ``max_write_failures`` failures it's dropped, so it doesn't hold
+    back the writes behind it: it's logged and kept on ``dead_letters``
+    (the last ``MAX_DEAD_LETTERS`` of them) as ``(method, args)``.
+
+    If the wrapped database can't keep up and the queue reaches
+    ``max_pending_writes``, the write that found it full flushes one batch
+    before being queued, and raises ``DatabaseFull`` if that didn't make
+    room, so memory stays bounded and the IOLoop is never stalled for
+    more than a batch.
+
+    The queue and the overlay belong to the process, so a code saved or
+    redeemed on one process is not seen by the others until it's flushed:
+    it's never ``multiprocess_safe``, whatever the wrapped database is.
+
+    '''
+    multiprocess_safe = False
+
+    def __init__(self, database, flush_interval=FLUSH_INTERVAL,
+                 flush_batch_size=FLUSH_BATCH_SIZE, max_pending_writes=MAX_PENDING_WRITES,
+                 max_write_failures=MAX_WRITE_FAILURES):
+        self.client_listeners = []
+        self.database = database
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.max_pending_writes = max_pending_writes
+        self.max_write_failures = max_write_failures
+        self.write_failures = 0
+        self.dead_letters = collections.deque(maxlen=MAX_DEAD_LETTERS)
+        self.pending_writes = collections.deque()
+        self.pending_clients = {}
+        self.pending_codes = {}
+        self.pending_used_codes = set()
+        self.pending_access_tokens = {}
+        self.pending_revocations = {}
+        self.pending_refresh_tokens = {}
+        self.pending_consumed_refresh_tokens = set()
+        self.pending_keys = {}
+        self.flush_scheduled = False
+        self.counts_authorization_codes = getattr(database, 'counts_authorization_codes', False)
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+    @property
+    def authorization_code_lifetime(self):
+        return self.database.authorization_code_lifetime
+
+    @authorization_code_lifetime.setter
+    def authorization_code_lifetime(self, value):
+        self.database.authorization_code_lifetime = value
+
+    def find_client(self, client_id):
+        if client_id in self.pending_clients:
+            return self.pending_clients[client_id]
+        return self.database.find_client(client_id)
+
+    def all_clients(self):
+        clients = dict(self.database.all_clients())
+        clients.update(self.pending_clients)
+        return clients.items()
+
+    def save_new_client(self, client_id, default_redirect_uri, client_secret=None):
+        if client_secret is None:
+            # wrapped databases without client secrets keep working
+            self.enqueue('save_new_client', client_id, default_redirect_uri)
+        else:
+            self.enqueue('save_new_client', client_id, default_redirect_uri, client_secret)
+        self.pending_clients[client_id] = client_record(default_redirect_uri,
+                                                        hash_client_secret(client_secret))
+        self.notify_client_changed(client_id)
+
+    def save_new_authorization_code(self, auth_code, client_id, state, redirect_uri):
+        self.enqueue('save_new_authorization_code', auth_code, client_id, state, redirect_uri)
+        self.pending_codes[auth_code] = AuthorizationCode(
+            auth_code, client_id, redirect_uri, state,
+            lifetime=self.authorization_code_lifetime)
+        self.pending_used_codes.discard(auth_code)
+
+    def find_authorization_code(self, client_id, auth_code):
+        record = self.pending_codes.get(auth_code)
+        if record is None:
+            record = self.database.find_authorization_code(client_id, auth_code)
+        elif record.client_id != client_id or record.is_expired():
+            record = None
+        if record is not None and auth_code in self.pending_used_codes:
+            record.used = True
+        return record
+
+    def mark_client_authorization_code_as_used(self, client_id, auth_code):
+        self.enqueue('mark_client_authorization_code_as_used', client_id, auth_code)
+        self.pending_used_codes.add(auth_code)
+
+    def redeem_authorization_code(self, client_id, auth_code, redirect_uri,
+                                  authenticating_code=None):
+        if self.find_client(client_id) is None:
+            return RedeemResult.INVALID_CLIENT
+        if (authenticating_code is not None and
+                self.find_authorization_code(client_id, authenticating_code) is None):
+            return RedeemResult.INVALID_CLIENT
+        record = self.find_authorization_code(client_id, auth_code)
+        if record is None:
+            return RedeemResult.INVALID_CODE
+        if record.redirect_uri != redirect_uri:
+            return RedeemResult.REDIRECT_URI_MISMATCH
+        if record.used:
+            return RedeemResult.ALREADY_USED
+        self.mark_client_authorization_code_as_used(client_id, auth_code)
+        return RedeemResult.REDEEMED
+
+    def client_has_authorization_code(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code) is not None
+
+    def authorization_codes_count(self):
+        '''
+        Codes on the wrapped database plus the ones still queued, without
+        flushing the queue
+        '''
+        return self.database.authorization_codes_count() + len(self.pending_codes)
+
+    def client_authorization_codes_count(self, client_id):
+        self.flush_all()
+        return self.database.client_authorization_codes_count(client_id)
+
+    def is_client_authorization_code_used(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).used
+
+    def client_has_redirect_uri_for_code(self, client_id, auth_code, redirect_uri):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri == redirect_uri
+
+    def get_state(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).state
+
+    def get_redirect_uri(self, client_id, auth_code):
+        return self.find_authorization_code(client_id, auth_code).redirect_uri
+
+    def save_access_token(self, access_token, client_id, expires_at, scope=None):
+        self.enqueue('save_access_token', access_token, client_id, expires_at, scope)
+        self.pending_access_tokens[access_token] = AccessToken(access_token, client_id,
+                                                               expires_at, scope)
+
+    def find_access_token(self, access_token):
+        if access_token in self.pending_revocations:
+            return None
+        record = self.pending_access_tokens.get(access_token)
+        if record is None:
+            return self.database.find_access_token(access_token)
+        if record.is_expired():
+            return None
+        return record
+
+    def revoke_access_token(self, access_token, expires_at):
+        self.enqueue('revoke_access_token', access_token, expires_at)
+        self.pending_revocations[access_token] = expires_at
+
+    def is_access_token_revoked(self, access_token):
+        if access_token in self.pending_revocations:
+            return True
+        return self.database.is_access_token_revoked(access_token)
+
+    def revoked_access_tokens(self):
+        return list(self.pending_revocations) + list(self.database.revoked_access_tokens())
+
+    def save_refresh_token(self, token_hash, client_id, expires_at, scope=None):
+        self.enqueue('save_refresh_token', token_hash, client_id, expires_at, scope)
+        self.pending_refresh_tokens[token_hash] = RefreshToken(token_hash, client_id,
+                                                               expires_at, scope)
+
+    def consume_refresh_token(self, token_hash, client_id):
+        if token_hash in self.pending_consumed_refresh_tokens:
+            return None
+        record = self.pending_refresh_tokens.get(token_hash)
+        if record is None:
+            # not pending, the wrapped database consumes it right away
+            return self.database.consume_refresh_token(token_hash, client_id)
+        if record.client_id != client_id or record.is_expired():
+            return None
+        self.enqueue('consume_refresh_token', token_hash, client_id)
+        self.pending_consumed_refresh_tokens.add(token_hash)
+        return record
+
+    def enqueue(self, method, *args):
+        if len(self.pending_writes) >= self.max_pending_writes:
+            self.flush()
+            if len(self.pending_writes) >= self.max_pending_writes:
+                raise DatabaseFull('{0} writes pending, the wrapped database '
+                                   'is not keeping up'.format(len(self.pending_writes)))
+        key = write_key(method, args)
+        self.pending_writes.append((method, args))
+        self.pending_keys[key] = self.pending_keys.get(key, 0) + 1
+        if len(self.pending_writes) >= self.flush_batch_size:
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            tornado.ioloop.IOLoop.current().add_callback(self.flush)
+
+    def flush(self):
+        '''
+        Sends at most ``flush_batch_size`` pending writes to the wrapped
+        database, stopping at the first one it fails to apply (unless it's
+        dropped). Returns how many were taken off the queue
+
+        '''
+        self.flush_scheduled = False
+        flushed = dropped = 0
+        failed = False
+        while self.pending_writes and flushed + dropped < self.flush_batch_size:
+            method, args = self.pending_writes[0]
+            try:
+                getattr(self.database, method)(*args)
+            except Exception:
+                self.write_failures += 1
+                log.exception('Write-behind %s failed (%s of %s times), %s writes pending',
+                              method, self.write_failures, self.max_write_failures,
+                              len(self.pending_writes))
+                if self.write_failures < self.max_write_failures:
+                    failed = True
+                    break
+                log.error('Write-behind %s dropped, kept on dead_letters', method)
+                self.dead_letters.append((method, args))
+                dropped += 1
+            else:
+                flushed += 1
+            self.write_failures = 0
+            self.pending_writes.popleft()
+            self.forget_flushed_write(method, args)
+        if flushed and hasattr(self.database, 'flush'):
+            self.database.flush()
+        if not failed and len(self.pending_writes) >= self.flush_batch_size:
+            self.schedule_flush()
+        return flushed + dropped
+
+    def flush_all(self):
+        '''
+        Flushes until the queue is empty, or the wrapped database fails
+        '''
+        while self.pending_writes and self.flush():
+            pass
+
+    def forget_flushed_write(self, method, args):
+        # values stay in the overlay while there is a newer write
+        # for them still in the queue
+        key = write_key(method, args)
+        self.pending_keys[key] -= 1
+        if self.pending_keys[key]:
+            return
+        del self.pending_keys[key]
+        if method == 'save_new_client':
+            self.pending_clients.pop(key[1], None)
+        elif method == 'save_new_authorization_code':
+            self.pending_codes.pop(key[1], None)
+        elif method == 'mark_client_authorization_code_as_used':
+            self.pending_used_codes.discard(key[1])
+        elif method == 'save_access_token':
+            self.pending_access_tokens.pop(key[1], None)
+        elif method == 'revoke_access_token':
+            self.pending_revocations.pop(key[1], None)
+        elif method == 'save_refresh_token':
+            self.pending_refresh_tokens.pop(key[1], None)
+        elif method == 'consume_refresh_token':
+            self.pending_consumed_refresh_tokens.discard(key[1])
+
+    def close(self):
+        self.flush_all()
+        if hasattr(self.database, 'close'):
+            self.database.close()
+
+    def periodic_tasks(self):
+        tasks = list(getattr(self.database, 'periodic_tasks', list)())
+        return tasks + [(self.flush, self.flush_interval)]
+
+
+def write_key(method, args):
+    '''
+    Identifies what a queued write changes: the client id for clients,
+    the code for authorization codes, the token (or its hash) for access
+    and refresh tokens
+    '''
+    if method == 'mark_client_authorization_code_as_used':
+        return method, args[1]
+    return method, args[0]
@@ -0,0 +1,112 @@
+'''
+Catalog of the errors returned by the default handlers, each one with its
+JSON body and query string computed once, so sending an error (most of
+the responses during an attack) is just writing a string.
+
+Handlers raise them like any response body:
+
+    handler.raise_http_400(errors.INVALID_CODE)
+
+'''
+import urllib
+
+import tornado.escape
+
+__all__ = ('OAuthError', 'find', 'missing_parameter', 'invalid_parameter', 'missing_header',
+           'invalid_header', 'invalid_header_prefix', 'unsupported_grant_type')
+
+JSON_CONTENT_TYPE = 'application/json; charset=UTF-8'
+MAX_FORMATTED_ERRORS = 1000
+
+
+class OAuthError(dict):
+    '''
+    ``{'error': ..., 'error_description': ...}`` dict, with its JSON
+    serialization on ``json`` and its query string on ``query``.
+
+    Errors are shared by all requests, they must not be changed.
+
+    '''
+
+    def __init__(self, error, error_description):
+        super(OAuthError, self).__init__(error=error, error_description=error_description)
+        self.json = tornado.escape.json_encode(self)
+        self.query = urllib.urlencode(self)
+
+
+formatted_errors = {}
+
+def find(error, error_description):
+    '''
+    Returns the ``OAuthError`` for ``error`` and ``error_description``,
+    created on the first call and reused after
+    '''
+    key = (error, error_description)
+    oauth_error = formatted_errors.get(key)
+    if oauth_error is None:
+        if len(formatted_errors) >= MAX_FORMATTED_ERRORS:
+            formatted_errors.clear()
+        oauth_error = formatted_errors[key] = OAuthError(error, error_description)
+    return oauth_error
+
+
+def missing_parameter(name):
+    return find('invalid_request', u'Parameter {0} is required'.format(name))
+
+
+def invalid_parameter(name, expected_value):
+    return find('invalid_request', u'Parameter {0} should be {1}'.format(name, expected_value))
+
+
+def parameter_too_long(name, max_length):
+    return find('invalid_request', u'Parameter {0} should have at most {1} bytes'.format(name, max_length))
+
+
+def missing_header(name):
+    return find('invalid_request', u'Header {0} is required'.format(name))
+
+
+def invalid_header(name, expected_value):
+    return find('invalid_request', u'Header {0} should be {1}'.format(name, expected_value))
+
+
+def invalid_header_prefix(name, startswith):
+    return find('invalid_request', u'Header {0} should start with "{1}"'.format(name, startswith))
+
+
+def unsupported_grant_type(grant_types):
+    return find('unsupported_grant_type', u'Supported grant_type: {0}'.format(', '.join(grant_types)))
+
+
+INVALID_CLIENT = OAuthError(
+    'invalid_client', 'Invalid client_id or code on Authorization header')
+INVALID_CLIENT_SECRET = OAuthError(
+    'invalid_client', 'Invalid client_id or client_secret on Authorization header')
+INVALID_AUTHORIZATION_HEADER = OAuthError(
+    'invalid_request', 'Base 64 from Authorization header could not be decoded')
+UNSUPPORTED_RESPONSE_TYPE = OAuthError(
+    'unsupported_response_type', 'Supported response_type: code')
+
+# access token errors
+INVALID_CODE = OAuthError('invalid_grant', 'Invalid code for this client')
+REDIRECT_URI_MISMATCH = OAuthError('invalid_grant', 'redirect_uri does not match')
+CODE_ALREADY_USED = OAuthError('invalid_grant', 'Authorization grant already used')
+INVALID_REFRESH_TOKEN = OAuthError('invalid_grant', 'Invalid refresh token for this client')
+
+# revocation errors
+TOKEN_OF_OTHER_CLIENT = OAuthError('unauthorized_client', 'The token was not issued to this client')
+
+# authorization errors, sent on the redirect to redirect_uri
+ACCESS_DENIED = OAuthError(
+    'access_denied', 'The resource owner or authorization server denied the request')
+UNAUTHORIZED_CLIENT = OAuthError(
+    'unauthorized_client',
+    'The client is not authorized to request an authorization code using this method')
+TEMPORARILY_UNAVAILABLE = OAuthError(
+    'temporarily_unavailable', 'The authorization server is currently unable to handle the request')
+SERVER_ERROR = OAuthError(
+    'server_error',
+    'The authorization server encountered an unexpected condition which prevented it '
+    'from fulfilling the request')
+INVALID_SCOPE = OAuthError(
+    'invalid_scope', 'The requested scope is invalid, unknown, or malformed')
@@ -0,0 +1,190 @@
+'''
+Grant types accepted by ``AccessTokenHandler``, keyed by ``grant_type``.
+
+Each grant declares the arguments and headers it requires, so a request
+is only validated for what its grant needs, and validates the request on
+``validate()``. New grants subclass ``Grant`` and are registered with
+``register``, like plugins:
+
+    @grants.register
+    class PasswordGrant(grants.Grant):
+        grant_type = 'password'
+        required_arguments = ('username', 'password')
+
+        @tornado.gen.coroutine
+        def validate(self, handler):
+            ...
+
+Required arguments are set on the handler as attributes with the same
+name (``handler.code``, ``handler.redirect_uri``...).
+
+'''
+import tornado.gen
+
+from oauth2u.server import errors
+from oauth2u.server.database import RedeemResult, verify_client_secret
+from oauth2u.server.stats import LatencyCounter
+import oauth2u.tokens
+
+__all__ = ('Grant', 'LatencyCounter', 'register', 'find', 'unsupported_error', 'items',
+           'enabled_grant_types', 'stats', 'AuthorizationCodeGrant', 'ClientCredentialsGrant', 'RefreshTokenGrant')
+
+# (name, expected_value, startswith), as given to require_header()
+BASIC_AUTHORIZATION = ('authorization', None, 'Basic ')
+
+GRANTS = {}
+
+def register(grant_class):
+    GRANTS[grant_class.grant_type] = grant_class()
+    return grant_class
+
+
+def find(grant_type, application=None):
+    '''
+    Returns the grant registered for ``grant_type`` if it's enabled on
+    ``application``, ``None`` otherwise
+    '''
+    grant = GRANTS.get(grant_type)
+    if grant is None or not grant.is_enabled(application):
+        return None
+    return grant
+
+
+def unsupported_error(application=None):
+    '''
+    ``unsupported_grant_type`` error for a ``grant_type`` ``find()`` can't
+    return, listing the grants enabled on ``application``
+    '''
+    return errors.unsupported_grant_type(enabled_grant_types(application))
+
+
+def items():
+    return GRANTS.iteritems()
+
+
+def enabled_grant_types(application=None):
+    return sorted(grant_type for grant_type, grant in items() if grant.is_enabled(application))
+
+
+def stats():
+    '''
+    Latency counters of each grant, by ``grant_type``
+    '''
+    return dict((grant_type, grant.latency) for grant_type, grant in items())
+
+
+class Grant(object):
+    '''
+    Base class for grants. ``validate()`` returns a Future, and raises
+    an HTTP error through the handler if the request is not valid
+    '''
+    grant_type = None
+    required_arguments = ()
+    required_headers = (BASIC_AUTHORIZATION,)
+    issues_refresh_token = True
+
+    def __init__(self):
+        self.latency = LatencyCounter()
+
+    def is_enabled(self, application):
+        return True
+
+    def validate(self, handler):
+        raise NotImplementedError
+
+
+@register
+class AuthorizationCodeGrant(Grant):
+    '''
+    http://tools.ietf.org/html/draft-ietf-oauth-v2-22#section-4.1.3
+    '''
+    grant_type = 'authorization_code'
+    required_arguments = ('code', 'redirect_uri')
+
+    @tornado.gen.coroutine
+    def validate(self, handler):
+        with handler.timing('database'):
+            result = yield handler.application.asynchronous_database.redeem_authorization_code(
+                handler.client_id, handler.code, handler.redirect_uri,
+                authenticating_code=handler.code_from_header)
+
+        if result == RedeemResult.INVALID_CLIENT:
+            handler.raise_http_401(errors.INVALID_CLIENT)
+
+        if result == RedeemResult.INVALID_CODE:
+            handler.raise_http_400(errors.INVALID_CODE)
+
+        if result == RedeemResult.REDIRECT_URI_MISMATCH:
+            handler.raise_http_400(errors.REDIRECT_URI_MISMATCH)
+
+        if result == RedeemResult.ALREADY_USED:
+            handler.raise_http_400(errors.CODE_ALREADY_USED)
+
+        yield handler.call_plugin('access-token-validation')
+
+
+@register
+class ClientCredentialsGrant(Grant):
+    '''
+    http://tools.ietf.org/html/draft-ietf-oauth-v2-22#section-4.4
+
+    The Authorization header has the client secret instead of a code, and
+    no code is stored or looked up. Headers with a valid secret are kept
+    on ``application.client_credentials_cache``, so the next requests
+    with the same header skip the client lookup and the secret check
+    '''
+    grant_type = 'client_credentials'
+    issues_refresh_token = False
+
+    @tornado.gen.coroutine
+    def validate(self, handler):
+        if handler.authenticated_client is None:
+            with handler.timing('database'):
+                client = yield handler.find_client(handler.client_id)
+            if not verify_client_secret(client, handler.code_from_header):
+                handler.raise_http_401(errors.INVALID_CLIENT_SECRET)
+            handler.application.client_credentials_cache.set(
+                handler.request.headers.get('Authorization'),
+                (handler.client_id, handler.code_from_header, client))
+            handler.authenticated_client = client
+
+        yield handler.call_plugin('access-token-validation')
+
+
+@register
+class RefreshTokenGrant(Grant):
+    '''
+    http://tools.ietf.org/html/draft-ietf-oauth-v2-22#section-6
+
+    Only enabled if the server issues refresh tokens. The client is
+    authenticated with its secret on the Authorization header, if it has
+    one. The refresh token is consumed, a new one is issued with the
+    access token
+    '''
+    grant_type = 'refresh_token'
+    required_arguments = ('refresh_token',)
+
+    def is_enabled(self, application):
+        return bool(getattr(application, 'refresh_token_lifetime', None))
+
+    @tornado.gen.coroutine
+    def validate(self, handler):
+        if handler.authenticated_client is None:
+            with handler.timing('database'):
+                client = yield handler.find_client(handler.client_id)
+            if client is None or ('secret_hash' in client and
+                                  not verify_client_secret(client, handler.code_from_header)):
+                handler.raise_http_401(errors.INVALID_CLIENT_SECRET)
+            if 'secret_hash' in client:
+                handler.application.client_credentials_cache.set(
+                    handler.request.headers.get('Authorization'),
+                    (handler.client_id, handler.code_from_header, client))
+            handler.authenticated_client = client
+
+        with handler.timing('database'):
+            record = yield handler.application.asynchronous_database.consume_refresh_token(
+                oauth2u.tokens.hash_token(handler.refresh_token), handler.client_id)
+        if record is None:
+            handler.raise_http_400(errors.INVALID_REFRESH_TOKEN)
+
+        yield handler.call_plugin('access-token-validation')
@@ -2,3 +2,6 @@ from __future__ import absolute_import
 
 from .register import *
 from .defaults import *
+from .introspection import *
+from .revocation import *
+from .metrics import *
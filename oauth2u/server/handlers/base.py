@@ -1,6 +1,19 @@
+import base64
+import contextlib
+import re
+import time
+
 import tornado
+import tornado.gen
+
+from oauth2u.server import errors, log, metrics, plugins
+from oauth2u.server.database import verify_client_secret
 
 class BaseRequestHandler(tornado.web.RequestHandler):
+    # OAuth error code of the response, if any, for the access log
+    error_code = None
+    # seconds spent on each phase of the request, see timing()
+    phase_times = None
 
     def require_argument(self, name, expected_value=None):
         value = self.get_argument(name, None)
@@ -9,15 +22,12 @@ class BaseRequestHandler(tornado.web.RequestHandler):
 
     def validate_argument(self, name, value, expected_value):
         if value is None:
-            error_description = u'Parameter {0} is required'.format(name)
+            error = errors.missing_parameter(name)
         elif expected_value and value != expected_value:
-            error_description = u'Parameter {0} should be {1}'.format(name, expected_value)
+            error = errors.invalid_parameter(name, expected_value)
         else:
             return
 
-        error = {'error': 'invalid_request',
-                 'error_description': error_description}
-
         self.raise_http_invalid_argument_error(name, error)
 
     def raise_http_invalid_argument_error(self, parameter, error):
@@ -26,20 +36,105 @@ class BaseRequestHandler(tornado.web.RequestHandler):
     def require_header(self, name, expected_value=None, startswith=None):
         value = self.request.headers.get(name)
         if value is None:
-            self.raise_http_400({'error': 'invalid_request',
-                                 'error_description': u'Header {0} is required'.format(name)})
+            self.raise_http_400(errors.missing_header(name))
 
         if expected_value and value != expected_value:
-            self.raise_http_400({'error': 'invalid_request',
-                                 'error_description': u'Header {0} should be {1}'.format(name, expected_value)})
+            self.raise_http_400(errors.invalid_header(name, expected_value))
 
         if startswith and not value.startswith(startswith):
-            self.raise_http_400({'error': 'invalid_request',
-                                 'error_description': u'Header {0} should start with "{1}"'.format(name, startswith)})
+            self.raise_http_400(errors.invalid_header_prefix(name, startswith))
 
         return value
 
+    def parse_basic_authorization(self):
+        '''
+        Tuple with the user and password of the Basic Authorization
+        header (the ``client_id`` and its secret, or a code)
+        '''
+        digest = re.sub(r'^Basic ', '', self.request.headers.get('Authorization'))
+        try:
+            digest = base64.b64decode(digest)
+        except TypeError:
+            self.raise_http_400(errors.INVALID_AUTHORIZATION_HEADER)
+        if ':' not in digest:
+            self.raise_http_400(errors.INVALID_AUTHORIZATION_HEADER)
+        return tuple(digest.split(':', 1))
+
+    @tornado.gen.coroutine
+    def find_client(self, client_id):
+        '''
+        Finds the client on ``application.client_registry``, or on the
+        database if the server has no registry
+        '''
+        registry = self.application.client_registry
+        if registry is not None:
+            raise tornado.gen.Return(registry.find(client_id))
+        client = yield self.application.asynchronous_database.find_client(client_id)
+        raise tornado.gen.Return(client)
+
+    @tornado.gen.coroutine
+    def authenticate_client(self):
+        '''
+        Authenticates the client with a Basic Authorization header, with
+        its ``client_id`` and secret (empty for clients without a secret),
+        setting ``client_id``. Answers 401 if it's unknown or the secret
+        doesn't match. Headers already authenticated are found on
+        ``application.client_credentials_cache``
+        '''
+        header = self.require_header('authorization', startswith='Basic ')
+        cached = self.application.client_credentials_cache.get(header)
+        if cached is not None:
+            self.client_id = cached[0]
+            return
+        self.client_id, client_secret = self.parse_basic_authorization()
+        client = yield self.find_client(self.client_id)
+        if client is None:
+            self.raise_http_401(errors.INVALID_CLIENT_SECRET)
+        if 'secret_hash' in client and not verify_client_secret(client, client_secret):
+            self.raise_http_401(errors.INVALID_CLIENT_SECRET)
+        if 'secret_hash' in client:
+            # only clients with a secret, like the client_credentials grant
+            self.application.client_credentials_cache.set(
+                header, (self.client_id, client_secret, client))
+
+    @contextlib.contextmanager
+    def timing(self, phase):
+        '''
+        Adds the time spent in the ``with`` block to ``phase_times[phase]``
+        '''
+        started = time.time()
+        try:
+            yield
+        finally:
+            if self.phase_times is None:
+                self.phase_times = {}
+            self.phase_times[phase] = self.phase_times.get(phase, 0.0) + time.time() - started
+
+    def on_finish(self):
+        metrics.record_request(self)
+
+    @tornado.gen.coroutine
+    def call_plugin(self, name, *args):
+        '''
+        Calls the plugin ``name`` with this handler and ``args``, waiting
+        for it if it's asynchronous. Returns a Future with False if there
+        is no plugin, it was ignored or it timed out and
+        ``plugin_timed_out()`` didn't raise
+        '''
+        called = False
+        try:
+            with self.timing('plugins'):
+                called = yield plugins.call_async(name, self, *args)
+        except plugins.PluginTimeout as error:
+            self.plugin_timed_out(name, error)
+        raise tornado.gen.Return(called)
+
+    def plugin_timed_out(self, name, error):
+        log.error('%s', error)
+        self.raise_http_error(503, errors.TEMPORARILY_UNAVAILABLE)
+
     def raise_http_302(self, query_parameters):
+        self.error_code = query_parameters.get('error')
         headers = {'Location': self.build_redirect_uri(query_parameters)}
         self.raise_http_error(302, headers=headers)
 
@@ -51,6 +146,8 @@ class BaseRequestHandler(tornado.web.RequestHandler):
                               {'WWW-Authenticate': 'Basic realm="OAuth 2.0 Secure Area"'})
 
     def raise_http_error(self, status, response_body=None, headers=None):
+        if isinstance(response_body, dict):
+            self.error_code = response_body.get('error')
         error = tornado.web.HTTPError(status, '')
         error.response_body = response_body
         error.headers = headers or {}
@@ -59,8 +156,13 @@ class BaseRequestHandler(tornado.web.RequestHandler):
     def get_error_html(self, status_code, **kwargs):
         ''' Called by tornado to fill error response body '''
         exception = kwargs.pop('exception', None)
-        if hasattr(exception, 'response_body') and exception.response_body:
-            self.write(exception.response_body)
+        response_body = getattr(exception, 'response_body', None)
+        if isinstance(response_body, errors.OAuthError):
+            self.error_code = response_body['error']
+            self.set_header('Content-Type', errors.JSON_CONTENT_TYPE)
+            self.write(response_body.json)
+        elif response_body:
+            self.write(response_body)
 
         if hasattr(exception, 'headers'):
             for name, value in exception.headers.items():
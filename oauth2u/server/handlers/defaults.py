@@ -1,13 +1,14 @@
 # coding: utf-8
 import urllib
 import urlparse
-import base64
 import datetime
-import re
+import time
 
 import tornado
+import tornado.gen
 
-from oauth2u.server import plugins
+from oauth2u.server import cache, errors, grants, log, metrics, plugins
+from oauth2u.server.database import AuthorizationCode
 from oauth2u.server.handlers.register import register
 import oauth2u.tokens
 
@@ -39,35 +40,57 @@ class AuthorizationHandler(BaseRequestHandler):
         self.state = None
         self.client_id = None
         self.redirect_uri = None
+        self.authorization_code = None
 
+    @tornado.gen.coroutine
     def get(self):
-        self.load_parameters()
+        with self.timing('load_parameters'):
+            yield self.load_parameters()
         self.verify_response_type()
         self.create_authorization_token()
-        self.save_client_tokens()
-        if not plugins.call('authorization-GET', self):
-            self.redirect_access_granted(self.client_id, self.code)
-
+        with self.timing('database'):
+            yield self.save_client_tokens()
+        try:
+            with self.timing('plugins'):
+                called = yield plugins.call_async('authorization-GET', self)
+        except plugins.PluginTimeout as error:
+            log.error('%s', error)
+            yield self.redirect_temporarily_unavailable(self.client_id, self.code)
+            return
+        if not called:
+            yield self.redirect_access_granted(self.client_id, self.code)
+
+    @tornado.gen.coroutine
     def post(self):
-        if not plugins.call('authorization-POST', self):
+        called = yield self.call_plugin('authorization-POST')
+        if not called:
             self.raise_http_error(405)
 
     def verify_response_type(self):
         value = self.require_argument('response_type')
         if value not in self.supported_response_types:
-            error = {
-                'error': 'unsupported_response_type',
-                'error_description': 'Supported response_type: code'
-                }
-            self.raise_http_invalid_argument_error('response_type', error)
+            self.raise_http_invalid_argument_error('response_type', errors.UNSUPPORTED_RESPONSE_TYPE)
 
+    @tornado.gen.coroutine
     def load_parameters(self):
         self.state = self.get_argument('state', None)
         self.redirect_uri = self.require_argument('redirect_uri')
         self.client_id = self.require_argument('client_id')
-        if not self.application.database.find_client(self.client_id):
-            self.raise_http_401({'error': 'invalid_client',
-                                 'error_description': 'Invalid client_id or code on Authorization header'})
+        self.verify_lengths()
+        client = yield self.find_client(self.client_id)
+        if not client:
+            self.raise_http_401(errors.INVALID_CLIENT)
+
+    def verify_lengths(self):
+        '''
+        Refuses parameters longer than the database can store, see
+        ``max_lengths`` of ``SharedMemoryDataBase``
+        '''
+        max_lengths = getattr(self.application.database, 'max_lengths', None) or {}
+        for name, max_length in sorted(max_lengths.items()):
+            value = getattr(self, name)
+            if value is not None and len(value.encode('utf-8')) > max_length:
+                self.raise_http_400(errors.parameter_too_long(name, max_length))
 
     def raise_http_invalid_argument_error(self, parameter, error):
         if parameter in ['redirect_uri', 'client_id']:
@@ -78,69 +101,70 @@ class AuthorizationHandler(BaseRequestHandler):
     def create_authorization_token(self):
         self.code = oauth2u.tokens.generate_authorization_code()
 
+    @tornado.gen.coroutine
     def redirect_access_granted(self, client_id, code):
         '''
-        Redirects the user back to ``redirect_uri`` with grant code
+        Redirects the user back to ``redirect_uri`` with grant code.
+
+        The redirect helpers look the code up on the database if it's not
+        the one just saved, so they return a Future: plugins should return
+        (or yield) it
         '''
         params = {'code': code }
-        state = self.application.database.get_state(client_id,code)
-        if state != None:
-            params['state'] = state
-        
-        self.redirect_to_redirect_uri_with_params(params, client_id, code)
-    
+        authorization_code = yield self.find_authorization_code(client_id, code)
+        if authorization_code.state != None:
+            params['state'] = authorization_code.state
+
+        yield self.redirect_to_redirect_uri_with_params(params, client_id, code)
+
     def redirect_access_denied(self, client_id, code):
         '''
         Redirects the user back to ``redirect_uri`` with access_denied error
         '''
-        params = {
-            'error': 'access_denied',
-            'error_description': 'The resource owner or authorization server denied the request'
-            }
-        self.redirect_to_redirect_uri_with_params(params, client_id, code)
+        return self.redirect_to_redirect_uri_with_params(errors.ACCESS_DENIED, client_id, code)
 
     def redirect_unauthorized_client(self, client_id, code):
-        params = {
-            'error': 'unauthorized_client',
-            'error_description': 'The client is not authorized to request an authorization code using this method'
-        }
-        self.redirect_to_redirect_uri_with_params(params, client_id, code)
+        return self.redirect_to_redirect_uri_with_params(errors.UNAUTHORIZED_CLIENT, client_id, code)
 
     def redirect_temporarily_unavailable(self, client_id, code):
-        params = {
-            'error': 'temporarily_unavailable',
-            'error_description': 'The authorization server is currently unable to handle the request'
-            }
-        self.redirect_to_redirect_uri_with_params(params, client_id, code)
+        return self.redirect_to_redirect_uri_with_params(errors.TEMPORARILY_UNAVAILABLE, client_id, code)
 
     def redirect_server_error(self, client_id, code):
-        params = {
-            'error': 'server_error',
-            'error_description': 'The authorization server encountered an unexpected condition which prevented it from fulfilling the request',
-            }
-        self.redirect_to_redirect_uri_with_params(params, client_id, code)
+        return self.redirect_to_redirect_uri_with_params(errors.SERVER_ERROR, client_id, code)
 
     def redirect_invalid_scope(self, client_id, code):
-        params = {
-            'error': 'invalid_scope',
-            'error_description': 'The requested scope is invalid, unknown, or malformed'
-            }
-        self.redirect_to_redirect_uri_with_params(params, client_id, code)
+        return self.redirect_to_redirect_uri_with_params(errors.INVALID_SCOPE, client_id, code)
 
+    @tornado.gen.coroutine
     def redirect_to_redirect_uri_with_params(self, params, client_id, code):
-        redirect_uri = self.application.database.get_redirect_uri(client_id, code)
-        url = self.build_redirect_uri(params, redirect_uri)
+        self.error_code = params.get('error')
+        authorization_code = yield self.find_authorization_code(client_id, code)
+        url = self.build_redirect_uri(params, authorization_code.redirect_uri)
         self.redirect(url)
 
+    @tornado.gen.coroutine
+    def find_authorization_code(self, client_id, code):
+        if self.authorization_code is None or self.authorization_code.code != code:
+            with self.timing('database'):
+                self.authorization_code = yield self.application.asynchronous_database.find_authorization_code(
+                    client_id, code)
+        raise tornado.gen.Return(self.authorization_code)
+
     def build_redirect_uri(self, params, base_url=None):
         return add_query_to_url(base_url or self.redirect_uri, params)
 
+    @tornado.gen.coroutine
     def save_client_tokens(self):
-        self.application.database.save_new_authorization_code(
+        yield self.application.asynchronous_database.save_new_authorization_code(
             self.code,
             self.client_id,
             self.state,
-            redirect_uri=self.redirect_uri)    
+            redirect_uri=self.redirect_uri)
+        # keep what was just saved, so redirecting back with this code
+        # doesn't need to query the database again
+        self.authorization_code = AuthorizationCode(self.code, self.client_id,
+                                                    self.redirect_uri, self.state)
+        metrics.AUTHORIZATION_CODES_ISSUED.inc()
 
 
 @register(r'/access-token')
@@ -149,89 +173,163 @@ class AccessTokenHandler(BaseRequestHandler):
     Handler for the Access Token Request defined in
     http://tools.ietf.org/html/draft-ietf-oauth-v2-22#section-4.1.3
 
+    Each ``grant_type`` is handled by a grant from ``oauth2u.server.grants``,
+    which declares the arguments and headers it requires and validates
+    the request. Refresh tokens, if the server issues them
+    (``refresh_token_lifetime``), are rotated: each one is used once and
+    replaced by a new one.
+
     '''
 
     required_content_type = "application/x-www-form-urlencoded;charset=UTF-8"
+    expires_in = 3600
 
+    def initialize(self, **kwargs):
+        self.grant = None
+        self.grant_type = None
+        self.code = None
+        self.redirect_uri = None
+        self.refresh_token = None
+        self.authenticated_client = None
+
+    @tornado.gen.coroutine
     def post(self):
+        self.grant = grants.find(self.get_argument('grant_type', None), self.application)
         self.validate_headers()
         self.load_arguments()
-        self.parse_authorization_header()
-        self.validate_client_authorization()
-        self.build_response()
-        self.mark_client_authorization_code_as_used()
+        started = time.time()
+        succeeded = False
+        try:
+            with self.timing('validate_client_authorization'):
+                if grants.BASIC_AUTHORIZATION in self.grant.required_headers:
+                    self.parse_authorization_header()
+                yield self.grant.validate(self)
+            with self.timing('build_response'):
+                yield self.build_response()
+            succeeded = True
+        finally:
+            self.grant.latency.record(time.time() - started, succeeded)
 
     def validate_headers(self):
         self.require_header('content-type', self.required_content_type)
-        self.require_header('authorization', startswith='Basic ')
+        required_headers = self.grant.required_headers if self.grant else (grants.BASIC_AUTHORIZATION,)
+        for header in required_headers:
+            self.require_header(*header)
 
     def load_arguments(self):
-        self.require_argument('grant_type', 'authorization_code')
-        self.code = self.require_argument('code')
-        self.redirect_uri = self.require_argument('redirect_uri')
+        '''
+        Sets the arguments the grant requires as attributes
+        '''
+        self.grant_type = self.require_argument('grant_type')
+        if self.grant is None:
+            self.raise_http_400(grants.unsupported_error(self.application))
+        for name in self.grant.required_arguments:
+            setattr(self, name, self.require_argument(name))
 
     def parse_authorization_header(self):
+        '''
+        Sets ``client_id`` and ``code_from_header``. Headers already
+        authenticated are found on ``application.client_credentials_cache``,
+        with the client record set on ``authenticated_client``
+        '''
         digest = self.request.headers.get('Authorization')
-        digest = re.sub(r'^Basic ', '', digest)
-        try:
-            digest = base64.b64decode(digest)
-        except TypeError:
-            self.raise_http_400({'error': 'invalid_request',
-                                 'error_description': 'Base 64 from Authorization header could not be decoded'})
-        self.client_id, self.code_from_header = digest.split(':')
-
-    def validate_client_authorization(self):
-        database = self.application.database
-        client = database.find_client(self.client_id)
-
-        if not client:
-            self.raise_http_401({'error': 'invalid_client',
-                                 'error_description': 'Invalid client_id or code on Authorization header'})
-
-        if not database.client_has_authorization_code(self.client_id, self.code_from_header):
-            self.raise_http_401({'error': 'invalid_client',
-                                 'error_description': 'Invalid client_id or code on Authorization header'})
-
-        if not database.client_has_authorization_code(self.client_id, self.code):
-            self.raise_http_400({'error': 'invalid_grant',
-                                 'error_description': 'Invalid code for this client'})
-
-        if not database.client_has_redirect_uri_for_code(self.client_id, self.code, self.redirect_uri):
-            self.raise_http_400({'error': 'invalid_grant',
-                                 'error_description': 'redirect_uri does not match'})
-
-        if database.is_client_authorization_code_used(self.client_id, self.code):
-            self.raise_http_400({'error': 'invalid_grant',
-                                 'error_description': 'Authorization grant already used'})
-
-        plugins.call('access-token-validation', self)
-
-    def mark_client_authorization_code_as_used(self):
-        self.application.database.mark_client_authorization_code_as_used(self.client_id, self.code)
+        cached = self.application.client_credentials_cache.get(digest)
+        if cached is not None:
+            self.client_id, self.code_from_header, self.authenticated_client = cached
+            return
+        self.client_id, self.code_from_header = self.parse_basic_authorization()
 
+    @tornado.gen.coroutine
     def build_response(self):
+        access_token = self.build_access_token()
+        yield self.save_access_token(access_token)
+        metrics.ACCESS_TOKENS_ISSUED.inc((self.grant_type,))
         response = {
-            'access_token': self.build_access_token(),
+            'access_token': access_token,
             'token_type': 'bearer',
-            'expires_in': 3600,
+            'expires_in': self.expires_in,
             }
-        plugins.call('access-token-response', self, response)
+        if (getattr(self.application, 'refresh_token_lifetime', None) and
+                self.grant.issues_refresh_token):
+            response['refresh_token'] = yield self.issue_refresh_token()
+        yield self.call_plugin('access-token-response', response)
         self.write(response)
 
     def build_access_token(self):
+        signer = getattr(self.application, 'access_token_signer', None)
+        if signer:
+            return signer.sign(self.client_id, self.expires_in)
         return oauth2u.tokens.generate_access_token()
 
+    @tornado.gen.coroutine
+    def save_access_token(self, access_token):
+        '''
+        Stores the issued token so it can be introspected. Signed tokens
+        carry their own information and are not stored
+        '''
+        if not getattr(self.application, 'access_token_signer', None):
+            with self.timing('database'):
+                yield self.application.asynchronous_database.save_access_token(
+                    access_token, self.client_id, time.time() + self.expires_in)
+
+    @tornado.gen.coroutine
+    def issue_refresh_token(self):
+        '''
+        Generates a refresh token and stores its hash
+        '''
+        refresh_token = oauth2u.tokens.generate_refresh_token()
+        with self.timing('database'):
+            yield self.application.asynchronous_database.save_refresh_token(
+                oauth2u.tokens.hash_token(refresh_token), self.client_id,
+                time.time() + self.application.refresh_token_lifetime)
+        raise tornado.gen.Return(refresh_token)
+
     def set_default_headers(self):
         self.set_header('Cache-Control', 'no-store')
         self.set_header('Pragma', 'no-cache')
 
 
 def add_query_to_url(url, params):
-    parts = urlparse.urlparse(url)
-    query = dict(urlparse.parse_qsl(parts.query))
-    query.update(params)
-
-    return urlparse.urlunparse((parts.scheme, parts.netloc,
-                                parts.path, parts.params,
-                                urllib.urlencode(query),
-                                parts.fragment))
+    '''
+    Adds ``params`` to the query of ``url``, after the parameters it
+    already has, in their order. Parameters named like one of ``params``
+    are replaced
+    '''
+    template = redirect_uri_templates.get(url)
+    if template is None:
+        template = RedirectURITemplate(url)
+        redirect_uri_templates.set(url, template)
+    return template.build(params)
+
+
+class RedirectURITemplate(object):
+    '''
+    ``url`` parsed once, to add query parameters to it many times
+    '''
+
+    def __init__(self, url):
+        parts = urlparse.urlsplit(url)
+        self.base = urlparse.urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+        self.query = parts.query
+        self.query_pairs = urlparse.parse_qsl(parts.query, keep_blank_values=True)
+        self.query_names = frozenset(name for name, value in self.query_pairs)
+        self.fragment = '#' + parts.fragment if parts.fragment else ''
+
+    def build(self, params):
+        query = self.query
+        if self.query_names.intersection(params):
+            query = urllib.urlencode([(name, value) for name, value in self.query_pairs
+                                      if name not in params])
+        if isinstance(params, errors.OAuthError):
+            new_query = params.query
+        else:
+            new_query = urllib.urlencode(params)
+        if query and new_query:
+            query = query + '&' + new_query
+        else:
+            query = query or new_query
+        return self.base + ('?' + query if query else '') + self.fragment
+
+
+# redirect_uri values come from requests, the templates kept are bounded
+redirect_uri_templates = cache.LRUCache(max_size=1000, ttl=float('inf'))
@@ -0,0 +1,83 @@
+import time
+
+import tornado.gen
+
+from oauth2u.server.handlers.register import register
+
+from .base import BaseRequestHandler
+
+__all__ = 'IntrospectionHandler',
+
+@register(r'/introspect')
+class IntrospectionHandler(BaseRequestHandler):
+    '''
+    Handler for the Token Introspection Request defined in
+    http://tools.ietf.org/html/rfc7662#section-2
+
+    Signed access tokens are checked with the server's
+    ``access_token_signer``, the others are looked up on the database.
+    Active tokens are kept on ``application.introspection_cache`` until
+    the cache's ttl or the token expiration, whatever comes first.
+
+    Revocations are checked on ``application.revocation_filter`` first,
+    only tokens it might contain are looked up on the database.
+
+    Resource servers calling this endpoint are authenticated as clients,
+    with a Basic Authorization header like on ``/revoke``, unless the
+    server opens it (``Server(open_introspection=True)``). The
+    ``introspection-validation`` plugin is called next, to refuse them
+    anything else.
+
+    '''
+
+    @tornado.gen.coroutine
+    def post(self):
+        token = self.require_argument('token')
+        if not self.application.open_introspection:
+            yield self.authenticate_client()
+        yield self.call_plugin('introspection-validation')
+        response = yield self.introspect(token)
+        self.write(response)
+
+    @tornado.gen.coroutine
+    def introspect(self, token):
+        cache = self.application.introspection_cache
+        response = cache.get(token)
+        if response is None:
+            response = yield self.find_token(token)
+            if response['active']:
+                cache.set(token, response, ttl=min(cache.ttl, response['exp'] - time.time()))
+        if response['active']:
+            revoked = yield self.is_revoked(token)
+            if revoked:
+                cache.invalidate(token)
+                response = {'active': False}
+        raise tornado.gen.Return(response)
+
+    @tornado.gen.coroutine
+    def is_revoked(self, token):
+        if not self.application.revocation_filter.might_be_revoked(token):
+            raise tornado.gen.Return(False)
+        revoked = yield self.application.asynchronous_database.is_access_token_revoked(token)
+        raise tornado.gen.Return(revoked)
+
+    @tornado.gen.coroutine
+    def find_token(self, token):
+        signer = self.application.access_token_signer
+        claims = signer.verify(token) if signer else None
+        if claims is None:
+            record = yield self.application.asynchronous_database.find_access_token(token)
+            if record is None:
+                raise tornado.gen.Return({'active': False})
+            claims = {'client_id': record.client_id,
+                      'exp': int(record.expires_at),
+                      'scope': record.scope}
+        response = {'active': True, 'token_type': 'bearer',
+                    'client_id': claims['client_id'], 'exp': claims['exp']}
+        if claims['scope']:
+            response['scope'] = claims['scope']
+        raise tornado.gen.Return(response)
+
+    def set_default_headers(self):
+        self.set_header('Cache-Control', 'no-store')
+        self.set_header('Pragma', 'no-cache')
@@ -0,0 +1,28 @@
+import tornado.gen
+
+from oauth2u.server import metrics
+from oauth2u.server.handlers.register import register
+
+from .base import BaseRequestHandler
+
+__all__ = 'MetricsHandler',
+
+@register(r'/metrics')
+class MetricsHandler(BaseRequestHandler):
+    '''
+    Metrics of this process in the Prometheus text format, see
+    ``oauth2u.server.metrics``
+
+    Scrapers are authenticated as clients, with a Basic Authorization
+    header, unless the server opens it (``Server(open_metrics=True)``).
+    The ``metrics-validation`` plugin is called next.
+
+    '''
+
+    @tornado.gen.coroutine
+    def get(self):
+        if not self.application.open_metrics:
+            yield self.authenticate_client()
+        yield self.call_plugin('metrics-validation')
+        self.set_header('Content-Type', metrics.CONTENT_TYPE)
+        self.write(metrics.render(self.application))
@@ -0,0 +1,65 @@
+import tornado.gen
+
+from oauth2u.server import errors
+from oauth2u.server.handlers.register import register
+
+from .base import BaseRequestHandler
+
+__all__ = 'RevocationHandler',
+
+@register(r'/revoke')
+class RevocationHandler(BaseRequestHandler):
+    '''
+    Handler for the Token Revocation Request defined in
+    http://tools.ietf.org/html/rfc7009#section-2.1
+
+    The client is authenticated with a Basic Authorization header, with
+    its ``client_id`` and secret (empty for clients without a secret),
+    and only revokes the tokens issued to it.
+
+    The token is revoked on the database until it expires, added to
+    ``application.revocation_filter`` and removed from the introspection
+    cache. Invalid and expired tokens are ignored, the response is always
+    an empty 200.
+
+    The ``revocation-validation`` plugin is called after the client is
+    authenticated, to refuse it anything else.
+
+    '''
+
+    @tornado.gen.coroutine
+    def post(self):
+        token = self.require_argument('token')
+        yield self.authenticate_client()
+        yield self.call_plugin('revocation-validation')
+        yield self.revoke(token)
+
+    @tornado.gen.coroutine
+    def revoke(self, token):
+        owner, expires_at = yield self.find_token(token)
+        if expires_at is None:
+            return
+        if owner != self.client_id:
+            self.raise_http_400(errors.TOKEN_OF_OTHER_CLIENT)
+        yield self.application.asynchronous_database.revoke_access_token(token, expires_at)
+        self.application.revocation_filter.add(token)
+        self.application.introspection_cache.invalidate(token)
+
+    @tornado.gen.coroutine
+    def find_token(self, token):
+        '''
+        Tuple with the client the token was issued to and its expiration,
+        ``(None, None)`` for invalid or expired tokens
+        '''
+        signer = self.application.access_token_signer
+        claims = signer.verify(token) if signer else None
+        if claims is not None:
+            raise tornado.gen.Return((claims['client_id'], claims['exp']))
+        record = yield self.application.asynchronous_database.find_access_token(token)
+        if record is None:
+            raise tornado.gen.Return((None, None))
+        raise tornado.gen.Return((record.client_id, record.expires_at))
+
+    def set_default_headers(self):
+        self.set_header('Cache-Control', 'no-store')
+        self.set_header('Pragma', 'no-cache')
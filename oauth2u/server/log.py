@@ -1,9 +1,19 @@
+import atexit
 import logging
+import os
 from logging.handlers import TimedRotatingFileHandler
+import Queue
+import threading
 
 DEFAULT_LEVEL = logging.INFO
 DEFAULT_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
 DEFAULT_DATEFMT = '%Y-%m-%d %H:%M'
+ACCESS_FORMAT = '%(message)s'
+DROP, BLOCK = 'drop', 'block'
+ACCESS_LOGGER = 'oauth2u.access'
+
+# QueueListener writing the records, when logging through a queue
+listener = None
 
 def configure(**kwargs):
     '''
@@ -16,6 +26,15 @@ def configure(**kwargs):
     `TimedRotatingFileHandler' will be configured instead of
     `logging.basicConfig()'.
 
+    If you provide a `queue_size' parameter, records are put on a queue
+    of this size and written by a background thread, so logging doesn't
+    do I/O on the IOLoop. When the queue is full records are dropped, or
+    the caller waits for room if `queue_policy' is 'block'.
+
+    The access log (the `oauth2u.access' logger) has its own handler,
+    writing the bare JSON lines to stderr, or to `access_filename' (rotated
+    like `filename'). Its records don't reach the application log.
+
     '''
     defaults = {
         'level': DEFAULT_LEVEL,
@@ -23,11 +42,42 @@ def configure(**kwargs):
         'datefmt': '%Y-%m-%d %H:%M',
         }
     defaults.update(kwargs)
+    queue_size = defaults.pop('queue_size', None)
+    queue_policy = defaults.pop('queue_policy', DROP)
+    access_filename = defaults.pop('access_filename', None)
+    if queue_policy not in (DROP, BLOCK):
+        raise ValueError("queue_policy should be '{0}' or '{1}'".format(DROP, BLOCK))
 
+    stop()
     if 'filename' in defaults:
         _configure_with_rotate(defaults)
     else:
         _basic_configuration(defaults)
+    _configure_access_log(access_filename, defaults)
+    if queue_size:
+        _configure_queue(queue_size, queue_policy)
+
+def stop():
+    '''
+    Writes the records still on the queue and stops the background
+    thread, giving the handlers back to the root logger
+    '''
+    global listener
+    if listener is None:
+        return
+    for logger, handlers in ((logging.getLogger(), listener.handlers),
+                             (logging.getLogger(ACCESS_LOGGER), listener.access_handlers)):
+        logger.removeHandler(listener.queue_handler)
+        for handler in handlers:
+            logger.addHandler(handler)
+    listener.stop()
+    listener = None
+
+def dropped_records():
+    '''
+    How many records were dropped because the queue was full
+    '''
+    return listener.queue_handler.dropped if listener else 0
 
 def critical(msg, *args, **kwargs):
     logging.critical(msg, *args, **kwargs)
@@ -47,14 +97,17 @@ def info(msg, *args, **kwargs):
 def debug(msg, *args, **kwargs):
     logging.debug(msg, *args, **kwargs)
 
+def access(msg, *args, **kwargs):
+    '''
+    Logs on the `oauth2u.access' logger, used by the access log
+    '''
+    logging.getLogger(ACCESS_LOGGER).info(msg, *args, **kwargs)
+
 
 def _configure_with_rotate(options):
     formatter = logging.Formatter(options['format'])
 
-    handler = TimedRotatingFileHandler(options['filename'],
-                                       when=options.get('when', 'midnight'),
-                                       encoding=options.get('encoding', 'utf-8'),
-                                       interval=options.get('interval', 1))
+    handler = _rotating_handler(options['filename'], options)
     handler.setLevel(options['level'])
     handler.setFormatter(formatter)
 
@@ -62,5 +115,133 @@ def _configure_with_rotate(options):
     logger.addHandler(handler)
     logger.setLevel(options['level'])
 
+def _rotating_handler(filename, options):
+    return TimedRotatingFileHandler(filename,
+                                    when=options.get('when', 'midnight'),
+                                    encoding=options.get('encoding', 'utf-8'),
+                                    interval=options.get('interval', 1))
+
 def _basic_configuration(options):
     logging.basicConfig(**options)
+
+def _configure_access_log(filename, options):
+    logger = logging.getLogger(ACCESS_LOGGER)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    if filename:
+        handler = _rotating_handler(filename, options)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(ACCESS_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def _configure_queue(queue_size, queue_policy):
+    global listener
+    queue_handler = QueueHandler(Queue.Queue(queue_size), block=queue_policy == BLOCK)
+    handlers = []
+    for logger in logging.getLogger(), logging.getLogger(ACCESS_LOGGER):
+        handlers.append(logger.handlers[:])
+        for handler in handlers[-1]:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+    listener = QueueListener(queue_handler, *handlers)
+    listener.start()
+
+
+class QueueHandler(logging.Handler):
+    '''
+    Puts records on ``queue``, for a ``QueueListener`` to write them.
+    Records that don't fit are dropped and counted on ``dropped``, unless
+    ``block`` is true
+    '''
+
+    def __init__(self, queue, block=False):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.block = block
+        self.dropped = 0
+        # QueueListener writing the records of ``queue``, if any
+        self.listener = None
+
+    def emit(self, record):
+        if self.listener is not None:
+            self.listener.restart_after_fork()
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+
+
+class QueueListener(object):
+    '''
+    Thread taking the records put on the queue of ``queue_handler`` and
+    passing them to ``handlers`` (``access_handlers`` for the access log),
+    which format and write them.
+
+    A forked process doesn't inherit the thread, so it's started again
+    the first time the process logs (like ``TokenPool`` does with its
+    tokens)
+    '''
+    STOP = object()
+
+    def __init__(self, queue_handler, handlers, access_handlers=()):
+        self.queue_handler = queue_handler
+        self.handlers = handlers
+        self.access_handlers = access_handlers
+        self.thread = None
+        self.pid = None
+        self.stopped = False
+        self.lock = threading.Lock()
+        queue_handler.listener = self
+
+    def start(self):
+        if self.thread is None:
+            atexit.register(self.stop)
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.run, name='oauth2u-log')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def restart_after_fork(self):
+        '''
+        Starts the thread in this process if it was forked after the
+        listener started. The records queued before the fork are left
+        to the parent process, this one starts with an empty queue
+        '''
+        if self.pid == os.getpid() or self.stopped:
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue_handler.queue = Queue.Queue(self.queue_handler.queue.maxsize)
+            self.start()
+
+    def run(self):
+        queue = self.queue_handler.queue
+        while True:
+            record = queue.get()
+            if record is self.STOP:
+                return
+            handlers = self.access_handlers if record.name == ACCESS_LOGGER else self.handlers
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        '''
+        Writes the records still queued and stops the thread. Calling it
+        again does nothing, it's also called at exit
+        '''
+        if self.stopped:
+            return
+        self.stopped = True
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue_handler.queue.put(self.STOP)
+            self.thread.join()
+        for handler in list(self.handlers) + list(self.access_handlers):
+            handler.flush()
@@ -0,0 +1,216 @@
+'''
+Counters and histograms of what the server is doing, exposed by
+``MetricsHandler`` on ``/metrics`` in the Prometheus text format.
+
+Metrics are plain dicts of numbers changed on the IOLoop, without locks,
+and each process has its own: with many processes each scrape sees the
+process that answered it.
+
+'''
+import bisect
+
+from oauth2u.server import accesslog, grants, log, plugins
+
+__all__ = 'Counter', 'Histogram', 'record_request', 'render'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter(object):
+    '''
+    Value for each tuple of ``labels`` values, only incremented
+    '''
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, zip(self.labels, labels), value
+
+
+class Histogram(object):
+    '''
+    Counts the values observed for each tuple of ``labels`` values on
+    ``buckets`` (upper bounds, in seconds), and sums them
+    '''
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, labels=()):
+        series = self.series.get(labels)
+        if series is None:
+            # a count per bucket, plus values over the last one, and the sum
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labels, series in sorted(self.series.items()):
+            labels = zip(self.labels, labels)
+            count = 0
+            for bucket, bucket_count in zip(self.buckets + ('+Inf',), series):
+                count += bucket_count
+                yield self.name + '_bucket', labels + [('le', bucket)], count
+            yield self.name + '_sum', labels, series[-1]
+            yield self.name + '_count', labels, count
+
+
+REQUESTS = Counter('oauth2u_requests_total',
+                   'Requests handled, by handler and outcome', ('handler', 'outcome'))
+REQUEST_SECONDS = Histogram('oauth2u_request_seconds',
+                            'Time to handle requests', ('handler',))
+PHASE_SECONDS = Histogram('oauth2u_request_phase_seconds',
+                          'Time spent on each phase of the requests', ('handler', 'phase'))
+AUTHORIZATION_CODES_ISSUED = Counter('oauth2u_authorization_codes_issued_total',
+                                     'Authorization codes issued')
+ACCESS_TOKENS_ISSUED = Counter('oauth2u_access_tokens_issued_total',
+                               'Access tokens issued, by grant type', ('grant_type',))
+
+METRICS = [REQUESTS, REQUEST_SECONDS, PHASE_SECONDS,
+           AUTHORIZATION_CODES_ISSUED, ACCESS_TOKENS_ISSUED]
+
+
+def record_request(handler):
+    '''
+    Counts a finished request and the time spent on it and on each of
+    its phases (see ``BaseRequestHandler.timing()``)
+    '''
+    name = type(handler).__name__
+    REQUESTS.inc((name, accesslog.outcome(handler)))
+    REQUEST_SECONDS.observe(handler.request.request_time(), (name,))
+    if handler.phase_times:
+        for phase, seconds in handler.phase_times.iteritems():
+            PHASE_SECONDS.observe(seconds, (name, phase))
+
+
+class Gauge(object):
+    '''
+    Metric read when it's rendered, from the counters kept elsewhere
+    '''
+
+    def __init__(self, name, help, metric_type='gauge', labels=()):
+        self.name = name
+        self.help = help
+        self.type = metric_type
+        self.labels = labels
+        self.values = []
+
+    def set(self, value, labels=()):
+        self.values.append((labels, value))
+
+    def samples(self):
+        for labels, value in self.values:
+            yield self.name, zip(self.labels, labels), value
+
+
+def collect(application):
+    '''
+    Gauges with the state of the server components used by ``application``
+    '''
+    database = application.database
+    if getattr(database, 'counts_authorization_codes', False):
+        codes = Gauge('oauth2u_authorization_codes', 'Authorization codes stored')
+        codes.set(database.authorization_codes_count())
+        yield codes
+
+    grant_requests = Gauge('oauth2u_grant_requests_total', 'Access token requests, by grant type',
+                           'counter', ('grant_type',))
+    grant_failures = Gauge('oauth2u_grant_failures_total', 'Access token requests failed, by grant type',
+                           'counter', ('grant_type',))
+    grant_seconds = Gauge('oauth2u_grant_seconds_total', 'Time to handle access token requests',
+                          'counter', ('grant_type',))
+    for grant_type, counter in sorted(grants.stats().items()):
+        grant_requests.set(counter.count, (grant_type,))
+        grant_failures.set(counter.failures, (grant_type,))
+        grant_seconds.set(counter.total_time, (grant_type,))
+    yield grant_requests
+    yield grant_failures
+    yield grant_seconds
+
+    plugin_calls = Gauge('oauth2u_plugin_calls_total', 'Plugin calls',
+                         'counter', ('hook', 'plugin'))
+    plugin_failures = Gauge('oauth2u_plugin_failures_total', 'Plugin calls that raised',
+                            'counter', ('hook', 'plugin'))
+    plugin_seconds = Gauge('oauth2u_plugin_seconds_total', 'Time spent on plugins',
+                           'counter', ('hook', 'plugin'))
+    for hook, function, counter in plugins.stats():
+        labels = (hook, function.__name__)
+        plugin_calls.set(counter.count, labels)
+        plugin_failures.set(counter.failures, labels)
+        plugin_seconds.set(counter.total_time, labels)
+    yield plugin_calls
+    yield plugin_failures
+    yield plugin_seconds
+
+    cache_hits = Gauge('oauth2u_cache_hits_total', 'Lookups found on cache', 'counter', ('cache',))
+    cache_misses = Gauge('oauth2u_cache_misses_total', 'Lookups not found on cache', 'counter', ('cache',))
+    cache_entries = Gauge('oauth2u_cache_entries', 'Values on cache', labels=('cache',))
+    for name in ('introspection_cache', 'client_credentials_cache', 'client_registry'):
+        cache = getattr(application, name, None)
+        if cache is not None:
+            cache_hits.set(cache.hits, (name,))
+            cache_misses.set(cache.misses, (name,))
+            cache_entries.set(len(cache), (name,))
+    yield cache_hits
+    yield cache_misses
+    yield cache_entries
+
+    revocation_filter = getattr(application, 'revocation_filter', None)
+    if revocation_filter is not None:
+        tokens, size, false_positive_rate = revocation_filter.stats()
+        for name, help, value in (
+                ('oauth2u_revocation_filter_tokens', 'Revoked tokens on the revocation filter', tokens),
+                ('oauth2u_revocation_filter_bytes', 'Size of the revocation filter', size),
+                ('oauth2u_revocation_filter_false_positive_rate',
+                 'Estimated false positive rate of the revocation filter', false_positive_rate)):
+            gauge = Gauge(name, help)
+            gauge.set(value)
+            yield gauge
+
+    dropped = Gauge('oauth2u_log_dropped_records_total', 'Log records dropped with the queue full',
+                    'counter')
+    dropped.set(log.dropped_records())
+    yield dropped
+
+
+def render(application):
+    '''
+    Every metric in the Prometheus text format
+    '''
+    lines = []
+    for metric in METRICS + list(collect(application)):
+        lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+        lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+        for name, labels, value in metric.samples():
+            if labels:
+                name += '{' + ','.join('{0}="{1}"'.format(label, escape(label_value))
+                                       for label, label_value in labels) + '}'
+            lines.append('{0} {1}'.format(name, format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
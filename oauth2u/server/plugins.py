@@ -1,23 +1,40 @@
 import functools
 import os
+import time
 
 import tornado
+import tornado.concurrent
+import tornado.gen
+import tornado.ioloop
+import tornado.web
 
-from oauth2u.server import database, loader
-
+from oauth2u.server import database, loader, log
+from oauth2u.server.stats import LatencyCounter
 
+# plugins of each hook, in the order they were registered
 PLUGINS = {
-    'authorization-GET': None,
-    'authorization-POST': None,
-    'access-token-response': None,
-    'access-token-validation': None,
+    'authorization-GET': [],
+    'authorization-POST': [],
+    'access-token-response': [],
+    'access-token-validation': [],
+    'introspection-validation': [],
+    'revocation-validation': [],
+    'metrics-validation': [],
 }
 
+# PLUGINS compiled to tuples of (function, LatencyCounter), used by call()
+CHAINS = dict((name, ()) for name in PLUGINS)
+
+registration_closed = False
+
 def register(name):
     def decorator(function):
         if name not in PLUGINS:
             raise InvalidPlugin("Plugin name '{0}' is invalid".format(name))
-        PLUGINS[name] = function
+        if registration_closed:
+            raise InvalidPlugin("Plugin registration is closed, can't register on '{0}'".format(name))
+        PLUGINS[name].append(function)
+        compile_chain(name)
         return function
     return decorator
 
@@ -25,31 +42,192 @@ authorization_GET = register('authorization-GET')
 authorization_POST = register('authorization-POST')
 access_token_response = register('access-token-response')
 access_token_validation = register('access-token-validation')
+introspection_validation = register('introspection-validation')
+revocation_validation = register('revocation-validation')
+metrics_validation = register('metrics-validation')
 
 def find(name):
-    if name not in PLUGINS:
-        raise InvalidPlugin("Plugin name '{0}' is invalid. So it's not possible to look for plugins with this name".format(name))
-    function = PLUGINS.get(name)
-    if not function:
+    '''
+    First plugin registered to ``name``, the only one unless plugins
+    are chained (see ``find_all()``)
+    '''
+    return find_all(name)[0]
+
+
+def find_all(name):
+    '''
+    Tuple with the plugins registered to ``name``, in order
+    '''
+    functions = tuple(function for function, counter in find_chain(name))
+    if not functions:
         raise PluginNotFound("No plugin registered to '{0}'".format(name))
-    return function
+    return functions
+
+
+def find_chain(name):
+    chain = CHAINS.get(name)
+    if chain is None:
+        raise InvalidPlugin("Plugin name '{0}' is invalid. So it's not possible to look for plugins with this name".format(name))
+    return chain
+
+
+def compile_chain(name):
+    CHAINS[name] = tuple((function, LatencyCounter()) for function in PLUGINS[name])
+
+
+def close_registration():
+    '''
+    Compiles every chain and refuses new plugins, called by the server
+    before it starts handling requests
+    '''
+    global registration_closed
+    for name in PLUGINS:
+        compile_chain(name)
+    registration_closed = True
+
+
+def stats():
+    '''
+    List of ``(name, function, LatencyCounter)`` for every plugin
+    '''
+    return [(name, function, counter)
+            for name, chain in sorted(CHAINS.items())
+            for function, counter in chain]
+
+
+def timeout(seconds, fallback=None):
+    '''
+    Decorator limiting how long ``call_async()`` waits for the Future
+    returned by a plugin:
+
+        @plugins.access_token_validation
+        @plugins.timeout(0.5, fallback=allow_access)
+        @tornado.gen.coroutine
+        def check_risk(handler):
+            ...
+
+    After ``seconds`` the plugin's result is ignored and ``fallback`` is
+    called with the same arguments, as if it were the plugin. Without a
+    fallback ``PluginTimeout`` is raised
+    '''
+    def decorator(function):
+        function.plugin_timeout = seconds
+        function.plugin_fallback = fallback
+        return function
+    return decorator
 
 
 def call(name, *args, **kwargs):
-    try:
-        function = find(name)
-    except PluginNotFound:
-        return False
-    try:
-        function(*args, **kwargs)
-    except IgnorePlugin:
+    '''
+    Calls every plugin of ``name`` in order, until one of them finishes
+    the response of the handler they are called with (redirecting or
+    rendering it, the first one to respond wins). Returns True if at
+    least one of them didn't raise ``IgnorePlugin``
+    '''
+    chain = find_chain(name)
+    if not chain:
         return False
-    return True
+    called = False
+    for function, counter in chain:
+        if is_finished(args):
+            break
+        started = time.time()
+        succeeded = False
+        try:
+            function(*args, **kwargs)
+        except IgnorePlugin:
+            succeeded = True
+        else:
+            succeeded = called = True
+        finally:
+            counter.record(time.time() - started, succeeded)
+    return called
+
+
+def call_async(name, *args, **kwargs):
+    '''
+    Like ``call()``, but returns a Future, and if a plugin returns a
+    Future too (like ``tornado.gen.coroutine`` functions) waits for it
+    before calling the next one, see ``timeout()``
+    '''
+    chain = find_chain(name)
+    if not chain:
+        return wait(False, None, name)
+    return call_chain_async(name, chain, args, kwargs)
+
+
+@tornado.gen.coroutine
+def call_chain_async(name, chain, args, kwargs):
+    called = False
+    for function, counter in chain:
+        if is_finished(args):
+            break
+        started = time.time()
+        succeeded = False
+        try:
+            try:
+                yield wait(function(*args, **kwargs), getattr(function, 'plugin_timeout', None), name)
+            except PluginTimeout:
+                fallback = getattr(function, 'plugin_fallback', None)
+                if fallback is None:
+                    raise
+                log.warn("Plugin '%s' timed out, calling fallback", name)
+                yield wait(fallback(*args, **kwargs), None, name)
+        except IgnorePlugin:
+            succeeded = True
+        else:
+            succeeded = called = True
+        finally:
+            counter.record(time.time() - started, succeeded)
+    raise tornado.gen.Return(called)
+
+
+def is_finished(args):
+    '''
+    Tells if the handler plugins are called with (the first argument)
+    already sent its response
+    '''
+    return bool(args) and isinstance(args[0], tornado.web.RequestHandler) and getattr(args[0], '_finished', False)
+
+
+def wait(result, seconds, name):
+    '''
+    Future resolved with ``result``, or failing with ``PluginTimeout``
+    if ``result`` is a Future not done after ``seconds``
+    '''
+    if not isinstance(result, tornado.concurrent.Future):
+        future = tornado.concurrent.TracebackFuture()
+        future.set_result(result)
+        return future
+    if not seconds or result.done():
+        return result
+    future = tornado.concurrent.TracebackFuture()
+    ioloop = tornado.ioloop.IOLoop.current()
+
+    def on_timeout():
+        if not future.done():
+            future.set_exception(PluginTimeout(
+                "Plugin '{0}' did not finish in {1} seconds".format(name, seconds)))
+
+    def on_done(result):
+        ioloop.remove_timeout(handle)
+        if not future.done():
+            tornado.concurrent.chain_future(result, future)
+
+    handle = ioloop.add_timeout(time.time() + seconds, on_timeout)
+    result.add_done_callback(on_done)
+    return future
 
 
 def unregister_all():
-    for key in PLUGINS:
-        PLUGINS[key] = None
+    '''
+    Removes every plugin and opens the registration again
+    '''
+    global registration_closed
+    for name in PLUGINS:
+        del PLUGINS[name][:]
+        compile_chain(name)
+    registration_closed = False
 
 
 def load_from_directories(*directory_list):
@@ -64,3 +242,6 @@ class InvalidPlugin(Exception):
 
 class IgnorePlugin(Exception):
     pass
+
+class PluginTimeout(Exception):
+    pass
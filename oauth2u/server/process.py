@@ -0,0 +1,109 @@
+'''
+Helpers to run the server on multiple processes.
+
+The parent process binds the listening sockets (unless ``SO_REUSEPORT``
+is used, then each worker binds its own), forks the workers and
+supervises them: workers that die are forked again and ``SIGTERM`` is
+forwarded to all of them.
+
+'''
+import errno
+import os
+import signal
+import socket
+
+import tornado.netutil
+
+from oauth2u.server import log
+
+__all__ = 'bind_sockets', 'Supervisor'
+
+MAX_RESTARTS = 100
+
+
+def bind_sockets(port, reuse_port=False):
+    '''
+    Binds listening sockets to ``port``. With ``reuse_port`` the socket
+    is created with ``SO_REUSEPORT``, so each process can bind its own and
+    the kernel balances the connections between them
+
+    '''
+    if not reuse_port:
+        return tornado.netutil.bind_sockets(port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setblocking(0)
+    sock.bind(('', port))
+    sock.listen(128)
+    return [sock]
+
+
+class Supervisor(object):
+    '''
+    Forks ``processes`` workers running ``worker(worker_id)`` and keeps them
+    running until ``SIGTERM`` is received. After ``max_restarts`` restarts
+    the workers are stopped, and waited for, before giving up.
+
+    ``worker`` runs on the child process, which exits when it returns.
+
+    '''
+
+    def __init__(self, processes, worker, max_restarts=MAX_RESTARTS):
+        self.processes = processes
+        self.worker = worker
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.children = {}
+        self.stopping = False
+
+    def start(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        for worker_id in range(self.processes):
+            self.fork(worker_id)
+        self.supervise()
+
+    def fork(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 0
+            try:
+                self.worker(worker_id)
+            except Exception:
+                log.exception('Worker %s failed', worker_id)
+                status = 1
+            finally:
+                os._exit(status)
+        self.children[pid] = worker_id
+
+    def supervise(self):
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except OSError as error:
+                if error.errno == errno.EINTR:
+                    continue
+                raise
+            if pid not in self.children:
+                continue
+            worker_id = self.children.pop(pid)
+            if self.stopping:
+                continue
+            log.error('Worker %s (pid %s) exited with status %s, restarting',
+                      worker_id, pid, status)
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                self.stop()
+                # reaps the workers, none is restarted once stopping
+                self.supervise()
+                raise RuntimeError('Too many worker restarts, giving up')
+            self.fork(worker_id)
+
+    def stop(self, *args):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
@@ -0,0 +1,29 @@
+'''
+Counters kept by the server about what it's doing, for monitoring.
+
+'''
+
+__all__ = 'LatencyCounter',
+
+
+class LatencyCounter(object):
+    '''
+    Counts requests and failures, and sums how long they took (in seconds)
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed, succeeded=True):
+        self.count += 1
+        if not succeeded:
+            self.failures += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    @property
+    def average_time(self):
+        return self.total_time / self.count if self.count else 0.0
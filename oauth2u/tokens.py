@@ -1,11 +1,171 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import time
 import uuid
+import weakref
+
+import tornado.ioloop
 
 
 def generate_authorization_code():
-    return generate_uuid_without_dashes()
+    return default_pool.take()
 
 def generate_access_token():
-    return generate_uuid_without_dashes()
+    return default_pool.take()
+
+def generate_refresh_token():
+    return default_pool.take()
+
+def hash_token(token):
+    '''
+    Hash a token is stored by, so the stored value can't be used as
+    the token. Tokens are random, a salt would add nothing
+    '''
+    if isinstance(token, unicode):
+        token = token.encode('utf-8')
+    return urlsafe_b64encode(hashlib.sha256(token).digest())
 
 def generate_uuid_without_dashes():
-	return str(uuid.uuid4()).replace('-', '')
\ No newline at end of file
+	return str(uuid.uuid4()).replace('-', '')
+
+def after_fork():
+    '''
+    Resets every ``TokenPool``, called by each server process when it's
+    forked. Processes forked otherwise must call it before taking tokens
+    '''
+    for pool in list(POOLS):
+        pool.reset()
+
+
+class TokenPool(object):
+    '''
+    Keeps ``size`` random tokens generated ahead of time.
+
+    Tokens are made reading the entropy for the whole pool with a single
+    ``os.urandom()`` call, encoding it at once (``hex`` or URL-safe
+    ``base64``) and slicing it in tokens of ``length`` characters.
+
+    When less than ``low_water`` tokens are left a refill is scheduled on
+    the IOLoop, so it happens off the request path. Only if the pool gets
+    empty before that a request pays for the refill.
+
+    A forked process must discard the tokens inherited from its parent,
+    they would be handed out by both processes otherwise, see ``after_fork()``.
+
+    '''
+
+    encoders = {
+        'hex': (binascii.hexlify, 2.0),
+        'base64': (base64.urlsafe_b64encode, 4 / 3.0),
+    }
+
+    def __init__(self, size=1024, length=32, encoding='hex', low_water=None):
+        if encoding not in self.encoders:
+            raise ValueError("Invalid encoding '{0}', use one of: {1}".format(
+                encoding, ', '.join(sorted(self.encoders))))
+        self.size = size
+        self.length = length
+        self.encoding = encoding
+        self.low_water = size // 4 if low_water is None else low_water
+        self.tokens = []
+        self.refill_scheduled = False
+        POOLS.add(self)
+
+    def reset(self):
+        self.tokens = []
+        self.refill_scheduled = False
+
+    def take(self):
+        if not self.tokens:
+            self.refill()
+        token = self.tokens.pop()
+        if len(self.tokens) < self.low_water:
+            self.schedule_refill()
+        return token
+
+    def schedule_refill(self):
+        if not self.refill_scheduled:
+            self.refill_scheduled = True
+            tornado.ioloop.IOLoop.current().add_callback(self.refill)
+
+    def refill(self):
+        self.refill_scheduled = False
+        missing = self.size - len(self.tokens)
+        if missing <= 0:
+            return
+        encode, chars_per_byte = self.encoders[self.encoding]
+        total_length = missing * self.length
+        # a bit more entropy than needed, so base64 padding is never used
+        encoded = encode(os.urandom(int(total_length / chars_per_byte) + 3))
+        length = self.length
+        self.tokens.extend(encoded[i:i + length] for i in range(0, total_length, length))
+
+
+# every TokenPool created, reset by after_fork()
+POOLS = weakref.WeakSet()
+
+default_pool = TokenPool()
+
+
+class AccessTokenSigner(object):
+    '''
+    Generates self-contained access tokens, signed with HMAC-SHA256, that
+    resource servers can validate without asking the authorization server
+    (and that the authorization server doesn't need to store).
+
+    The token is ``<payload>.<signature>``, both URL-safe base64 without
+    padding. The payload carries the expiration timestamp, a random nonce,
+    the scope and the client id.
+
+    The HMAC with the key already applied is created once and only copied
+    for each token.
+
+    '''
+
+    def __init__(self, secret):
+        self.mac = hmac.new(secret, digestmod=hashlib.sha256)
+
+    def sign(self, client_id, expires_in, scope=None, now=None):
+        expires_at = int(time.time() if now is None else now) + expires_in
+        nonce = binascii.hexlify(os.urandom(4))
+        payload = '{0}|{1}|{2}|{3}'.format(expires_at, nonce, scope or '', client_id)
+        encoded = urlsafe_b64encode(payload)
+        return '{0}.{1}'.format(encoded, self.signature(encoded))
+
+    def verify(self, token, now=None):
+        '''
+        Returns a dict with ``client_id``, ``exp`` and ``scope`` if ``token``
+        was signed with this secret and is not expired, ``None`` otherwise
+
+        '''
+        try:
+            encoded, _, signature = str(token).partition('.')
+        except UnicodeError:
+            return None
+        if not hmac.compare_digest(self.signature(encoded), signature):
+            return None
+        try:
+            expires_at, nonce, scope, client_id = urlsafe_b64decode(encoded).split('|', 3)
+            expires_at = int(expires_at)
+        except (TypeError, ValueError):
+            return None
+        if expires_at <= (time.time() if now is None else now):
+            return None
+        return {'client_id': client_id,
+                'exp': expires_at,
+                'scope': scope or None}
+
+    def signature(self, encoded_payload):
+        mac = self.mac.copy()
+        mac.update(encoded_payload)
+        return urlsafe_b64encode(mac.digest())
+
+
+def urlsafe_b64encode(value):
+    return base64.urlsafe_b64encode(value).rstrip('=')
+
+def urlsafe_b64decode(value):
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
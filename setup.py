@@ -2,5 +2,5 @@ from distutils.core import setup
 
 setup(
     name='oauth2u',
-    install_requires=['tornado']
+    install_requires=['tornado>=3.0,<4.0']
 )
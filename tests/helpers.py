@@ -6,6 +6,8 @@ import json
 from functools import partial
 
 import requests
+import tornado.concurrent
+import tornado.ioloop
 
 __all__ = ('TEST_SERVER_HOST',
            'build_root_url',
@@ -14,7 +16,8 @@ __all__ = ('TEST_SERVER_HOST',
            'parse_json_response',
            'parse_query_string',
            'get_code_from_url',
-           'request_authorization_code')
+           'request_authorization_code',
+           'DeferredDataBase')
 
 
 TEST_SERVER_HOST = 'http://localhost:8888'
@@ -67,3 +70,25 @@ def build_basic_authorization_header(client_id, code):
     ''' Build the value for a Basic ``Authorization`` HTTP header '''
     digest = base64.b64encode('{0}:{1}'.format(client_id, code))
     return 'Basic {0}'.format(digest)
+
+
+class DeferredDataBase(object):
+    ''' Asynchronous database answering on the next IOLoop iteration, like
+    a database doing network I/O would '''
+    is_asynchronous = True
+
+    def __init__(self, database):
+        self.database = database
+
+    def add_client_listener(self, listener):
+        self.database.add_client_listener(listener)
+
+    def __getattr__(self, name):
+        method = getattr(self.database, name)
+
+        def deferred(*args):
+            future = tornado.concurrent.TracebackFuture()
+            tornado.ioloop.IOLoop.current().add_callback(
+                lambda: future.set_result(method(*args)))
+            return future
+        return deferred
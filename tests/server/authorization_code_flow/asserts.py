@@ -15,7 +15,7 @@ def assert_valid_access_token(response):
     body = parse_json_response(response)
 
     assert 200 == response.status_code
-    assert ['access_token', 'token_type', 'expires_in'] == body.keys()
+    assert set(['access_token', 'token_type', 'expires_in', 'refresh_token']) == set(body.keys())
     assert body['access_token'].startswith('access-token-')
     assert 'bearer' == body['token_type']
     assert_has_no_cache_headers(response)
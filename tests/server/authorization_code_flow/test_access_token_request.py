@@ -94,12 +94,12 @@ def test_should_require_grant_type_argument():
                           'Parameter grant_type is required')
 
 
-def test_should_require_grant_type_argument_to_be_authorization_code():
+def test_should_require_grant_type_argument_to_be_a_supported_grant():
     response = requests.post(URL, data={'grant_type': 'invalid'},
                              headers=HEADERS)
     assert_error_response_body(response,
-                          'invalid_request',
-                          'Parameter grant_type should be authorization_code')
+                          'unsupported_grant_type',
+                          'Supported grant_type: authorization_code, client_credentials, refresh_token')
 
 
 def test_should_require_code_argument():
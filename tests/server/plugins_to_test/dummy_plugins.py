@@ -16,17 +16,13 @@ from oauth2u.server import plugins
 @plugins.authorization_GET
 def on_authorization_GET_to_test(handler):
     if handler.client_id == 'unauthorized-client':
-        handler.redirect_unauthorized_client(handler.client_id, handler.code)
-        return
+        return handler.redirect_unauthorized_client(handler.client_id, handler.code)
     if handler.client_id == 'temporarily_unavailable':
-        handler.redirect_temporarily_unavailable(handler.client_id, handler.code)
-        return
+        return handler.redirect_temporarily_unavailable(handler.client_id, handler.code)
     if handler.client_id == 'server_error':
-        handler.redirect_server_error(handler.client_id, handler.code)
-        return
+        return handler.redirect_server_error(handler.client_id, handler.code)
     if handler.client_id == 'invalid_scope':
-        handler.redirect_invalid_scope(handler.client_id, handler.code)
-        return
+        return handler.redirect_invalid_scope(handler.client_id, handler.code)
 
     handler.set_cookie('client_id', handler.client_id)
     handler.set_cookie('code', handler.code)
@@ -54,9 +50,9 @@ def on_authorization_POST_to_test(handler):
 
     elif client_id == 'client-id-verify-access':
         if handler.get_argument('allow') == 'yes':
-            handler.redirect_access_granted(client_id, code)
+            return handler.redirect_access_granted(client_id, code)
         else:
-            handler.redirect_access_denied(client_id, code)
+            return handler.redirect_access_denied(client_id, code)
     else:
         # keep normal if no special client_id, so other tests
         # can check default behaviour
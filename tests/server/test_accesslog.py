@@ -0,0 +1,86 @@
+import json
+
+import mock
+import pytest
+import tornado.web
+
+import oauth2u
+from oauth2u.server import accesslog, errors
+from oauth2u.server.handlers import AccessTokenHandler, AuthorizationHandler
+
+
+def create_handler(status=200, error=None):
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.initialize()
+    handler.request = mock.Mock(path='/access-token', method='POST')
+    handler.request.request_time.return_value = 0.002
+    handler.get_status = mock.Mock(return_value=status)
+    handler.client_id = 'client-id'
+    handler.grant_type = 'authorization_code'
+    if error:
+        with pytest.raises(tornado.web.HTTPError):
+            handler.raise_http_error(status, error)
+    return handler
+
+
+def test_outcome_should_tell_success_from_client_and_server_errors():
+    assert 'success' == accesslog.outcome(create_handler(200))
+    assert 'client_error' == accesslog.outcome(create_handler(400, errors.INVALID_CODE))
+    assert 'server_error' == accesslog.outcome(create_handler(503))
+
+
+def test_redirects_with_errors_should_be_client_errors():
+    handler = AuthorizationHandler.__new__(AuthorizationHandler)
+    handler.initialize()
+    handler.redirect_uri = 'http://example.com/callback'
+    handler.get_status = mock.Mock(return_value=302)
+    with pytest.raises(tornado.web.HTTPError):
+        handler.raise_http_302(errors.UNSUPPORTED_RESPONSE_TYPE)
+
+    assert 'client_error' == accesslog.outcome(handler)
+
+
+def test_should_log_request_as_json_line(monkeypatch):
+    access = mock.Mock()
+    monkeypatch.setattr(accesslog.log, 'access', access)
+    handler = create_handler(400, errors.INVALID_CODE)
+    with handler.timing('validate_client_authorization'):
+        pass
+
+    accesslog.AccessLog()(handler)
+
+    line = json.loads(str(access.call_args[0][1]))
+    assert ['validate_client_authorization'] == line.pop('phases').keys()
+    assert {'endpoint': '/access-token', 'method': 'POST', 'status': 400,
+            'outcome': 'client_error', 'error': 'invalid_grant', 'client_id': 'client-id',
+            'grant_type': 'authorization_code', 'latency': 0.002} == line
+
+
+def test_should_sample_requests_by_outcome(monkeypatch):
+    access = mock.Mock()
+    monkeypatch.setattr(accesslog.log, 'access', access)
+    access_log = accesslog.AccessLog({'success': 0.1}, random=iter([0.05, 0.5]).next)
+
+    access_log(create_handler(200))
+    access_log(create_handler(200))
+    access_log(create_handler(500))
+
+    assert 2 == access.call_count
+    assert (2, 1) == (access_log.logged, access_log.skipped)
+
+
+def test_json_line_should_be_serialized_only_when_formatted():
+    entry = {'endpoint': '/authorize'}
+    line = accesslog.JSONLine(entry)
+    entry['status'] = 302
+
+    assert {'endpoint': '/authorize', 'status': 302} == json.loads(str(line))
+
+
+def test_server_should_use_access_log_as_tornado_log_function():
+    server = oauth2u.Server(access_log=True, access_log_sample_rates={'success': 0.5})
+
+    log_function = server.application_settings['log_function']
+    assert isinstance(log_function, accesslog.AccessLog)
+    assert {'success': 0.5} == log_function.sample_rates
+    assert 'log_function' not in oauth2u.Server().application_settings
@@ -0,0 +1,45 @@
+import pytest
+
+from oauth2u.server.database import (AsyncDataBase, MemoryDataBase,
+                                     make_asynchronous)
+
+
+def test_should_return_resolved_futures_with_the_wrapped_database_results():
+    database = MemoryDataBase()
+    database.save_new_client('client-id', 'http://example.com')
+
+    future = AsyncDataBase(database).find_client('client-id')
+
+    assert future.done()
+    assert {'default_redirect_uri': 'http://example.com'} == future.result()
+
+
+def test_should_set_exceptions_raised_by_wrapped_database_on_futures():
+    future = AsyncDataBase(MemoryDataBase()).client_authorization_codes_count('no-client-id')
+
+    assert future.done()
+    with pytest.raises(KeyError):
+        future.result()
+
+
+def test_should_expose_non_callable_attributes_directly():
+    database = MemoryDataBase(authorization_code_lifetime=30)
+
+    assert 30 == AsyncDataBase(database).authorization_code_lifetime
+
+
+def test_make_asynchronous_should_wrap_synchronous_databases():
+    database = MemoryDataBase()
+    asynchronous = make_asynchronous(database)
+
+    assert isinstance(asynchronous, AsyncDataBase)
+    assert database is asynchronous.database
+
+
+def test_make_asynchronous_should_keep_asynchronous_databases():
+    class NativeAsyncDataBase(object):
+        is_asynchronous = True
+
+    database = NativeAsyncDataBase()
+
+    assert database is make_asynchronous(database)
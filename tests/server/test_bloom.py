@@ -0,0 +1,78 @@
+import time
+
+from oauth2u.server.bloom import BloomFilter, RevocationFilter
+from oauth2u.server.database import MemoryDataBase
+from tests.helpers import DeferredDataBase
+
+
+def test_bloom_filter_should_contain_added_values():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    values = ['token-{0}'.format(i) for i in range(1000)]
+    for value in values:
+        bloom.add(value)
+
+    assert all(bloom.might_contain(value) for value in values)
+    assert u'token-1' in bloom
+    assert 1000 == bloom.count
+
+
+def test_bloom_filter_should_keep_false_positive_rate_close_to_error_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add('token-{0}'.format(i))
+
+    false_positives = sum(bloom.might_contain('other-{0}'.format(i)) for i in range(10000))
+    assert false_positives < 300
+    assert 0.005 < bloom.false_positive_rate < 0.02
+    assert bloom.size_in_bytes < 1300
+
+
+def create_filter(revoked, **kwargs):
+    database = MemoryDataBase()
+    database.revoked_access_tokens = lambda: revoked
+    return RevocationFilter(database, **kwargs)
+
+
+def test_revocation_filter_should_rebuild_in_batches():
+    revocation_filter = create_filter(['a', 'b', 'c'], rebuild_batch_size=2)
+
+    assert not revocation_filter.rebuild_step()
+    assert not revocation_filter.might_be_revoked('a')
+    assert revocation_filter.rebuild_step()
+    assert all(revocation_filter.might_be_revoked(token) for token in 'abc')
+    assert 3 == revocation_filter.stats()[0]
+
+
+def test_revocation_filter_should_keep_tokens_added_while_rebuilding():
+    revocation_filter = create_filter(['a', 'b'], rebuild_batch_size=1)
+    revocation_filter.rebuild_step()
+    revocation_filter.add('new')
+    revocation_filter.rebuild_step()
+    revocation_filter.rebuild_step()
+
+    assert revocation_filter.might_be_revoked('new')
+
+
+def test_revocation_filter_should_grow_with_revoked_tokens():
+    revocation_filter = create_filter(['token-{0}'.format(i) for i in range(20)],
+                                      capacity=10)
+    revocation_filter.rebuild()
+    revocation_filter.rebuild()
+
+    assert 40 == revocation_filter.filter.capacity
+
+
+def test_revocation_filter_periodic_tasks_should_rebuild():
+    revocation_filter = create_filter([], rebuild_interval=500)
+    assert [(revocation_filter.rebuild_step, 500)] == revocation_filter.periodic_tasks()
+
+
+def test_revocation_filter_should_wait_for_asynchronous_database():
+    database = MemoryDataBase()
+    database.revoke_access_token('access-token', time.time() + 60)
+    revocation_filter = RevocationFilter(DeferredDataBase(database))
+
+    assert not revocation_filter.rebuild_step()
+    revocation_filter.rebuild()
+
+    assert revocation_filter.might_be_revoked('access-token')
@@ -0,0 +1,61 @@
+from oauth2u.server.cache import LRUCache
+
+
+def test_should_return_cached_values_and_count_hits_and_misses():
+    cache = LRUCache()
+    cache.set('key', 'value')
+
+    assert 'value' == cache.get('key')
+    assert cache.get('other') is None
+    assert 'default' == cache.get('other', 'default')
+    assert (1, 2) == (cache.hits, cache.misses)
+
+
+def test_should_drop_least_recently_used_values_over_max_size():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert 2 == len(cache)
+    assert 'b' not in cache
+    assert (1, 3) == (cache.get('a'), cache.get('c'))
+
+
+def test_should_expire_values_after_ttl():
+    cache = LRUCache(ttl=10)
+    cache.set('key', 'value', now=100)
+    cache.set('short', 'value', ttl=1, now=100)
+
+    assert 'value' == cache.get('key', now=109)
+    assert cache.get('short', now=101) is None
+    assert cache.get('key', now=110) is None
+    assert 0 == len(cache)
+
+
+def test_should_not_cache_values_without_ttl():
+    cache = LRUCache()
+    cache.set('key', 'value', ttl=0)
+
+    assert 'key' not in cache
+
+
+def test_invalidate_should_remove_value():
+    cache = LRUCache()
+    cache.set('key', 'value')
+    cache.invalidate('key')
+    cache.invalidate('missing')
+
+    assert cache.get('key') is None
+
+
+def test_invalidate_values_should_remove_matching_values():
+    cache = LRUCache()
+    cache.set('first', ('client-id', 1))
+    cache.set('second', ('other-client-id', 2))
+    cache.set('third', ('client-id', 3))
+
+    cache.invalidate_values(lambda value: value[0] == 'client-id')
+
+    assert ['second'] == list(cache.entries)
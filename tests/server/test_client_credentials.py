@@ -0,0 +1,118 @@
+import json
+
+import mock
+import pytest
+import requests
+import tornado.web
+
+import oauth2u
+from oauth2u.server import grants
+from oauth2u.server.database import MemoryDataBase, make_asynchronous, verify_client_secret
+from oauth2u.server.handlers import AccessTokenHandler
+from tests.helpers import (build_access_token_url, build_basic_authorization_header,
+                           parse_json_response)
+from tests.server.test_introspection import post_token
+
+URL = build_access_token_url()
+CONTENT_TYPE = 'application/x-www-form-urlencoded;charset=UTF-8'
+DATA = {'grant_type': 'client_credentials'}
+
+
+def request_access_token(client_id, client_secret):
+    headers = {
+        'Content-Type': CONTENT_TYPE,
+        'Authorization': build_basic_authorization_header(client_id, client_secret),
+        }
+    return requests.post(URL, data=DATA, headers=headers)
+
+
+def test_should_return_access_token_for_valid_client_secret():
+    response = request_access_token('service-client-id', 'service-secret')
+
+    assert 200 == response.status_code
+    body = parse_json_response(response)
+    assert ['access_token', 'token_type', 'expires_in'] == body.keys()
+    assert body['access_token'].startswith('access-token-')
+
+
+def test_should_return_401_for_invalid_client_secret():
+    response = request_access_token('service-client-id', 'invalid-secret')
+
+    assert 401 == response.status_code
+    assert {'error': 'invalid_client',
+            'error_description': 'Invalid client_id or client_secret on Authorization header'
+            } == parse_json_response(response)
+
+
+def test_should_return_401_for_client_without_secret():
+    response = request_access_token('client-id', '')
+
+    assert 401 == response.status_code
+
+
+def test_access_token_should_be_introspected():
+    access_token = json.loads(request_access_token('service-client-id',
+                                                   'service-secret').content)['access_token']
+
+    response = post_token(access_token)
+
+    assert 'service-client-id' == json.loads(response.content)['client_id']
+
+
+def create_application(database):
+    application = mock.Mock(asynchronous_database=make_asynchronous(database),
+                            client_registry=None)
+    application.client_credentials_cache = oauth2u.Server(
+        database=database).create_client_credentials_cache()
+    return application
+
+
+def validate_client_credentials(application, client_id, client_secret):
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.initialize()
+    handler.application = application
+    handler.request = mock.Mock(headers={
+        'Authorization': build_basic_authorization_header(client_id, client_secret)})
+    handler.parse_authorization_header()
+    grants.find('client_credentials').validate(handler).result()
+    return handler
+
+
+def test_should_cache_authenticated_authorization_header():
+    database = MemoryDataBase()
+    database.save_new_client('service-client-id', None, client_secret='secret')
+    application = create_application(database)
+    validate_client_credentials(application, 'service-client-id', 'secret')
+
+    with mock.patch.object(database, 'find_client') as find_client:
+        handler = validate_client_credentials(application, 'service-client-id', 'secret')
+
+    assert not find_client.called
+    assert 'service-client-id' == handler.client_id
+    assert verify_client_secret(handler.authenticated_client, 'secret')
+
+
+def test_should_not_cache_invalid_client_secret():
+    database = MemoryDataBase()
+    database.save_new_client('service-client-id', None, client_secret='secret')
+    application = create_application(database)
+
+    with pytest.raises(tornado.web.HTTPError):
+        validate_client_credentials(application, 'service-client-id', 'invalid-secret')
+
+    assert 0 == len(application.client_credentials_cache)
+
+
+def test_should_invalidate_cached_header_when_client_changes():
+    database = MemoryDataBase()
+    database.save_new_client('service-client-id', None, client_secret='secret')
+    database.save_new_client('other-client-id', None, client_secret='secret')
+    application = create_application(database)
+    validate_client_credentials(application, 'service-client-id', 'secret')
+    validate_client_credentials(application, 'other-client-id', 'secret')
+
+    database.save_new_client('service-client-id', None, client_secret='new-secret')
+
+    assert 1 == len(application.client_credentials_cache)
+    with pytest.raises(tornado.web.HTTPError):
+        validate_client_credentials(application, 'service-client-id', 'secret')
@@ -0,0 +1,98 @@
+import mock
+
+import oauth2u
+from oauth2u.server.clients import ClientRegistry
+from oauth2u.server.database import MemoryDataBase, WriteBehindDataBase
+from oauth2u.server.handlers import AccessTokenHandler
+from tests.helpers import DeferredDataBase
+
+
+def create_registry(database=None):
+    database = database or MemoryDataBase()
+    database.save_new_client('client-id', 'http://example.com')
+    registry = ClientRegistry(database)
+    registry.load()
+    database.add_client_listener(registry.client_changed)
+    return registry
+
+
+def test_should_load_all_clients():
+    registry = create_registry()
+
+    assert 1 == len(registry)
+    assert {'default_redirect_uri': 'http://example.com'} == registry.find('client-id')
+
+
+def test_should_count_hits_and_misses():
+    registry = create_registry()
+
+    registry.find('client-id')
+    registry.find('client-id')
+    registry.find('unknown-client-id')
+
+    assert (1, 2, 1) == registry.stats()
+
+
+def test_should_find_clients_without_querying_database():
+    registry = create_registry()
+
+    with mock.patch.object(registry.database, 'find_client') as find_client:
+        assert registry.find('client-id')
+
+    assert not find_client.called
+
+
+def test_changed_client_should_be_published_on_a_new_snapshot():
+    registry = create_registry()
+    snapshot, version = registry.snapshot, registry.version
+
+    registry.database.save_new_client('new-client-id', None, client_secret='secret')
+
+    assert 'new-client-id' not in snapshot
+    assert 'secret_hash' in registry.find('new-client-id')
+    assert version + 1 == registry.version
+
+
+def test_should_see_clients_pending_on_write_behind_database():
+    database = WriteBehindDataBase(MemoryDataBase())
+    registry = create_registry(database)
+
+    database.save_new_client('new-client-id', None)
+
+    assert registry.find('new-client-id') is not None
+    assert 0 == len(database.database.clients)
+
+
+def test_handlers_should_find_clients_on_registry():
+    registry = create_registry()
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.application = mock.Mock(client_registry=registry)
+
+    assert registry.find('client-id') == handler.find_client('client-id').result()
+    assert not handler.application.asynchronous_database.find_client.called
+
+
+def test_load_should_bring_clients_saved_without_notifying_the_registry():
+    registry = create_registry()
+    registry.database.clients['external-client-id'] = {'default_redirect_uri': None}
+    assert registry.find('external-client-id') is None
+
+    registry.load()
+
+    assert registry.find('external-client-id') is not None
+
+
+def test_should_be_reloaded_periodically():
+    registry = ClientRegistry(MemoryDataBase(), reload_interval=1000)
+
+    assert [(registry.reload, 1000)] == registry.periodic_tasks()
+
+
+def test_server_should_load_registry_from_asynchronous_database():
+    database = MemoryDataBase()
+    database.save_new_client('client-id', 'http://example.com')
+    server = oauth2u.Server(database=DeferredDataBase(database))
+
+    registry = server.create_client_registry()
+
+    assert registry.find('client-id') is not None
@@ -1,5 +1,10 @@
-import datetime
-from oauth2u.server.database import MemoryDataBase
+import time
+
+import mock
+
+from oauth2u.server.database import (MemoryDataBase, AuthorizationCode, RedeemResult,
+                                     hash_client_secret, memory, verify_client_secret)
+from oauth2u.tokens import hash_token
 
 database = MemoryDataBase()
 
@@ -15,6 +20,15 @@ def test_should_save_and_retrieve_client_id():
     assert client['default_redirect_uri'] == callback_uri
 
 
+def test_all_clients_should_list_every_client():
+    db = MemoryDataBase()
+    db.save_new_client('client-id', 'http://example.com')
+    db.save_new_client('other-client-id', None)
+
+    assert [('client-id', {'default_redirect_uri': 'http://example.com'}),
+            ('other-client-id', {'default_redirect_uri': None})] == sorted(db.all_clients())
+
+
 def test_newly_created_client_has_no_authorization_codes():
     database.save_new_client('client-id', 'http://example.com/callback')
     assert 0 == database.client_authorization_codes_count('client-id')
@@ -63,3 +77,221 @@ def test_should_get_state_given_client_id_and_authorization_code():
         'http://example.com/return')
     state = database.get_state('client-id', 'auth-code')
     assert 'my-state' == state
+
+
+def test_find_authorization_code_should_return_record_with_code_information():
+    database.save_new_authorization_code(
+        'auth-code-record', 'client-id', 'my-state',
+        'http://example.com/return')
+    record = database.find_authorization_code('client-id', 'auth-code-record')
+
+    assert 'auth-code-record' == record.code
+    assert 'client-id' == record.client_id
+    assert 'http://example.com/return' == record.redirect_uri
+    assert 'my-state' == record.state
+    assert record.used is False
+    assert record.created_at > 0
+
+
+def test_find_authorization_code_should_return_None_if_code_belongs_to_other_client():
+    database.save_new_client('other-client-id', 'http://example.com/callback')
+    database.save_new_authorization_code(
+        'auth-code-other', 'other-client-id', None,
+        'http://example.com/return')
+
+    assert database.find_authorization_code('client-id', 'auth-code-other') is None
+    assert not database.client_has_authorization_code('client-id', 'auth-code-other')
+
+
+def test_authorization_code_records_should_not_have_instance_dict():
+    record = AuthorizationCode('code', 'client-id', 'http://example.com', None)
+    assert not hasattr(record, '__dict__')
+
+
+def test_databases_should_not_share_storage():
+    other = MemoryDataBase()
+    other.save_new_client('not-shared-client-id', None)
+    assert database.find_client('not-shared-client-id') is None
+
+
+def test_expired_authorization_codes_should_not_be_found(monkeypatch):
+    db = MemoryDataBase(authorization_code_lifetime=60)
+    db.save_new_client('client-id', None)
+    db.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    assert db.client_has_authorization_code('client-id', 'auth-code')
+
+    later = time.time() + 61
+    monkeypatch.setattr(memory.time, 'time', lambda: later)
+    assert not db.client_has_authorization_code('client-id', 'auth-code')
+    assert 0 == db.client_authorization_codes_count('client-id')
+
+
+def test_reap_expired_authorization_codes_should_remove_only_expired_codes():
+    db = MemoryDataBase(authorization_code_lifetime=60)
+    db.save_new_client('client-id', None)
+    db.save_new_authorization_code('old-code', 'client-id', None, 'http://example.com')
+    db.authorization_code_lifetime = 600
+    db.save_new_authorization_code('new-code', 'client-id', None, 'http://example.com')
+
+    assert 1 == db.reap_expired_authorization_codes(now=time.time() + 61)
+    assert 'old-code' not in db.authorization_codes
+    assert 'new-code' in db.authorization_codes
+    assert 1 == db.client_authorization_codes_count('client-id')
+
+
+def test_reap_expired_authorization_codes_should_remove_at_most_limit_codes():
+    db = MemoryDataBase(authorization_code_lifetime=60, reap_batch_size=2)
+    db.save_new_client('client-id', None)
+    for i in range(5):
+        db.save_new_authorization_code('code-%d' % i, 'client-id', None, 'http://example.com')
+
+    later = time.time() + 61
+    assert 2 == db.reap_expired_authorization_codes(now=later)
+    assert 2 == db.reap_expired_authorization_codes(now=later)
+    assert 1 == db.reap_expired_authorization_codes(now=later)
+    assert {} == db.authorization_codes
+
+
+def test_periodic_tasks_should_include_authorization_codes_and_tokens_reapers():
+    db = MemoryDataBase(reap_interval=250)
+    assert [(db.reap_expired_authorization_codes, 250),
+            (db.reap_expired_access_tokens, 250),
+            (db.reap_expired_refresh_tokens, 250)] == db.periodic_tasks()
+
+
+def test_redeem_authorization_code_should_consume_code_once():
+    db = MemoryDataBase()
+    db.save_new_client('client-id', None)
+    db.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    assert RedeemResult.REDEEMED == db.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com')
+    assert db.is_client_authorization_code_used('client-id', 'auth-code')
+    assert RedeemResult.ALREADY_USED == db.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com')
+
+
+def test_redeem_authorization_code_should_validate_client_and_code():
+    db = MemoryDataBase()
+    db.save_new_client('client-id', None)
+    db.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    assert RedeemResult.INVALID_CLIENT == db.redeem_authorization_code(
+        'no-client-id', 'auth-code', 'http://example.com')
+    assert RedeemResult.INVALID_CLIENT == db.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com', authenticating_code='invalid')
+    assert RedeemResult.INVALID_CODE == db.redeem_authorization_code(
+        'client-id', 'invalid', 'http://example.com', authenticating_code='auth-code')
+    assert RedeemResult.REDIRECT_URI_MISMATCH == db.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://other.com')
+    assert not db.is_client_authorization_code_used('client-id', 'auth-code')
+
+
+def test_should_save_and_find_access_token():
+    db = MemoryDataBase()
+    expires_at = time.time() + 60
+    db.save_access_token('access-token', 'client-id', expires_at, scope='read')
+
+    record = db.find_access_token('access-token')
+    assert 'client-id' == record.client_id
+    assert 'read' == record.scope
+    assert expires_at == record.expires_at
+    assert db.find_access_token('invalid') is None
+
+
+def test_should_not_find_expired_access_token():
+    db = MemoryDataBase()
+    db.save_access_token('access-token', 'client-id', time.time() - 1)
+
+    assert db.find_access_token('access-token') is None
+
+
+def test_reap_expired_access_tokens_should_remove_at_most_limit_tokens():
+    db = MemoryDataBase()
+    now = time.time()
+    for i in range(3):
+        db.save_access_token('expired-{0}'.format(i), 'client-id', now - 1)
+    db.save_access_token('live', 'client-id', now + 60)
+
+    assert 2 == db.reap_expired_access_tokens(now=now, limit=2)
+    assert 1 == db.reap_expired_access_tokens(now=now)
+    assert ['live'] == list(db.access_tokens)
+
+
+def test_revoke_access_token_should_forget_token_until_it_expires():
+    db = MemoryDataBase()
+    now = time.time()
+    db.save_access_token('access-token', 'client-id', now + 60)
+    db.revoke_access_token('access-token', now + 60)
+    db.revoke_access_token('signed-token', now - 1)
+
+    assert db.find_access_token('access-token') is None
+    assert db.is_access_token_revoked('access-token')
+    assert not db.is_access_token_revoked('signed-token')
+    assert ['access-token'] == db.revoked_access_tokens()
+
+    assert 1 == db.reap_expired_access_tokens(now=now)
+    assert 1 == db.reap_expired_access_tokens(now=now + 60)
+    assert not db.revocations
+
+
+def test_consume_refresh_token_should_return_token_only_once():
+    db = MemoryDataBase()
+    db.save_refresh_token('token-hash', 'client-id', time.time() + 60)
+
+    assert db.consume_refresh_token('token-hash', 'other-client-id') is None
+    assert 'client-id' == db.consume_refresh_token('token-hash', 'client-id').client_id
+    assert db.consume_refresh_token('token-hash', 'client-id') is None
+
+
+def test_reap_expired_refresh_tokens_should_remove_expired_tokens():
+    db = MemoryDataBase()
+    now = time.time()
+    db.save_refresh_token('expired', 'client-id', now - 1)
+    db.save_refresh_token('live', 'client-id', now + 60)
+
+    assert db.consume_refresh_token('expired', 'client-id') is None
+    assert 1 == db.reap_expired_refresh_tokens(now=now)
+    assert ['live'] == list(db.refresh_tokens)
+
+
+def test_should_keep_only_client_secret_hash():
+    db = MemoryDataBase()
+    db.save_new_client('client-id', None, client_secret='secret')
+    db.save_new_client('no-secret-client-id', None)
+
+    client = db.find_client('client-id')
+    assert 'secret' not in client.values()
+    assert verify_client_secret(client, 'secret')
+    assert not verify_client_secret(client, 'other-secret')
+    assert not verify_client_secret(client, None)
+    assert not verify_client_secret(db.find_client('no-secret-client-id'), '')
+    assert not verify_client_secret(None, 'secret')
+
+
+def test_client_secret_hash_should_be_salted():
+    first, second = hash_client_secret('secret'), hash_client_secret('secret')
+
+    assert first != second
+    assert first.startswith('pbkdf2_sha256$10000$')
+    assert verify_client_secret({'secret_hash': first}, 'secret')
+    assert verify_client_secret({'secret_hash': second}, 'secret')
+
+
+def test_should_verify_unsalted_client_secret_hashes_of_older_versions():
+    client = {'secret_hash': hash_token('secret')}
+
+    assert verify_client_secret(client, 'secret')
+    assert not verify_client_secret(client, 'other-secret')
+
+
+def test_should_notify_client_listeners_when_client_is_saved():
+    db = MemoryDataBase()
+    listener = mock.Mock()
+    db.add_client_listener(listener)
+
+    db.save_new_client('client-id', None)
+    db.save_new_client('client-id', None, client_secret='secret')
+
+    assert [mock.call('client-id')] * 2 == listener.call_args_list
@@ -0,0 +1,62 @@
+import json
+import urlparse
+
+import mock
+import pytest
+import requests
+import tornado.web
+
+from oauth2u.server import errors
+from oauth2u.server.handlers import AccessTokenHandler, add_query_to_url
+from tests.helpers import build_access_token_url
+
+
+def test_errors_should_be_dicts_with_json_and_query_computed():
+    error = errors.OAuthError('invalid_grant', 'Invalid code for this client')
+
+    assert {'error': 'invalid_grant', 'error_description': 'Invalid code for this client'} == error
+    assert dict(error) == json.loads(error.json)
+    assert dict(error) == dict(urlparse.parse_qsl(error.query))
+
+
+def test_find_should_reuse_errors():
+    error = errors.missing_parameter('code')
+
+    assert error is errors.missing_parameter('code')
+    assert u'Parameter code is required' == error['error_description']
+
+
+def test_find_should_keep_a_bounded_number_of_errors(monkeypatch):
+    monkeypatch.setattr(errors, 'MAX_FORMATTED_ERRORS', 2)
+    monkeypatch.setattr(errors, 'formatted_errors', {})
+
+    for name in ('a', 'b', 'c'):
+        errors.missing_parameter(name)
+
+    assert 1 == len(errors.formatted_errors)
+
+
+def test_add_query_to_url_should_use_error_query():
+    url = add_query_to_url('http://example.com/callback?page=1', errors.ACCESS_DENIED)
+
+    assert 'http://example.com/callback?page=1&' + errors.ACCESS_DENIED.query == url
+
+
+def test_should_write_error_json_with_content_type():
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.set_header = mock.Mock()
+    handler.write = mock.Mock()
+    with pytest.raises(tornado.web.HTTPError) as error:
+        handler.raise_http_400(errors.INVALID_CODE)
+
+    handler.get_error_html(400, exception=error.value)
+
+    handler.set_header.assert_called_once_with('Content-Type', 'application/json; charset=UTF-8')
+    handler.write.assert_called_once_with(errors.INVALID_CODE.json)
+
+
+def test_error_responses_should_be_json():
+    response = requests.post(build_access_token_url(), data={'grant_type': 'authorization_code'})
+
+    assert 'application/json; charset=UTF-8' == response.headers['content-type']
+    assert 'invalid_request' == json.loads(response.content)['error']
@@ -0,0 +1,71 @@
+import mock
+import requests
+
+from oauth2u.server import grants
+from tests.helpers import build_access_token_url, build_basic_authorization_header
+
+CONTENT_TYPE = 'application/x-www-form-urlencoded;charset=UTF-8'
+
+
+def test_should_find_registered_grants():
+    assert isinstance(grants.find('authorization_code'), grants.AuthorizationCodeGrant)
+    assert isinstance(grants.find('client_credentials'), grants.ClientCredentialsGrant)
+    assert grants.find('invalid') is None
+    assert grants.find(None) is None
+
+
+def test_should_find_only_enabled_grants():
+    application = mock.Mock(refresh_token_lifetime=None)
+    assert grants.find('refresh_token', application) is None
+    assert ['authorization_code', 'client_credentials'] == grants.enabled_grant_types(application)
+
+    application.refresh_token_lifetime = 3600
+    assert isinstance(grants.find('refresh_token', application), grants.RefreshTokenGrant)
+
+
+def test_unsupported_error_should_list_enabled_grants():
+    application = mock.Mock(refresh_token_lifetime=None)
+    error = grants.unsupported_error(application)
+
+    assert 'unsupported_grant_type' == error['error']
+    assert 'Supported grant_type: authorization_code, client_credentials' == error['error_description']
+
+
+def test_should_register_new_grant(monkeypatch):
+    monkeypatch.setattr(grants, 'GRANTS', dict(grants.GRANTS))
+
+    @grants.register
+    class DummyGrant(grants.Grant):
+        grant_type = 'dummy'
+        required_arguments = ('username',)
+
+    assert isinstance(grants.find('dummy'), DummyGrant)
+    assert 'dummy' in grants.enabled_grant_types()
+
+
+def test_latency_counter_should_count_requests_failures_and_time():
+    counter = grants.LatencyCounter()
+    assert 0 == counter.average_time
+
+    counter.record(0.5)
+    counter.record(1.5, succeeded=False)
+
+    assert (2, 1) == (counter.count, counter.failures)
+    assert (2.0, 1.0, 1.5) == (counter.total_time, counter.average_time, counter.max_time)
+
+
+def test_stats_should_have_a_counter_for_each_grant():
+    stats = grants.stats()
+
+    assert set(['authorization_code', 'client_credentials', 'refresh_token']) <= set(stats)
+    assert all(isinstance(counter, grants.LatencyCounter) for counter in stats.values())
+
+
+def test_client_credentials_grant_should_not_require_code_arguments():
+    headers = {'Content-Type': CONTENT_TYPE,
+               'Authorization': build_basic_authorization_header('service-client-id',
+                                                                 'service-secret')}
+    response = requests.post(build_access_token_url(), headers=headers,
+                             data={'grant_type': 'client_credentials', 'code': 'ignored'})
+
+    assert 200 == response.status_code
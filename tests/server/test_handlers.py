@@ -1,11 +1,16 @@
 import os.path
 
+import mock
 import pytest
 import requests
 import tornado
+import tornado.ioloop
 
-from oauth2u.server import handlers
-from tests.helpers import build_root_url
+from oauth2u.server import errors, handlers
+from oauth2u.server.database import DatabaseFull, MemoryDataBase, SharedMemoryDataBase
+from oauth2u.server.handlers import AccessTokenHandler, AuthorizationHandler
+from oauth2u.tokens import AccessTokenSigner
+from tests.helpers import DeferredDataBase, build_root_url
 
 
 def setup_function(func):
@@ -65,7 +70,37 @@ def test_add_query_to_url_should_add_more_query_params_to_url():
     params = {'foo': 'bar'}
 
     result = handlers.add_query_to_url(url, params)
-    assert 'http://www.example.com/path?foo=bar&name=value' == result
+    assert 'http://www.example.com/path?name=value&foo=bar' == result
+
+
+def test_add_query_to_url_should_keep_query_order_and_duplicates():
+    url = 'http://www.example.com/path?b=2&a=1&b=3&empty=#fragment'
+
+    result = handlers.add_query_to_url(url, {'code': 'abc'})
+    assert 'http://www.example.com/path?b=2&a=1&b=3&empty=&code=abc#fragment' == result
+
+
+def test_add_query_to_url_should_replace_params_with_same_name():
+    url = 'http://www.example.com/path?state=old&name=value&state=older'
+
+    result = handlers.add_query_to_url(url, {'state': 'new'})
+    assert 'http://www.example.com/path?name=value&state=new' == result
+
+
+def test_add_query_to_url_should_not_add_question_mark_without_params():
+    assert 'http://www.example.com/path' == handlers.add_query_to_url(
+        'http://www.example.com/path', {})
+
+
+def test_add_query_to_url_should_parse_each_url_once(monkeypatch):
+    url = 'http://www.example.com/parsed-once'
+    handlers.add_query_to_url(url, {'code': 'first'})
+    urlsplit = mock.Mock()
+    monkeypatch.setattr(handlers.defaults.urlparse, 'urlsplit', urlsplit)
+
+    result = handlers.add_query_to_url(url, {'code': 'second'})
+    assert 'http://www.example.com/parsed-once?code=second' == result
+    assert not urlsplit.called
 
 
 def test_should_return_500_for_error():
@@ -73,6 +108,62 @@ def test_should_return_500_for_error():
     assert 500 == resp.status_code
 
 
+def test_should_answer_503_when_database_is_full():
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.set_header = mock.Mock()
+    handler.write = mock.Mock()
+    error = DatabaseFull('No free slot')
+
+    handler.get_error_html(error.status_code, exception=error)
+
+    assert 503 == error.status_code
+    handler.write.assert_called_once_with(errors.TEMPORARILY_UNAVAILABLE.json)
+    assert 'temporarily_unavailable' == handler.error_code
+
+
+def test_authorization_handler_should_redirect_codes_found_on_asynchronous_database():
+    database = MemoryDataBase()
+    database.save_new_client('client-id', None)
+    database.save_new_authorization_code('code', 'client-id', 'state', 'http://example.com/cb')
+    handler = AuthorizationHandler.__new__(AuthorizationHandler)
+    handler.initialize()
+    handler.application = mock.Mock(asynchronous_database=DeferredDataBase(database))
+    handler.redirect = mock.Mock()
+
+    tornado.ioloop.IOLoop.instance().run_sync(
+        lambda: handler.redirect_access_denied('client-id', 'code'))
+
+    url, = handler.redirect.call_args[0]
+    assert 'http://example.com/cb?' + errors.ACCESS_DENIED.query == url
+    assert 'access_denied' == handler.error_code
+
+
+def test_authorization_handler_should_refuse_values_too_long_for_the_database():
+    arguments = {'client_id': 'client-id', 'redirect_uri': 'http://example.com/cb',
+                 'state': 'x' * 257}
+    handler = AuthorizationHandler.__new__(AuthorizationHandler)
+    handler.initialize()
+    handler.application = mock.Mock(database=SharedMemoryDataBase(capacity=8))
+    handler.get_argument = lambda name, default=None: arguments.get(name, default)
+
+    with pytest.raises(tornado.web.HTTPError) as error:
+        handler.load_parameters().result()
+
+    assert 400 == error.value.status_code
+    assert errors.parameter_too_long('state', 256) == error.value.response_body
+
+
+def test_access_token_handler_should_build_signed_access_token_if_signer_configured():
+    signer = AccessTokenSigner('secret')
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.application = mock.Mock(access_token_signer=signer)
+    handler.client_id = 'client-id'
+
+    info = signer.verify(handler.build_access_token())
+
+    assert 'client-id' == info['client_id']
+
+
 # custom asserts
 
 def assert_no_url_handler_for(url):
@@ -83,3 +174,4 @@ def assert_url_handler(url, handler):
 
 def assert_url_handler_name(url, handler_name):
     assert dict(handlers.items())[url].__name__ == handler_name
+
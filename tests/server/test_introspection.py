@@ -0,0 +1,130 @@
+import json
+import time
+
+import mock
+import requests
+import tornado.concurrent
+
+from oauth2u.server.bloom import RevocationFilter
+from oauth2u.server.cache import LRUCache
+from oauth2u.server.database import AccessToken
+from oauth2u.server.handlers import IntrospectionHandler
+from oauth2u.tokens import AccessTokenSigner
+from tests.helpers import (build_root_url, build_access_token_url,
+                           build_basic_authorization_header,
+                           request_authorization_code)
+
+URL = build_root_url('/introspect')
+
+
+def request_access_token(client_id='client-id'):
+    code = request_authorization_code(client_id)
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8',
+        'Authorization': build_basic_authorization_header(client_id, code),
+        }
+    data = {'grant_type': 'authorization_code', 'code': code,
+            'redirect_uri': 'http://callback'}
+    response = requests.post(build_access_token_url(), data=data, headers=headers)
+    return json.loads(response.content)['access_token']
+
+
+def post_token(token, client_id='service-client-id', client_secret='service-secret'):
+    headers = {'Authorization': build_basic_authorization_header(client_id, client_secret)}
+    return requests.post(URL, data={'token': token}, headers=headers)
+
+
+def test_should_introspect_issued_access_token():
+    access_token = request_access_token()
+
+    response = post_token(access_token)
+
+    assert 200 == response.status_code
+    assert 'no-store' == response.headers['Cache-Control']
+    body = json.loads(response.content)
+    assert body.pop('active') is True
+    assert 'bearer' == body['token_type']
+    assert 'client-id' == body['client_id']
+    assert time.time() < body['exp'] <= time.time() + 3600
+
+
+def test_should_return_inactive_for_unknown_token():
+    response = post_token('invalid-token')
+
+    assert 200 == response.status_code
+    assert {'active': False} == json.loads(response.content)
+
+
+def test_should_require_client_authentication():
+    access_token = request_access_token()
+
+    assert 400 == requests.post(URL, data={'token': access_token}).status_code
+    assert 401 == post_token(access_token, client_secret='wrong-secret').status_code
+    assert 401 == post_token(access_token, client_id='unknown-client-id').status_code
+
+
+def test_should_require_token():
+    response = requests.post(URL)
+
+    assert 400 == response.status_code
+    assert {'error': 'invalid_request',
+            'error_description': 'Parameter token is required'} == json.loads(response.content)
+
+
+# introspect() with a fake application
+
+def create_handler(signer=None, record=None):
+    future = tornado.concurrent.TracebackFuture()
+    future.set_result(record)
+    handler = IntrospectionHandler.__new__(IntrospectionHandler)
+    handler.application = mock.Mock(access_token_signer=signer,
+                                     introspection_cache=LRUCache())
+    handler.application.revocation_filter = RevocationFilter(handler.application.database)
+    handler.application.asynchronous_database.find_access_token.return_value = future
+    return handler
+
+
+def introspect(handler, token):
+    return handler.introspect(token).result()
+
+
+def test_introspect_should_cache_active_tokens():
+    record = AccessToken('access-token', 'client-id', time.time() + 60, scope='read')
+    handler = create_handler(record=record)
+
+    first = introspect(handler, 'access-token')
+    assert first == introspect(handler, 'access-token')
+    assert 'read' == first['scope']
+    assert 1 == handler.application.asynchronous_database.find_access_token.call_count
+    assert 1 == handler.application.introspection_cache.hits
+
+
+def test_introspect_should_not_cache_inactive_tokens():
+    handler = create_handler()
+
+    assert {'active': False} == introspect(handler, 'invalid')
+    assert 'invalid' not in handler.application.introspection_cache
+
+
+def test_introspect_should_verify_signed_tokens_without_database():
+    signer = AccessTokenSigner('secret')
+    handler = create_handler(signer=signer)
+
+    response = introspect(handler, signer.sign('client-id', 60, scope='read'))
+
+    assert response['active']
+    assert ('client-id', 'read') == (response['client_id'], response['scope'])
+    assert not handler.application.asynchronous_database.find_access_token.called
+
+
+def test_open_introspection_should_not_authenticate_clients():
+    handler = create_handler(record=AccessToken('access-token', 'client-id', time.time() + 60))
+    handler.application.open_introspection = True
+    handler.get_argument = mock.Mock(return_value='access-token')
+    handler.authenticate_client = mock.Mock()
+    handler.write = mock.Mock()
+
+    handler.post().result()
+
+    assert not handler.authenticate_client.called
+    assert handler.write.call_args[0][0]['active']
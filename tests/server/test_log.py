@@ -1,7 +1,10 @@
+import json
 import logging
+import os
 from logging.handlers import TimedRotatingFileHandler
 
 import mock
+import pytest
 
 from oauth2u.server import log
 
@@ -9,11 +12,14 @@ def setup_function(func):
     logging.root.handlers = []
 
 def teardown_function(func):
+    log.stop()
     logging.root.handlers = []
+    logging.getLogger(log.ACCESS_LOGGER).handlers = []
 
 
 def test_configure_should_call_basicConfig_on_logging_with_default_parameters(monkeypatch):
     logging_mock = mock.Mock()
+    logging_mock.getLogger.return_value.handlers = []
     monkeypatch.setattr(log, 'logging', logging_mock)
 
     log.configure()
@@ -65,6 +71,95 @@ def test_log_functions_are_passed_to_logging_module(monkeypatch):
         function.assert_called_with('logging a %s message', 'cool')
 
 
+def test_configure_should_write_records_on_background_thread_if_queue_size_provided(tmpdir):
+    filename = str(tmpdir.join('server.log'))
+    log.configure(filename=filename, queue_size=100)
+    logger = log.logging.root
+
+    assert [log.listener.queue_handler] == logger.handlers
+    assert_time_rotating_file_handler(log.listener)
+
+    log.info('logging a %s message', 'queued')
+    log.stop()
+
+    assert 'logging a queued message' in open(filename).read()
+    assert_time_rotating_file_handler(logger)
+
+
+def test_queue_handler_should_drop_records_if_queue_is_full():
+    queue_handler = log.QueueHandler(log.Queue.Queue(1))
+    record = logging.makeLogRecord({'msg': 'message'})
+
+    queue_handler.emit(record)
+    queue_handler.emit(record)
+
+    assert 1 == queue_handler.queue.qsize()
+    assert 1 == queue_handler.dropped
+
+
+def test_queue_handler_should_wait_for_room_if_blocking():
+    queue = mock.Mock()
+    queue_handler = log.QueueHandler(queue, block=True)
+    record = logging.makeLogRecord({'msg': 'message'})
+
+    queue_handler.emit(record)
+
+    queue.put.assert_called_once_with(record)
+
+
+def test_dropped_records_should_be_counted_by_queue_handler():
+    assert 0 == log.dropped_records()
+
+    log.configure(queue_size=1)
+    log.listener.queue_handler.dropped = 3
+
+    assert 3 == log.dropped_records()
+
+
+def test_queue_listener_should_restart_in_forked_process(tmpdir):
+    filename = str(tmpdir.join('server.log'))
+    log.configure(filename=filename, queue_size=100)
+
+    pid = os.fork()
+    if pid == 0:
+        log.info('logging from the %s process', 'forked')
+        log.stop()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert 'logging from the forked process' in open(filename).read()
+
+
+def test_queue_listener_stop_should_do_nothing_the_second_time(tmpdir):
+    log.configure(filename=str(tmpdir.join('server.log')), queue_size=100)
+    listener = log.listener
+    log.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+    listener.stop()
+
+    assert not listener.thread.is_alive()
+
+
+def test_access_log_should_write_json_lines_apart_from_application_log(tmpdir):
+    filename = str(tmpdir.join('server.log'))
+    access_filename = str(tmpdir.join('access.log'))
+    for queue_size in None, 100:
+        log.configure(filename=filename, access_filename=access_filename, queue_size=queue_size)
+
+        log.access('%s', json.dumps({'status': 200}))
+        log.stop()
+
+        assert {'status': 200} == json.loads(open(access_filename).readlines()[-1])
+        assert 'status' not in open(filename).read()
+
+
+def test_configure_should_refuse_unknown_queue_policy():
+    with pytest.raises(ValueError):
+        log.configure(queue_size=1, queue_policy='wait')
+
+
 # custom asserts
 
 def assert_time_rotating_file_handler(logger):
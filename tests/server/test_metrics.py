@@ -0,0 +1,155 @@
+import mock
+import requests
+
+from oauth2u.server import metrics
+from oauth2u.server.bloom import RevocationFilter
+from oauth2u.server.cache import LRUCache
+from oauth2u.server.database import (MemoryDataBase, SQLiteDataBase, SharedMemoryDataBase,
+                                     WriteBehindDataBase)
+from oauth2u.server.handlers import AccessTokenHandler
+from tests.helpers import (build_access_token_url, build_basic_authorization_header,
+                           build_root_url, request_authorization_code)
+
+URL = build_root_url('/metrics')
+HEADERS = {'Authorization': build_basic_authorization_header('service-client-id', 'service-secret')}
+
+
+def create_application():
+    database = MemoryDataBase()
+    application = mock.Mock(database=database, introspection_cache=LRUCache(),
+                            client_credentials_cache=LRUCache(), client_registry=None)
+    application.revocation_filter = RevocationFilter(database)
+    return application
+
+
+def test_counter_should_count_by_labels():
+    counter = metrics.Counter('requests_total', 'Requests', ('outcome',))
+    counter.inc(('success',))
+    counter.inc(('success',))
+    counter.inc(('client_error',), 3)
+
+    assert [('requests_total', [('outcome', 'client_error')], 3),
+            ('requests_total', [('outcome', 'success')], 2)] == list(counter.samples())
+
+
+def test_histogram_should_have_cumulative_buckets_sum_and_count():
+    histogram = metrics.Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(3.0)
+
+    assert [('latency_seconds_bucket', [('le', 0.1)], 2),
+            ('latency_seconds_bucket', [('le', 1.0)], 3),
+            ('latency_seconds_bucket', [('le', '+Inf')], 4),
+            ('latency_seconds_sum', [], 3.65),
+            ('latency_seconds_count', [], 4)] == list(histogram.samples())
+
+
+def test_record_request_should_count_request_and_observe_its_phases():
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.initialize()
+    handler.request = mock.Mock()
+    handler.request.request_time.return_value = 0.002
+    handler.get_status = mock.Mock(return_value=200)
+    with handler.timing('database'):
+        pass
+    labels = ('AccessTokenHandler', 'success')
+    requests_before = metrics.REQUESTS.values.get(labels, 0)
+
+    metrics.record_request(handler)
+
+    assert requests_before + 1 == metrics.REQUESTS.values[labels]
+    assert ('AccessTokenHandler',) in metrics.REQUEST_SECONDS.series
+    assert ('AccessTokenHandler', 'database') in metrics.PHASE_SECONDS.series
+
+
+def test_render_should_describe_every_metric():
+    application = create_application()
+    application.database.save_new_authorization_code('code', 'client-id', 'state', None)
+
+    text = metrics.render(application)
+
+    assert text.endswith('\n')
+    assert '# TYPE oauth2u_requests_total counter' in text
+    assert '# TYPE oauth2u_request_phase_seconds histogram' in text
+    assert 'oauth2u_authorization_codes 1\n' in text
+    assert 'oauth2u_cache_hits_total{cache="introspection_cache"} 0\n' in text
+    assert 'oauth2u_revocation_filter_tokens 0\n' in text
+    assert '# TYPE oauth2u_grant_requests_total counter' in text
+
+
+def test_escape_should_escape_label_values():
+    assert 'a\\"b\\\\c\\n' == metrics.escape('a"b\\c\n')
+
+
+def test_authorization_codes_count_should_count_stored_codes(tmpdir):
+    for database in (MemoryDataBase(), SQLiteDataBase(str(tmpdir.join('oauth2u.db')))):
+        database.save_new_client('client-id', 'http://example.com/callback')
+        database.save_new_authorization_code('code-1', 'client-id', 'state', None)
+        database.save_new_authorization_code('code-2', 'client-id', 'state', None)
+
+        assert 2 == database.authorization_codes_count()
+
+
+def test_authorization_codes_count_should_not_count_reaped_codes():
+    database = MemoryDataBase()
+    database.save_new_client('client-id', 'http://example.com/callback')
+    database.save_new_authorization_code('code-1', 'client-id', 'state', None)
+    database.authorization_code_lifetime = -1
+    database.save_new_authorization_code('code-2', 'client-id', 'state', None)
+
+    database.reap_expired_authorization_codes()
+
+    assert 1 == database.authorization_codes_count()
+
+
+def test_write_behind_authorization_codes_count_should_not_flush():
+    database = WriteBehindDataBase(MemoryDataBase())
+    database.save_new_client('client-id', 'http://example.com/callback')
+    database.flush_all()
+    database.save_new_authorization_code('code', 'client-id', 'state', None)
+
+    assert 1 == database.authorization_codes_count()
+    assert 1 == len(database.pending_writes)
+
+
+def test_render_should_not_have_stored_codes_gauge_over_shared_memory():
+    application = create_application()
+    application.database = WriteBehindDataBase(SharedMemoryDataBase(capacity=8))
+
+    assert not application.database.counts_authorization_codes
+    assert 'oauth2u_authorization_codes ' not in metrics.render(application)
+
+
+def test_metrics_endpoint_should_count_issued_codes():
+    request_authorization_code()
+
+    response = requests.get(URL, headers=HEADERS)
+
+    assert 200 == response.status_code
+    assert metrics.CONTENT_TYPE == response.headers['Content-Type']
+    assert 'oauth2u_authorization_codes_issued_total ' in response.text
+    assert 'oauth2u_requests_total{handler="AuthorizationHandler"' in response.text
+
+
+def test_metrics_endpoint_should_require_client_authentication():
+    assert 400 == requests.get(URL).status_code
+    assert 401 == requests.get(URL, headers={
+        'Authorization': build_basic_authorization_header('service-client-id', 'wrong')}).status_code
+
+
+def test_metrics_endpoint_should_describe_access_token_requests_and_stored_codes():
+    code = request_authorization_code('client-id')
+    requests.post(build_access_token_url(),
+                  data={'grant_type': 'authorization_code', 'code': code,
+                        'redirect_uri': 'http://callback'},
+                  headers={'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8',
+                           'Authorization': build_basic_authorization_header('client-id', code)})
+
+    text = requests.get(URL, headers=HEADERS).text
+
+    assert 'oauth2u_grant_requests_total{grant_type="authorization_code"} ' in text
+    assert 'oauth2u_requests_total{handler="AccessTokenHandler",outcome="success"} ' in text
+    assert 'oauth2u_access_tokens_issued_total ' in text
+    assert '\noauth2u_authorization_codes ' in text
@@ -1,9 +1,15 @@
 import os.path
 
+import mock
 import requests
 import pytest
+import tornado.concurrent
+import tornado.gen
+import tornado.ioloop
+import tornado.web
 
-from oauth2u.server import plugins
+from oauth2u.server import errors, plugins
+from oauth2u.server.handlers import AccessTokenHandler
 from tests.helpers import build_authorize_url
 
 def setup_function(funct):
@@ -32,7 +38,7 @@ def test_should_raise_InvalidPlugin_if_trying_to_register_on_non_existent_plugin
     assert "Plugin name 'NON-EXISTENT-PLUGIN' is invalid" in str(error)
 
 
-def test_should_override_existing_plugin_if_new_register():
+def test_should_chain_plugins_in_registration_order():
     @plugins.authorization_GET
     def on_authorization_GET(handler):
         handler.write('do nothing')
@@ -41,7 +47,9 @@ def test_should_override_existing_plugin_if_new_register():
     def new_on_authorization_GET(handler):
         handler.write('no a bit more...')
 
-    assert_plugin_is('authorization-GET', new_on_authorization_GET)
+    assert [on_authorization_GET, new_on_authorization_GET] == plugins.PLUGINS['authorization-GET']
+    assert (on_authorization_GET, new_on_authorization_GET) == plugins.find_all('authorization-GET')
+    assert on_authorization_GET is plugins.find('authorization-GET')
 
 
 def test_should_find_plugin_by_name():
@@ -49,7 +57,8 @@ def test_should_find_plugin_by_name():
     def on_authorization_GET(handler):
         handler.write('do nothing')
 
-    assert on_authorization_GET == plugins.find('authorization-GET')
+    assert on_authorization_GET is plugins.find('authorization-GET')
+    assert (on_authorization_GET,) == plugins.find_all('authorization-GET')
 
 
 def test_should_raise_PluginNotFound_if_trying_to_find_plugin_but_none_registered():
@@ -59,6 +68,11 @@ def test_should_raise_PluginNotFound_if_trying_to_find_plugin_but_none_registere
     assert "No plugin registered to 'authorization-POST'" in str(error)
 
 
+def test_find_all_should_raise_PluginNotFound_if_none_registered():
+    with pytest.raises(plugins.PluginNotFound):
+        plugins.find_all('authorization-POST')
+
+
 def test_should_raise_InvalidPlugin_if_trying_to_find_plugin_on_invalid_plugin_name():
     with pytest.raises(plugins.InvalidPlugin) as error:
         plugins.find('NO-SUCH-PLUGIN-NAME')
@@ -106,10 +120,167 @@ def test_call_should_return_False_if_plugin_raises_IgnorePlugin():
     assert ["handler"] == called
 
 
+def test_call_should_call_every_plugin_in_order():
+    called = []
+    @plugins.access_token_validation
+    def ignored(handler):
+        called.append('ignored')
+        raise plugins.IgnorePlugin()
+
+    @plugins.access_token_validation
+    def validate(handler):
+        called.append('validate')
+
+    assert plugins.call('access-token-validation', 'handler') is True
+    assert ['ignored', 'validate'] == called
+
+
+def test_call_should_not_call_next_plugins_if_one_raises():
+    second = mock.Mock()
+    @plugins.access_token_validation
+    def reject(handler):
+        raise ValueError('rejected')
+
+    plugins.access_token_validation(second)
+
+    with pytest.raises(ValueError):
+        plugins.call('access-token-validation', 'handler')
+    assert not second.called
+
+
+def finishing_handler():
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler._finished = False
+    return handler
+
+
+def test_call_should_stop_once_a_plugin_finishes_the_response():
+    second = mock.Mock()
+    @plugins.authorization_GET
+    def redirect(handler):
+        handler._finished = True
+
+    plugins.authorization_GET(second)
+
+    assert plugins.call('authorization-GET', finishing_handler()) is True
+    assert not second.called
+
+
+def test_call_async_should_stop_once_a_plugin_finishes_the_response():
+    second = mock.Mock()
+    @plugins.authorization_GET
+    @tornado.gen.coroutine
+    def redirect(handler):
+        handler._finished = True
+
+    plugins.authorization_GET(second)
+
+    assert plugins.call_async('authorization-GET', finishing_handler()).result() is True
+    assert not second.called
+
+
+def test_call_should_count_calls_and_failures_of_each_plugin():
+    @plugins.access_token_validation
+    def validate(handler):
+        if handler == 'invalid':
+            raise ValueError('rejected')
+
+    plugins.call('access-token-validation', 'valid')
+    with pytest.raises(ValueError):
+        plugins.call('access-token-validation', 'invalid')
+
+    (name, function, counter), = plugins.stats()
+    assert ('access-token-validation', validate) == (name, function)
+    assert (2, 1) == (counter.count, counter.failures)
+
+
+def test_should_refuse_plugins_after_registration_is_closed():
+    plugins.close_registration()
+
+    with pytest.raises(plugins.InvalidPlugin):
+        plugins.authorization_GET(lambda handler: None)
+
+    plugins.unregister_all()
+    plugins.authorization_GET(lambda handler: None)
+
+
+def test_call_async_should_call_synchronous_plugins():
+    called = []
+    plugins.authorization_GET(called.append)
+
+    assert run(plugins.call_async, 'authorization-GET', 'handler') is True
+    assert ['handler'] == called
+
+
+def test_call_async_should_return_False_without_plugin():
+    assert run(plugins.call_async, 'authorization-GET', 'handler') is False
+
+
+def test_call_async_should_wait_for_coroutine_plugins():
+    called = []
+    @plugins.access_token_validation
+    @tornado.gen.coroutine
+    def validate(handler):
+        yield tornado.gen.Task(tornado.ioloop.IOLoop.current().add_callback)
+        called.append(handler)
+        raise plugins.IgnorePlugin()
+
+    assert run(plugins.call_async, 'access-token-validation', 'handler') is False
+    assert ['handler'] == called
+
+
+def test_call_async_should_call_fallback_when_plugin_times_out():
+    fallback = mock.Mock()
+    @plugins.access_token_validation
+    @plugins.timeout(0.01, fallback=fallback)
+    def validate(handler):
+        return tornado.concurrent.TracebackFuture()
+
+    assert run(plugins.call_async, 'access-token-validation', 'handler') is True
+    fallback.assert_called_once_with('handler')
+
+
+def test_call_async_should_raise_PluginTimeout_without_fallback():
+    @plugins.access_token_validation
+    @plugins.timeout(0.01)
+    def validate(handler):
+        return tornado.concurrent.TracebackFuture()
+
+    with pytest.raises(plugins.PluginTimeout):
+        run(plugins.call_async, 'access-token-validation', 'handler')
+
+
+def test_handlers_should_respond_503_when_plugin_times_out():
+    plugins.access_token_validation(plugins.timeout(0.01)(
+        lambda handler: tornado.concurrent.TracebackFuture()))
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+
+    with pytest.raises(tornado.web.HTTPError) as error:
+        run(handler.call_plugin, 'access-token-validation')
+
+    assert 503 == error.value.status_code
+    assert errors.TEMPORARILY_UNAVAILABLE == error.value.response_body
+
+
+def test_call_plugin_should_return_False_when_plugin_times_out_and_handler_does_not_raise():
+    plugins.access_token_validation(plugins.timeout(0.01)(
+        lambda handler: tornado.concurrent.TracebackFuture()))
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.plugin_timed_out = mock.Mock()
+
+    assert run(handler.call_plugin, 'access-token-validation') is False
+    assert 'access-token-validation' == handler.plugin_timed_out.call_args[0][0]
+
+
+def run(function, *args):
+    return tornado.ioloop.IOLoop.instance().run_sync(lambda: function(*args), timeout=5)
+
+
 # custom asserts
 
 def assert_no_plugin_for(plugin_name):
-    assert plugins.PLUGINS[plugin_name] is None
+    assert [] == plugins.PLUGINS[plugin_name]
+    assert () == plugins.CHAINS[plugin_name]
 
 def assert_plugin_is(plugin_name, function):
-    assert function == plugins.PLUGINS[plugin_name]
+    assert [function] == plugins.PLUGINS[plugin_name]
@@ -0,0 +1,71 @@
+import signal
+import time
+import socket
+
+import mock
+import pytest
+
+from oauth2u.server import process
+
+
+def test_bind_sockets_should_use_tornado_to_bind_shared_sockets(monkeypatch):
+    bind_sockets_mock = mock.Mock()
+    monkeypatch.setattr(process.tornado.netutil, 'bind_sockets', bind_sockets_mock)
+
+    assert bind_sockets_mock.return_value == process.bind_sockets(8889)
+    bind_sockets_mock.assert_called_with(8889)
+
+
+def test_bind_sockets_should_set_SO_REUSEPORT_if_reuse_port():
+    sockets = process.bind_sockets(0, reuse_port=True)
+    try:
+        assert 1 == len(sockets)
+        assert sockets[0].getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT)
+    finally:
+        sockets[0].close()
+
+
+def test_supervisor_should_restart_workers_that_exit():
+    supervisor = process.Supervisor(2, lambda worker_id: None, max_restarts=3)
+
+    with pytest.raises(RuntimeError):
+        supervisor.start()
+
+    assert 4 == supervisor.restarts
+
+
+def test_supervisor_should_stop_and_wait_for_workers_before_giving_up():
+    def worker(worker_id):
+        if worker_id == 1:
+            time.sleep(60)
+
+    supervisor = process.Supervisor(2, worker, max_restarts=2)
+
+    with pytest.raises(RuntimeError):
+        supervisor.start()
+
+    assert supervisor.stopping
+    assert {} == supervisor.children
+
+
+def test_supervisor_should_not_restart_workers_after_stop():
+    supervisor = process.Supervisor(2, lambda worker_id: None)
+    supervisor.stop()
+
+    supervisor.start()
+
+    assert 0 == supervisor.restarts
+    assert {} == supervisor.children
+
+
+def test_supervisor_stop_should_send_SIGTERM_to_workers(monkeypatch):
+    kill_mock = mock.Mock()
+    monkeypatch.setattr(process.os, 'kill', kill_mock)
+    supervisor = process.Supervisor(2, lambda worker_id: None)
+    supervisor.children = {123: 0, 456: 1}
+
+    supervisor.stop()
+
+    assert supervisor.stopping
+    kill_mock.assert_any_call(123, signal.SIGTERM)
+    kill_mock.assert_any_call(456, signal.SIGTERM)
@@ -0,0 +1,167 @@
+import json
+
+import mock
+import pytest
+import requests
+import tornado.web
+
+from oauth2u.server import errors, grants
+from oauth2u.server.database import MemoryDataBase, make_asynchronous
+from oauth2u.server.handlers import AccessTokenHandler
+from oauth2u.tokens import hash_token
+from tests.helpers import (build_access_token_url, build_basic_authorization_header,
+                           request_authorization_code)
+
+URL = build_access_token_url()
+
+
+def create_handler(database=None, refresh_token_lifetime=3600, client_id='client-id',
+                   client_secret=None):
+    database = database or MemoryDataBase()
+    if database.find_client(client_id) is None:
+        database.save_new_client(client_id, None, client_secret=client_secret)
+    handler = AccessTokenHandler.__new__(AccessTokenHandler)
+    handler.initialize()
+    handler.application = mock.Mock(database=database,
+                                    asynchronous_database=make_asynchronous(database),
+                                    access_token_signer=None, client_registry=None,
+                                    refresh_token_lifetime=refresh_token_lifetime)
+    handler.client_id = client_id
+    handler.code_from_header = client_secret or ''
+    handler.request = mock.Mock(headers={
+        'Authorization': build_basic_authorization_header(client_id, client_secret or '')})
+    handler.grant = grants.find('authorization_code')
+    handler.write = mock.Mock()
+    return handler
+
+
+def validate_refresh_token(handler):
+    return grants.find('refresh_token', handler.application).validate(handler).result()
+
+
+def test_should_accept_refresh_token_grant_only_if_refresh_tokens_are_issued():
+    assert grants.find('refresh_token', create_handler().application)
+    assert grants.find('refresh_token', create_handler(refresh_token_lifetime=None).application) is None
+
+
+def test_should_store_refresh_token_hash_only():
+    handler = create_handler()
+
+    refresh_token = handler.issue_refresh_token().result()
+
+    database = handler.application.database
+    assert refresh_token not in database.refresh_tokens
+    assert 'client-id' == database.refresh_tokens[hash_token(refresh_token)].client_id
+
+
+def test_should_include_refresh_token_on_response():
+    handler = create_handler()
+
+    handler.build_response().result()
+
+    response = handler.write.call_args[0][0]
+    assert hash_token(response['refresh_token']) in handler.application.database.refresh_tokens
+
+
+def test_should_not_include_refresh_token_on_response_if_disabled():
+    handler = create_handler(refresh_token_lifetime=None)
+
+    handler.build_response().result()
+
+    assert 'refresh_token' not in handler.write.call_args[0][0]
+
+
+def test_refresh_token_should_be_used_only_once():
+    handler = create_handler()
+    handler.refresh_token = handler.issue_refresh_token().result()
+
+    validate_refresh_token(handler)
+
+    with pytest.raises(tornado.web.HTTPError) as error:
+        validate_refresh_token(handler)
+    assert 400 == error.value.status_code
+    assert {'error': 'invalid_grant',
+            'error_description': 'Invalid refresh token for this client'} == error.value.response_body
+
+
+def test_refresh_token_should_be_used_only_by_its_client():
+    handler = create_handler()
+    refresh_token = handler.issue_refresh_token().result()
+    other = create_handler(handler.application.database, client_id='other-client-id')
+    other.refresh_token = refresh_token
+
+    with pytest.raises(tornado.web.HTTPError):
+        validate_refresh_token(other)
+    assert hash_token(refresh_token) in handler.application.database.refresh_tokens
+
+
+def test_should_not_include_refresh_token_on_client_credentials_response():
+    handler = create_handler()
+    handler.grant = grants.find('client_credentials')
+
+    handler.build_response().result()
+
+    assert 'refresh_token' not in handler.write.call_args[0][0]
+
+
+def test_refresh_token_should_require_client_secret_if_client_has_one():
+    handler = create_handler(client_id='service-client-id', client_secret='secret')
+    handler.refresh_token = handler.issue_refresh_token().result()
+    handler.code_from_header = 'wrong-secret'
+
+    with pytest.raises(tornado.web.HTTPError) as error:
+        validate_refresh_token(handler)
+    assert 401 == error.value.status_code
+    assert hash_token(handler.refresh_token) in handler.application.database.refresh_tokens
+
+    handler.code_from_header = 'secret'
+    validate_refresh_token(handler)
+
+
+# through the test server, which issues refresh tokens
+
+def request_access_token(data, client_id='client-id', code='secret'):
+    headers = {'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8',
+               'Authorization': build_basic_authorization_header(client_id, code)}
+    return requests.post(URL, data=data, headers=headers)
+
+
+def request_refresh_token(client_id='client-id'):
+    code = request_authorization_code(client_id)
+    response = request_access_token({'grant_type': 'authorization_code', 'code': code,
+                                     'redirect_uri': 'http://callback'}, client_id, code)
+    assert 200 == response.status_code
+    return json.loads(response.content)['refresh_token']
+
+
+def test_refresh_token_grant_should_issue_new_access_and_refresh_tokens():
+    refresh_token = request_refresh_token()
+
+    response = request_access_token({'grant_type': 'refresh_token',
+                                     'refresh_token': refresh_token})
+
+    body = json.loads(response.content)
+    assert 200 == response.status_code
+    assert body['access_token'].startswith('access-token-')
+    assert refresh_token != body['refresh_token']
+
+
+def test_refresh_token_grant_should_refuse_a_used_refresh_token():
+    refresh_token = request_refresh_token()
+    data = {'grant_type': 'refresh_token', 'refresh_token': refresh_token}
+    assert 200 == request_access_token(data).status_code
+
+    response = request_access_token(data)
+
+    assert 400 == response.status_code
+    assert errors.INVALID_REFRESH_TOKEN == json.loads(response.content)
+
+
+def test_refresh_token_grant_should_refuse_other_clients():
+    refresh_token = request_refresh_token()
+
+    response = request_access_token({'grant_type': 'refresh_token',
+                                     'refresh_token': refresh_token}, client_id='bob-client-id')
+
+    assert 400 == response.status_code
+    assert errors.INVALID_REFRESH_TOKEN == json.loads(response.content)
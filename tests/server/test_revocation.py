@@ -0,0 +1,67 @@
+import json
+
+import requests
+
+from tests.helpers import build_root_url, build_basic_authorization_header
+from tests.server.test_introspection import post_token, request_access_token
+
+URL = build_root_url('/revoke')
+
+
+def introspect(token):
+    return json.loads(post_token(token).content)
+
+
+def revoke(token, client_id='client-id', client_secret=''):
+    headers = {'Authorization': build_basic_authorization_header(client_id, client_secret)}
+    return requests.post(URL, data={'token': token}, headers=headers)
+
+
+def test_should_revoke_issued_access_token():
+    access_token = request_access_token()
+    assert introspect(access_token)['active']
+
+    response = revoke(access_token)
+
+    assert 200 == response.status_code
+    assert '' == response.content
+    assert {'active': False} == introspect(access_token)
+
+
+def test_should_ignore_unknown_token():
+    response = revoke('invalid-token')
+
+    assert 200 == response.status_code
+
+
+def test_should_require_token():
+    response = requests.post(URL)
+
+    assert 400 == response.status_code
+
+
+def test_should_require_client_authentication():
+    access_token = request_access_token()
+
+    response = requests.post(URL, data={'token': access_token})
+
+    assert 400 == response.status_code
+    assert introspect(access_token)['active']
+
+
+def test_should_reject_unknown_client_and_wrong_secret():
+    assert 401 == revoke('invalid-token', client_id='unknown-client-id').status_code
+    assert 401 == revoke('invalid-token', client_id='service-client-id',
+                         client_secret='wrong-secret').status_code
+    assert 200 == revoke('invalid-token', client_id='service-client-id',
+                         client_secret='service-secret').status_code
+
+
+def test_should_not_revoke_token_of_other_client():
+    access_token = request_access_token()
+
+    response = revoke(access_token, client_id='bob-client-id')
+
+    assert 400 == response.status_code
+    assert 'unauthorized_client' == json.loads(response.content)['error']
+    assert introspect(access_token)['active']
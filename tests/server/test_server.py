@@ -1,9 +1,15 @@
 import logging
+import time
 
 import mock
+import pytest
+import tornado.httpserver
+import tornado.web
 
 import oauth2u
 import oauth2u.server.log
+import oauth2u.tokens
+from oauth2u.server.database import SharedMemoryDataBase, WriteBehindDataBase
 
 def teardown_function(func):
     logging.disable(logging.INFO)
@@ -42,3 +48,211 @@ def test_should_allow_to_application_settings():
 
     assert 'static_path' in server.application_settings
 
+
+def test_should_configure_authorization_code_lifetime_on_database():
+    server = oauth2u.Server(authorization_code_lifetime=30)
+
+    assert 30 == server.database.authorization_code_lifetime
+
+
+def test_should_schedule_database_periodic_tasks(monkeypatch):
+    periodic_callback_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.server.tornado.ioloop, 'PeriodicCallback',
+                        periodic_callback_mock)
+    server = oauth2u.Server()
+
+    server.start_periodic_tasks()
+
+    assert [mock.call(server.database.reap_expired_authorization_codes,
+                      server.database.reap_interval),
+            mock.call(server.database.reap_expired_access_tokens,
+                      server.database.reap_interval),
+            mock.call(server.database.reap_expired_refresh_tokens,
+                      server.database.reap_interval)] == periodic_callback_mock.call_args_list
+    assert 3 == periodic_callback_mock.return_value.start.call_count
+    assert [periodic_callback_mock.return_value] * 3 == server.periodic_callbacks
+
+
+def test_should_refuse_to_start_multiple_processes_with_unsafe_database():
+    server = oauth2u.Server(processes=4)
+
+    with pytest.raises(oauth2u.server.UnsafeDataBase):
+        server.start()
+
+
+def test_should_refuse_to_start_multiple_processes_with_write_behind_database():
+    database = WriteBehindDataBase(SharedMemoryDataBase(capacity=8))
+    server = oauth2u.Server(processes=4, database=database)
+
+    with pytest.raises(oauth2u.server.UnsafeDataBase):
+        server.start()
+
+
+def test_should_bind_sockets_and_start_supervisor_for_multiple_processes(monkeypatch):
+    process_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.server, 'process', process_mock)
+    server = oauth2u.Server(port=8889, processes=4, database=SharedMemoryDataBase(capacity=8))
+
+    server.start()
+
+    process_mock.bind_sockets.assert_called_with(8889)
+    assert process_mock.bind_sockets.return_value == server.sockets
+    process_mock.Supervisor.assert_called_with(4, server.run_worker)
+    assert 1 == process_mock.Supervisor.return_value.start.call_count
+
+
+def test_should_let_each_worker_bind_its_socket_with_reuse_port(monkeypatch):
+    process_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.server, 'process', process_mock)
+    server = oauth2u.Server(port=8889, processes=4, reuse_port=True,
+                            database=SharedMemoryDataBase(capacity=8))
+    monkeypatch.setattr(server, 'start_process', mock.Mock())
+
+    server.start()
+    assert 0 == process_mock.bind_sockets.call_count
+
+    server.run_worker(0)
+    process_mock.bind_sockets.assert_called_with(8889, reuse_port=True)
+    assert 1 == server.start_process.call_count
+
+
+def test_workers_should_discard_tokens_inherited_from_the_parent(monkeypatch):
+    after_fork_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.tokens, 'after_fork', after_fork_mock)
+    server = oauth2u.Server()
+    monkeypatch.setattr(server, 'start_process', mock.Mock())
+
+    server.run_worker(0)
+
+    assert 1 == after_fork_mock.call_count
+
+
+def test_should_disable_autoreload_with_multiple_processes():
+    server = oauth2u.Server(processes=4)
+
+    assert server.application_settings['autoreload'] is False
+
+
+def test_stop_should_stop_accepting_connections_and_stop_ioloop_later(monkeypatch):
+    ioloop_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.server.tornado.ioloop.IOLoop, 'instance',
+                        staticmethod(lambda: ioloop_mock))
+    server = oauth2u.Server(shutdown_timeout=2)
+    server.application = oauth2u.server.Application()
+    server.application.requests_in_flight = 1
+    server.http_server = mock.Mock()
+    periodic_callback = mock.Mock()
+    server.periodic_callbacks = [periodic_callback]
+
+    server.stop()
+
+    assert 1 == server.http_server.stop.call_count
+    assert 1 == periodic_callback.stop.call_count
+    deadline, callback = ioloop_mock.add_timeout.call_args[0]
+    assert ioloop_mock.stop == callback
+    assert 1 < deadline - time.time() <= 2
+    assert 0 == ioloop_mock.stop.call_count
+
+
+def test_stop_should_stop_ioloop_once_running_requests_finish(monkeypatch):
+    ioloop_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.server.tornado.ioloop.IOLoop, 'instance',
+                        staticmethod(lambda: ioloop_mock))
+    server = oauth2u.Server(shutdown_timeout=2)
+    server.application = oauth2u.server.Application(log_function=lambda handler: None)
+    server.application.requests_in_flight = 2
+    server.http_server = mock.Mock()
+
+    server.stop()
+    server.application.log_request(mock.Mock())
+    assert 0 == ioloop_mock.add_callback.call_count
+
+    server.application.log_request(mock.Mock())
+    stop_ioloop, = ioloop_mock.add_callback.call_args[0]
+    stop_ioloop()
+
+    assert 1 == ioloop_mock.stop.call_count
+    ioloop_mock.remove_timeout.assert_called_with(ioloop_mock.add_timeout.return_value)
+
+
+def test_stop_should_stop_ioloop_right_away_without_running_requests(monkeypatch):
+    ioloop_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.server.tornado.ioloop.IOLoop, 'instance',
+                        staticmethod(lambda: ioloop_mock))
+    server = oauth2u.Server(shutdown_timeout=2)
+    server.application = oauth2u.server.Application()
+    server.http_server = mock.Mock()
+
+    server.stop()
+
+    assert 1 == ioloop_mock.stop.call_count
+    ioloop_mock.remove_timeout.assert_called_with(ioloop_mock.add_timeout.return_value)
+
+
+def test_application_should_count_requests_in_flight():
+    counts = []
+
+    class Handler(tornado.web.RequestHandler):
+        def get(self):
+            counts.append(self.application.requests_in_flight)
+
+    application = oauth2u.server.Application([('/', Handler)], log_function=lambda handler: None)
+    application(tornado.httpserver.HTTPRequest('GET', '/', connection=mock.Mock(xheaders=False)))
+
+    assert [1] == counts
+    assert 0 == application.requests_in_flight
+
+
+def test_should_use_production_settings_by_default():
+    settings = oauth2u.Server().application_settings
+
+    assert settings['debug'] is False
+    assert settings['autoreload'] is False
+    assert settings['compiled_template_cache'] is True
+    assert settings['static_hash_cache'] is True
+
+
+def test_should_let_tornado_choose_debug_settings_if_debug():
+    settings = oauth2u.Server(debug=True).application_settings
+
+    assert settings['debug'] is True
+    assert 'autoreload' not in settings
+    assert 'compiled_template_cache' not in settings
+
+
+def test_should_generate_cookie_secret_only_once():
+    server = oauth2u.Server()
+
+    assert 64 == len(server.application_settings['cookie_secret'])
+    assert server.application_settings['cookie_secret'] == server.application_settings['cookie_secret']
+
+
+def test_should_use_given_cookie_secret():
+    server = oauth2u.Server(cookie_secret='my-secret')
+
+    assert 'my-secret' == server.application_settings['cookie_secret']
+
+
+def test_should_warn_if_cookie_secret_is_generated(monkeypatch):
+    log_mock = mock.Mock()
+    monkeypatch.setattr(oauth2u.server, 'log', log_mock)
+
+    oauth2u.Server()
+    assert 1 == log_mock.warn.call_count
+
+    oauth2u.Server(application_settings={'cookie_secret': 'my-secret'})
+    assert 1 == log_mock.warn.call_count
+
+
+def test_public_settings_should_hide_cookie_secret():
+    settings = {'debug': False, 'cookie_secret': 'my-secret'}
+
+    assert {'debug': False, 'cookie_secret': '<hidden>'} == oauth2u.server.public_settings(settings)
+    assert 'my-secret' == settings['cookie_secret']
+
+
+def test_should_create_access_token_signer_if_secret_given():
+    assert oauth2u.Server().access_token_signer is None
+
+    signer = oauth2u.Server(access_token_secret='secret').access_token_signer
+    assert 'client-id' == signer.verify(signer.sign('client-id', 60))['client_id']
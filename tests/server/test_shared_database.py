@@ -0,0 +1,230 @@
+import os
+import time
+
+import pytest
+
+from oauth2u.server.database import (SharedMemoryDataBase, DatabaseFull,
+                                     RedeemResult)
+from oauth2u.server.database.shared import EMPTY
+
+
+@pytest.fixture
+def database():
+    database = SharedMemoryDataBase(capacity=8)
+    database.save_new_client('client-id', 'http://example.com/callback')
+    return database
+
+
+def test_should_save_and_retrieve_client_authorization_code(database):
+    database.save_new_authorization_code('auth-code', 'client-id', 'my-state',
+                                         'http://example.com/return')
+
+    record = database.find_authorization_code('client-id', 'auth-code')
+    assert 'auth-code' == record.code
+    assert 'my-state' == record.state
+    assert 'http://example.com/return' == record.redirect_uri
+    assert not record.used
+    assert 1 == database.client_authorization_codes_count('client-id')
+    assert not database.client_has_authorization_code('other-client-id', 'auth-code')
+    assert not database.client_has_authorization_code('client-id', 'other-code')
+
+
+def test_should_keep_None_state(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None,
+                                         'http://example.com/return')
+
+    assert database.get_state('client-id', 'auth-code') is None
+
+
+def test_should_mark_client_authorization_code_as_used(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None,
+                                         'http://example.com/return')
+    database.mark_client_authorization_code_as_used('client-id', 'auth-code')
+
+    assert database.is_client_authorization_code_used('client-id', 'auth-code')
+
+
+def test_redeem_authorization_code_should_consume_code_once(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None,
+                                         'http://example.com/return')
+
+    assert RedeemResult.REDEEMED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com/return', authenticating_code='auth-code')
+    assert RedeemResult.ALREADY_USED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com/return')
+
+
+def test_redeem_authorization_code_should_validate_client_and_code(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None,
+                                         'http://example.com/return')
+
+    assert RedeemResult.INVALID_CLIENT == database.redeem_authorization_code(
+        'no-client-id', 'auth-code', 'http://example.com/return')
+    assert RedeemResult.INVALID_CLIENT == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com/return', authenticating_code='invalid')
+    assert RedeemResult.INVALID_CODE == database.redeem_authorization_code(
+        'client-id', 'invalid', 'http://example.com/return')
+    assert RedeemResult.REDIRECT_URI_MISMATCH == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://other.com')
+
+
+def test_should_save_and_find_access_tokens_apart_from_codes(database):
+    database.save_new_authorization_code('code', 'client-id', None, 'http://example.com')
+    database.save_access_token('code', 'client-id', time.time() + 60, scope='read')
+
+    record = database.find_access_token('code')
+    assert ('code', 'client-id', 'read') == (record.token, record.client_id, record.scope)
+    assert database.find_access_token('invalid') is None
+    assert 1 == database.client_authorization_codes_count('client-id')
+    assert database.find_authorization_code('client-id', 'code').redirect_uri == 'http://example.com'
+
+
+def test_should_not_find_expired_access_token(database):
+    database.save_access_token('access-token', 'client-id', time.time() - 1)
+
+    assert database.find_access_token('access-token') is None
+
+
+def test_revoke_access_token_should_forget_token_until_it_expires(database):
+    signed_token = 'x' * 200
+    database.save_access_token('access-token', 'client-id', time.time() + 60)
+    database.revoke_access_token('access-token', time.time() + 60)
+    database.revoke_access_token(signed_token, time.time() + 60)
+    database.revoke_access_token('expired', time.time() - 1)
+
+    assert database.find_access_token('access-token') is None
+    assert database.is_access_token_revoked('access-token')
+    assert database.is_access_token_revoked(signed_token)
+    assert not database.is_access_token_revoked('expired')
+    assert sorted(['access-token', signed_token]) == sorted(database.revoked_access_tokens())
+
+
+def test_revoked_access_tokens_should_only_read_revocation_slots(database):
+    database.save_access_token('access-token', 'client-id', time.time() + 60)
+    database.revoke_access_token('access-token', time.time() + 60)
+    read = []
+    read_header = database.read_header
+    database.read_header = lambda index: read.append(index) or read_header(index)
+
+    assert ['access-token'] == list(database.revoked_access_tokens())
+    assert list(database.revocations.indexes()) == read
+
+
+def test_consume_refresh_token_should_return_token_only_once(database):
+    database.save_refresh_token('token-hash', 'client-id', time.time() + 60)
+
+    assert database.consume_refresh_token('token-hash', 'other-client-id') is None
+    assert 'client-id' == database.consume_refresh_token('token-hash', 'client-id').client_id
+    assert database.consume_refresh_token('token-hash', 'client-id') is None
+    assert 0 == database.client_authorization_codes_count('client-id')
+
+
+def test_tokens_should_not_take_the_room_of_codes():
+    database = SharedMemoryDataBase(capacity=4, token_capacity=4)
+    for i in range(4):
+        database.save_access_token('token-%d' % i, 'client-id', time.time() + 60)
+
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+    assert database.find_access_token('token-0') is not None
+    with pytest.raises(DatabaseFull):
+        database.save_access_token('one-more', 'client-id', time.time() + 60)
+
+
+def test_should_not_redeem_code_without_room_for_tokens():
+    database = SharedMemoryDataBase(capacity=8, token_capacity=10)
+    database.save_new_client('client-id', 'http://example.com')
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+    for i in range(9):
+        database.save_access_token('token-%d' % i, 'client-id', time.time() + 60)
+
+    with pytest.raises(DatabaseFull):
+        database.redeem_authorization_code('client-id', 'auth-code', 'http://example.com')
+    assert not database.is_client_authorization_code_used('client-id', 'auth-code')
+
+    database.reap_expired_authorization_codes(now=time.time() + 61, limit=18)
+    assert RedeemResult.REDEEMED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com')
+
+
+def test_should_raise_DatabaseFull_if_no_free_slots(database):
+    for i in range(8):
+        database.save_new_authorization_code('code-%d' % i, 'client-id', None, 'http://example.com')
+
+    with pytest.raises(DatabaseFull):
+        database.save_new_authorization_code('one-more', 'client-id', None, 'http://example.com')
+
+
+def test_lookup_misses_should_read_at_most_max_probes_slots_after_churn():
+    database = SharedMemoryDataBase(capacity=256, token_capacity=256, revocation_capacity=256,
+                                    max_probes=16)
+    for i in range(2000):
+        if i % 100 == 0:
+            database.reap_expired_authorization_codes(now=time.time() + 600, limit=768)
+        database.save_new_authorization_code('code-%d' % i, 'client-id', None, 'http://example.com')
+    assert EMPTY not in [database.read_header(index)[0] for index in range(256)]
+    probed = []
+    probe = database.probe
+    database.probe = lambda region, key: (probed.append(index) or index
+                                          for index in probe(region, key))
+
+    assert database.find_authorization_code('client-id', 'unknown-code') is None
+    assert len(probed) <= 16
+
+
+def test_should_raise_DatabaseFull_when_probed_slots_are_in_use():
+    database = SharedMemoryDataBase(capacity=64, max_probes=4)
+
+    with pytest.raises(DatabaseFull):
+        for i in range(64):
+            database.save_new_authorization_code('code-%d' % i, 'client-id', None, 'http://example.com')
+
+
+def test_should_reuse_slots_of_expired_codes(database):
+    database.authorization_code_lifetime = -1
+    for i in range(8):
+        database.save_new_authorization_code('code-%d' % i, 'client-id', None, 'http://example.com')
+    database.authorization_code_lifetime = 60
+
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    assert database.client_has_authorization_code('client-id', 'auth-code')
+    assert not database.client_has_authorization_code('client-id', 'code-0')
+    assert 1 == database.client_authorization_codes_count('client-id')
+
+
+def test_reap_expired_authorization_codes_should_look_at_limit_slots(database):
+    database.authorization_code_lifetime = 60
+    for i in range(8):
+        database.save_new_authorization_code('code-%d' % i, 'client-id', None, 'http://example.com')
+
+    later = time.time() + 61
+    assert 3 == database.reap_expired_authorization_codes(now=later, limit=3)
+    assert 5 == database.reap_expired_authorization_codes(now=later, limit=8)
+
+
+def test_codes_should_be_shared_with_forked_processes(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    pid = os.fork()
+    if pid == 0:
+        result = database.redeem_authorization_code('client-id', 'auth-code', 'http://example.com')
+        database.save_new_authorization_code('child-code', 'client-id', None, 'http://example.com')
+        os._exit(0 if result == RedeemResult.REDEEMED else 1)
+
+    assert (pid, 0) == os.waitpid(pid, 0)
+    assert database.is_client_authorization_code_used('client-id', 'auth-code')
+    assert database.client_has_authorization_code('client-id', 'child-code')
+
+
+def test_should_open_existing_file(tmpdir):
+    filename = str(tmpdir.join('codes'))
+    database = SharedMemoryDataBase(filename, capacity=8)
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+    database.close()
+
+    database = SharedMemoryDataBase(filename, capacity=8)
+    assert database.client_has_authorization_code('client-id', 'auth-code')
+
+
+def test_should_be_multiprocess_safe(database):
+    assert database.multiprocess_safe
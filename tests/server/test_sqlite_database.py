@@ -0,0 +1,175 @@
+import sqlite3
+import time
+
+import pytest
+
+from oauth2u.server.database import SQLiteDataBase, RedeemResult, verify_client_secret
+
+
+@pytest.fixture
+def database(tmpdir):
+    database = SQLiteDataBase(str(tmpdir.join('oauth2u.db')))
+    database.save_new_client('client-id', 'http://example.com/callback')
+    return database
+
+
+def test_should_use_wal_journal_mode(database):
+    mode = database.connection.execute('PRAGMA journal_mode').fetchone()[0]
+    assert 'wal' == mode
+
+
+def test_find_client_return_None_if_no_client_id_found(database):
+    assert database.find_client('no-client-id') is None
+
+
+def test_should_save_and_retrieve_client_id(database):
+    client = database.find_client('client-id')
+    assert 'http://example.com/callback' == client['default_redirect_uri']
+
+
+def test_all_clients_should_list_every_client(database):
+    database.save_new_client('service-client-id', None, client_secret='secret')
+
+    clients = dict(database.all_clients())
+    assert ['client-id', 'service-client-id'] == sorted(clients)
+    assert clients['service-client-id'] == database.find_client('service-client-id')
+
+
+def test_should_save_and_retrieve_client_authorization_code(database):
+    database.save_new_authorization_code('auth-code', 'client-id', 'my-state',
+                                         'http://example.com/return')
+
+    assert 1 == database.client_authorization_codes_count('client-id')
+    assert database.client_has_authorization_code('client-id', 'auth-code')
+    assert not database.client_has_authorization_code('other-client-id', 'auth-code')
+    assert not database.is_client_authorization_code_used('client-id', 'auth-code')
+    assert 'my-state' == database.get_state('client-id', 'auth-code')
+    assert 'http://example.com/return' == database.get_redirect_uri('client-id', 'auth-code')
+
+
+def test_should_mark_client_authorization_code_as_used(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None,
+                                         'http://example.com/return')
+    database.mark_client_authorization_code_as_used('client-id', 'auth-code')
+
+    assert database.is_client_authorization_code_used('client-id', 'auth-code')
+
+
+def test_redeem_authorization_code_should_consume_code_once(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None,
+                                         'http://example.com/return')
+
+    assert RedeemResult.REDEEMED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com/return', authenticating_code='auth-code')
+    assert RedeemResult.ALREADY_USED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com/return')
+
+
+def test_redeem_authorization_code_should_validate_client_and_code(database):
+    database.save_new_authorization_code('auth-code', 'client-id', None,
+                                         'http://example.com/return')
+
+    assert RedeemResult.INVALID_CLIENT == database.redeem_authorization_code(
+        'no-client-id', 'auth-code', 'http://example.com/return')
+    assert RedeemResult.INVALID_CLIENT == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com/return', authenticating_code='invalid')
+    assert RedeemResult.INVALID_CODE == database.redeem_authorization_code(
+        'client-id', 'invalid', 'http://example.com/return')
+    assert RedeemResult.REDIRECT_URI_MISMATCH == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://other.com')
+
+
+def test_reap_expired_authorization_codes_should_remove_at_most_limit_codes(database):
+    database.authorization_code_lifetime = 60
+    for i in range(3):
+        database.save_new_authorization_code('code-%d' % i, 'client-id', None,
+                                             'http://example.com/return')
+
+    later = time.time() + 61
+    assert 2 == database.reap_expired_authorization_codes(now=later, limit=2)
+    assert 1 == database.reap_expired_authorization_codes(now=later, limit=2)
+
+
+def test_should_commit_writes_in_batches(tmpdir):
+    filename = str(tmpdir.join('oauth2u.db'))
+    database = SQLiteDataBase(filename, commit_batch_size=2)
+
+    database.save_new_client('client-id', None)
+    assert SQLiteDataBase(filename).find_client('client-id') is None
+
+    database.save_new_client('other-client-id', None)
+    assert SQLiteDataBase(filename).find_client('client-id') is not None
+
+
+def test_flush_should_commit_pending_writes(tmpdir):
+    filename = str(tmpdir.join('oauth2u.db'))
+    database = SQLiteDataBase(filename)
+
+    database.save_new_client('client-id', None)
+    database.flush()
+
+    assert SQLiteDataBase(filename).find_client('client-id') is not None
+
+
+def test_periodic_tasks_should_reap_codes_and_flush_writes(database):
+    assert [(database.reap_expired_authorization_codes, database.reap_interval),
+            (database.reap_expired_access_tokens, database.reap_interval),
+            (database.reap_expired_refresh_tokens, database.reap_interval),
+            (database.flush, database.commit_interval)] == database.periodic_tasks()
+
+
+def test_should_save_find_and_reap_access_tokens(database):
+    now = time.time()
+    database.save_access_token('access-token', 'client-id', now + 60, scope='read')
+    database.save_access_token('expired', 'client-id', now - 1)
+
+    record = database.find_access_token('access-token')
+    assert ('client-id', 'read') == (record.client_id, record.scope)
+    assert database.find_access_token('expired') is None
+    assert 1 == database.reap_expired_access_tokens(now=now)
+
+
+def test_revoke_access_token_should_forget_token_until_it_expires(database):
+    now = time.time()
+    database.save_access_token('access-token', 'client-id', now + 60)
+    database.revoke_access_token('access-token', now + 60)
+    database.revoke_access_token('signed-token', now - 1)
+
+    assert database.find_access_token('access-token') is None
+    assert database.is_access_token_revoked('access-token')
+    assert not database.is_access_token_revoked('signed-token')
+    assert ['access-token'] == database.revoked_access_tokens()
+    assert 1 == database.reap_expired_access_tokens(now=now)
+
+
+def test_consume_refresh_token_should_return_token_only_once(database):
+    now = time.time()
+    database.save_refresh_token('token-hash', 'client-id', now + 60)
+    database.save_refresh_token('expired', 'client-id', now - 1)
+
+    assert database.consume_refresh_token('token-hash', 'other-client-id') is None
+    assert 'client-id' == database.consume_refresh_token('token-hash', 'client-id').client_id
+    assert database.consume_refresh_token('token-hash', 'client-id') is None
+    assert database.consume_refresh_token('expired', 'client-id') is None
+    assert 1 == database.reap_expired_refresh_tokens(now=now)
+
+
+def test_should_save_client_secret_hash(database):
+    database.save_new_client('service-client-id', None, client_secret='secret')
+
+    client = database.find_client('service-client-id')
+    assert verify_client_secret(client, 'secret')
+    assert 'secret_hash' not in database.find_client('client-id')
+
+
+def test_should_add_client_secret_column_to_existing_files(tmpdir):
+    filename = str(tmpdir.join('old.db'))
+    connection = sqlite3.connect(filename)
+    connection.execute('CREATE TABLE clients (client_id TEXT PRIMARY KEY, default_redirect_uri TEXT)')
+    connection.execute("INSERT INTO clients VALUES ('client-id', 'http://example.com')")
+    connection.commit()
+    connection.close()
+
+    database = SQLiteDataBase(filename)
+
+    assert {'default_redirect_uri': 'http://example.com'} == database.find_client('client-id')
@@ -1,5 +1,14 @@
+import os
 import re
-from oauth2u.tokens import generate_authorization_code, generate_access_token
+import time
+
+import mock
+import pytest
+
+from oauth2u import tokens
+from oauth2u.tokens import (generate_authorization_code, generate_access_token,
+                            AccessTokenSigner, TokenPool,
+                            urlsafe_b64encode, urlsafe_b64decode)
 
 
 def test_authorization_code_should_be_alphanumeric_code_greater_than_19_chars():
@@ -9,3 +18,119 @@ def test_authorization_code_should_be_alphanumeric_code_greater_than_19_chars():
 def test_access_token_should_be_alphanumeric_code_greater_than_19_chars():
     code = generate_access_token()
     assert re.match(r'[a-zA-Z0-9]{20,}', code)
+
+
+def test_generated_tokens_should_be_unique():
+    codes = set(generate_authorization_code() for i in range(5000))
+    assert 5000 == len(codes)
+
+
+def test_token_pool_should_generate_hex_tokens_with_given_length():
+    pool = TokenPool(size=10, length=40)
+    generated = [pool.take() for i in range(25)]
+
+    assert all(re.match(r'^[a-f0-9]{40}$', token) for token in generated)
+    assert 25 == len(set(generated))
+
+
+def test_token_pool_should_generate_base64_tokens_with_given_length():
+    pool = TokenPool(size=10, length=22, encoding='base64')
+    generated = [pool.take() for i in range(25)]
+
+    assert all(re.match(r'^[a-zA-Z0-9_-]{22}$', token) for token in generated)
+
+
+def test_token_pool_should_refuse_unknown_encodings():
+    with pytest.raises(ValueError):
+        TokenPool(encoding='rot13')
+
+
+def test_token_pool_should_read_entropy_for_whole_pool_at_once(monkeypatch):
+    urandom_mock = mock.Mock(wraps=os.urandom)
+    monkeypatch.setattr(tokens.os, 'urandom', urandom_mock)
+    pool = TokenPool(size=100, low_water=0)
+
+    for i in range(100):
+        pool.take()
+
+    assert 1 == urandom_mock.call_count
+
+
+def test_token_pool_should_schedule_refill_below_low_water(monkeypatch):
+    ioloop_mock = mock.Mock()
+    monkeypatch.setattr(tokens.tornado.ioloop, 'IOLoop', ioloop_mock)
+    pool = TokenPool(size=8, low_water=4)
+
+    for i in range(5):
+        pool.take()
+
+    ioloop_mock.current.return_value.add_callback.assert_called_once_with(pool.refill)
+    pool.refill()
+    assert 8 == len(pool.tokens)
+
+
+def test_token_pool_should_discard_tokens_after_fork():
+    pool = TokenPool(size=8)
+    inherited = [pool.take()] + pool.tokens
+
+    tokens.after_fork()
+    assert [] == pool.tokens
+
+    assert not set(inherited) & set([pool.take()] + pool.tokens)
+    assert 7 == len(pool.tokens)
+
+
+def test_signed_access_token_should_be_verified_with_same_secret():
+    signer = AccessTokenSigner('secret')
+    token = signer.sign('client-id', 3600, scope='read write')
+
+    assert re.match(r'^[a-zA-Z0-9_-]+\.[a-zA-Z0-9_-]+$', token)
+    info = signer.verify(token)
+    assert 'client-id' == info['client_id']
+    assert 'read write' == info['scope']
+    assert 3599 <= info['exp'] - time.time() <= 3600
+
+
+def test_signed_access_tokens_should_be_unique():
+    signer = AccessTokenSigner('secret')
+    assert signer.sign('client-id', 3600) != signer.sign('client-id', 3600)
+
+
+def test_signed_access_token_should_keep_client_id_with_separators():
+    signer = AccessTokenSigner('secret')
+    info = signer.verify(signer.sign('client|id', 3600))
+
+    assert 'client|id' == info['client_id']
+    assert info['scope'] is None
+
+
+def test_signed_access_token_should_not_be_verified_with_other_secret():
+    token = AccessTokenSigner('secret').sign('client-id', 3600)
+
+    assert AccessTokenSigner('other-secret').verify(token) is None
+
+
+def test_signed_access_token_should_not_be_verified_if_tampered():
+    signer = AccessTokenSigner('secret')
+    token = signer.sign('client-id', 3600)
+    payload, signature = token.split('.')
+    forged = urlsafe_b64encode(urlsafe_b64decode(payload).replace('client-id', 'admin-id'))
+
+    assert signer.verify('{0}.{1}'.format(forged, signature)) is None
+    assert signer.verify('not-a-token') is None
+    assert signer.verify(u'n\xe3o-\xe9-token') is None
+
+
+def test_signed_access_token_should_not_be_verified_after_expiration():
+    signer = AccessTokenSigner('secret')
+    token = signer.sign('client-id', 60)
+
+    assert signer.verify(token, now=time.time() + 61) is None
+
+
+def test_hash_token_should_be_urlsafe_and_deterministic():
+    token_hash = tokens.hash_token(u'refresh-token')
+
+    assert token_hash == tokens.hash_token('refresh-token')
+    assert 'refresh-token' not in token_hash
+    assert re.match(r'^[A-Za-z0-9_-]{43}$', token_hash)
@@ -0,0 +1,223 @@
+import time
+
+import mock
+import pytest
+
+from oauth2u.server.database import (DatabaseFull, MemoryDataBase, RedeemResult,
+                                     WriteBehindDataBase, writebehind,
+                                     verify_client_secret)
+
+
+def create_database(**kwargs):
+    backend = MemoryDataBase()
+    database = WriteBehindDataBase(backend, **kwargs)
+    database.save_new_client('client-id', 'http://example.com')
+    return backend, database
+
+
+def test_writes_should_not_reach_wrapped_database_before_flush():
+    backend, database = create_database()
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    assert backend.find_client('client-id') is None
+    assert not backend.client_has_authorization_code('client-id', 'auth-code')
+
+
+def test_reads_should_see_pending_writes():
+    backend, database = create_database()
+    database.save_new_authorization_code('auth-code', 'client-id', 'my-state', 'http://example.com')
+
+    assert 'http://example.com' == database.find_client('client-id')['default_redirect_uri']
+    assert database.client_has_authorization_code('client-id', 'auth-code')
+    assert 'my-state' == database.get_state('client-id', 'auth-code')
+    assert not database.client_has_authorization_code('other-client-id', 'auth-code')
+
+
+def test_flush_should_send_pending_writes_to_wrapped_database():
+    backend, database = create_database()
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+    database.mark_client_authorization_code_as_used('client-id', 'auth-code')
+
+    assert 3 == database.flush()
+    assert backend.is_client_authorization_code_used('client-id', 'auth-code')
+    assert {} == database.pending_codes
+    assert set() == database.pending_used_codes
+
+
+def test_flush_should_send_at_most_flush_batch_size_writes():
+    backend, database = create_database(flush_batch_size=2)
+    database.flush()
+    for i in range(3):
+        database.save_new_authorization_code('code-%d' % i, 'client-id', None, 'http://example.com')
+
+    assert 2 == database.flush()
+    assert 1 == len(database.pending_writes)
+    assert database.client_has_authorization_code('client-id', 'code-2')
+
+
+def test_should_call_flush_on_wrapped_database_if_available():
+    backend = mock.Mock()
+    database = WriteBehindDataBase(backend)
+    database.save_new_client('client-id', None)
+    database.flush()
+
+    backend.save_new_client.assert_called_with('client-id', None)
+    assert 1 == backend.flush.call_count
+
+
+def test_should_schedule_flush_when_queue_reaches_flush_batch_size(monkeypatch):
+    ioloop_mock = mock.Mock()
+    monkeypatch.setattr(writebehind.tornado.ioloop, 'IOLoop', ioloop_mock)
+    backend, database = create_database(flush_batch_size=2)
+    database.save_new_client('other-client-id', None)
+    database.save_new_client('another-client-id', None)
+
+    ioloop_mock.current.return_value.add_callback.assert_called_once_with(database.flush)
+
+
+def test_should_flush_a_batch_when_queue_is_full():
+    backend, database = create_database(max_pending_writes=2, flush_batch_size=1)
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+    database.save_new_authorization_code('other-code', 'client-id', None, 'http://example.com')
+
+    assert 2 == len(database.pending_writes)
+    assert backend.find_client('client-id') is not None
+    assert not backend.client_has_authorization_code('client-id', 'auth-code')
+
+
+def test_should_raise_DatabaseFull_when_queue_is_full_and_flush_fails():
+    backend, database = create_database(max_pending_writes=2, flush_batch_size=1)
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    with mock.patch.object(backend, 'save_new_client', side_effect=IOError('disk full')):
+        with pytest.raises(DatabaseFull):
+            database.save_new_authorization_code('other-code', 'client-id', None, 'http://example.com')
+
+    assert not database.client_has_authorization_code('client-id', 'other-code')
+    assert 2 == len(database.pending_writes)
+
+
+def test_failed_write_should_stay_queued_until_it_succeeds():
+    backend, database = create_database()
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    with mock.patch.object(backend, 'save_new_authorization_code', side_effect=IOError('locked')):
+        assert 1 == database.flush()
+        database.flush_all()
+
+    assert 1 == len(database.pending_writes)
+    assert database.client_has_authorization_code('client-id', 'auth-code')
+    assert 1 == database.flush()
+    assert backend.client_has_authorization_code('client-id', 'auth-code')
+    assert {} == database.pending_codes
+
+
+def test_write_failing_max_write_failures_times_should_be_dropped():
+    backend, database = create_database(max_write_failures=2)
+    database.flush()
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+    database.save_new_authorization_code('other-code', 'client-id', None, 'http://example.com')
+
+    with mock.patch.object(backend, 'save_new_authorization_code',
+                           side_effect=[IOError('bad'), IOError('bad'), None]):
+        assert 0 == database.flush()
+        assert 2 == database.flush()
+
+    assert [('save_new_authorization_code', ('auth-code', 'client-id', None, 'http://example.com'))] == \
+        list(database.dead_letters)
+    assert not database.pending_writes
+    assert not database.client_has_authorization_code('client-id', 'auth-code')
+
+
+def test_redeem_authorization_code_should_consume_pending_code_once():
+    backend, database = create_database()
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+
+    assert RedeemResult.REDEEMED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com', authenticating_code='auth-code')
+    assert RedeemResult.ALREADY_USED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com')
+
+    database.flush()
+    assert RedeemResult.ALREADY_USED == database.redeem_authorization_code(
+        'client-id', 'auth-code', 'http://example.com')
+
+
+def test_should_keep_used_mark_until_it_is_flushed():
+    backend, database = create_database(flush_batch_size=2)
+    database.save_new_authorization_code('auth-code', 'client-id', None, 'http://example.com')
+    database.mark_client_authorization_code_as_used('client-id', 'auth-code')
+
+    database.flush()
+    assert not backend.is_client_authorization_code_used('client-id', 'auth-code')
+    assert database.is_client_authorization_code_used('client-id', 'auth-code')
+
+
+def test_should_set_authorization_code_lifetime_on_wrapped_database():
+    backend, database = create_database()
+    database.authorization_code_lifetime = 30
+
+    assert 30 == backend.authorization_code_lifetime
+
+
+def test_periodic_tasks_should_include_wrapped_database_tasks_and_flush():
+    backend, database = create_database(flush_interval=10)
+
+    assert backend.periodic_tasks() + [(database.flush, 10)] == database.periodic_tasks()
+
+
+def test_pending_access_tokens_should_be_found_before_flush():
+    backend, database = create_database()
+    database.save_access_token('access-token', 'client-id', time.time() + 60)
+
+    assert backend.find_access_token('access-token') is None
+    assert 'client-id' == database.find_access_token('access-token').client_id
+
+    database.flush_all()
+    assert not database.pending_access_tokens
+    assert 'client-id' == backend.find_access_token('access-token').client_id
+
+
+def test_pending_revocations_should_be_seen_before_flush():
+    backend, database = create_database()
+    database.save_access_token('access-token', 'client-id', time.time() + 60)
+    database.revoke_access_token('access-token', time.time() + 60)
+
+    assert database.find_access_token('access-token') is None
+    assert database.is_access_token_revoked('access-token')
+    assert ['access-token'] == database.revoked_access_tokens()
+
+    database.flush_all()
+    assert backend.is_access_token_revoked('access-token')
+    assert backend.find_access_token('access-token') is None
+    assert ['access-token'] == database.revoked_access_tokens()
+
+
+def test_pending_refresh_token_should_be_consumed_only_once():
+    backend, database = create_database()
+    database.save_refresh_token('token-hash', 'client-id', time.time() + 60)
+
+    assert database.consume_refresh_token('token-hash', 'client-id')
+    assert database.consume_refresh_token('token-hash', 'client-id') is None
+    database.flush_all()
+    assert database.consume_refresh_token('token-hash', 'client-id') is None
+    assert not backend.refresh_tokens
+
+
+def test_pending_client_should_keep_client_secret_hash():
+    backend, database = create_database()
+    database.save_new_client('service-client-id', None, client_secret='secret')
+
+    assert verify_client_secret(database.find_client('service-client-id'), 'secret')
+    database.flush_all()
+    assert verify_client_secret(backend.find_client('service-client-id'), 'secret')
+
+
+def test_should_notify_client_listeners_before_flush():
+    backend, database = create_database()
+    listener = mock.Mock()
+    database.add_client_listener(listener)
+
+    database.save_new_client('client-id', None, client_secret='secret')
+
+    listener.assert_called_once_with('client-id')
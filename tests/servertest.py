@@ -54,10 +54,13 @@ if __name__ == '__main__':
     for client in default_clients:
       database.save_new_client(client, 'http://example.com')
 
+    database.save_new_client('service-client-id', None, client_secret='service-secret')
+
     server = oauth2u.server.Server(port=8888,
                                    plugins_directories=[plugins],
                                    handlers_directories=[handlers],
                                    log_config={'filename': logfile},
-                                   database = database)
+                                   database = database,
+                                   refresh_token_lifetime=3600)
     print 'Listening on 8888'
     server.start()